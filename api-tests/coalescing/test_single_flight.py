@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+import pytest
+from api.coalescing.singleFlight import SingleFlight
+
+
+class SlowUpstream:
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, value):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return {'value': value}
+
+
+def test_concurrent_identical_calls_share_one_request(tmpdir):
+    single_flight = SingleFlight(str(tmpdir))
+    upstream = SlowUpstream()
+    with ThreadPoolExecutor(10) as executor:
+        results = list(executor.map(
+            lambda _: single_flight.call('route', {'id': 1}, upstream, 1), range(10)))
+    assert upstream.calls == 1
+    assert all(result == {'value': 1} for result in results)
+    stats = single_flight.get_stats()
+    assert stats['calls'] == 10
+    assert stats['executed'] == 1
+    assert stats['shared_in_process'] == 9
+
+
+def test_different_arguments_and_later_calls_are_not_shared(tmpdir):
+    single_flight = SingleFlight(str(tmpdir))
+    upstream = SlowUpstream(0)
+    single_flight.call('route', {'id': 1}, upstream, 1)
+    single_flight.call('route', {'id': 1}, upstream, 1)
+    single_flight.call('route', {'id': 2}, upstream, 2)
+    single_flight.call('other route', {'id': 2}, upstream, 2)
+    assert upstream.calls == 4
+
+
+def test_waiting_threads_get_the_error(tmpdir):
+    single_flight = SingleFlight(str(tmpdir))
+
+    def failing_upstream():
+        time.sleep(0.2)
+        raise ValueError("upstream failed")
+
+    def call():
+        with pytest.raises(ValueError):
+            single_flight.call('route', [], failing_upstream)
+
+    with ThreadPoolExecutor(3) as executor:
+        for future in [executor.submit(call) for _ in range(3)]:
+            future.result()
+    """Nothing is left in flight"""
+    upstream = SlowUpstream(0)
+    assert single_flight.call('route', [], upstream, 1) == {'value': 1}
+
+
+def test_workers_share_results_through_the_directory(tmpdir):
+    """Two instances on one directory behave like two uwsgi workers"""
+    workers = [SingleFlight(str(tmpdir)), SingleFlight(str(tmpdir))]
+    upstream = SlowUpstream()
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(workers[0].call, 'route', [1], upstream, 1)
+        time.sleep(0.05)
+        follower = executor.submit(workers[1].call, 'route', [1], upstream, 1)
+        assert leader.result() == follower.result() == {'value': 1}
+    assert upstream.calls == 1
+    assert workers[1].get_stats()['shared_across_workers'] == 1
+
+
+def test_async_calls_share_one_request():
+    single_flight = SingleFlight(None)
+    calls = []
+
+    async def upstream(value):
+        calls.append(value)
+        await asyncio.sleep(0.05)
+        return value
+
+    async def run():
+        return await asyncio.gather(*[
+            single_flight.call_async('route', [1], upstream, 1) for _ in range(5)])
+
+    assert asyncio.get_event_loop().run_until_complete(run()) == [1] * 5
+    assert calls == [1]
+    assert single_flight.get_stats()['shared_in_process'] == 4
+
+
+def test_cancelling_the_first_caller_does_not_strand_the_others():
+    single_flight = SingleFlight(None)
+
+    async def upstream(value):
+        await asyncio.sleep(0.05)
+        return value
+
+    async def run():
+        leader = asyncio.ensure_future(
+            single_flight.call_async('route', [2], upstream, 2))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(
+            single_flight.call_async('route', [2], upstream, 2))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await asyncio.wait_for(follower, 1)
+
+    assert asyncio.get_event_loop().run_until_complete(run()) == 2
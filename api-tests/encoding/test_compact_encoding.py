@@ -0,0 +1,49 @@
+import json
+import api.encoding.compactEncoding as compactEncoding
+
+FOLLOWERS = {'1': ['2', '3'], '2': ['1'], '4': ['1', '2', '3']}
+TWEET_DATA = {'response': {
+    'tweet_info': {'id_str': '10', 'text': 'tweet', 'user': {'id_str': '1'}},
+    'retweeter_ids': ['2', '3'],
+    'retweet_info': {
+        '2': {'id_str': '11', 'lang': 'en', 'in_reply_to_status_id_str': None,
+              'user': {'id_str': '2', 'name': 'two'}},
+        '3': {'id_str': '12', 'lang': 'de', 'in_reply_to_status_id_str': None,
+              'user': {'id_str': '3', 'name': 'three'}}
+    }
+}}
+
+
+def test_followers_round_trip():
+    payload = compactEncoding.encode_followers(FOLLOWERS)
+    assert compactEncoding.decode_followers(payload) == FOLLOWERS
+
+
+def test_followers_send_every_uid_once():
+    uids = [str(10 ** 17 + index) for index in range(50)]
+    followers = {uid: [follower for follower in uids if follower != uid]
+                 for uid in uids}
+    payload = compactEncoding.encode_followers(followers)
+    assert compactEncoding.decode_followers(payload) == followers
+    assert len(payload) * 3 < len(json.dumps(followers))
+
+
+def test_empty_followers_round_trip():
+    payload = compactEncoding.encode_followers({})
+    assert compactEncoding.decode_followers(payload) == {}
+
+
+def test_tweet_data_round_trip():
+    payload = compactEncoding.encode_tweet_data(TWEET_DATA)
+    assert compactEncoding.decode_tweet_data(payload) == TWEET_DATA
+    empty = compactEncoding.encode_tweet_data({'response': []})
+    assert compactEncoding.decode_tweet_data(empty) == {'response': []}
+
+
+def test_tweet_data_with_retweeters_beyond_the_retweets_round_trip():
+    tweet_data = dict(TWEET_DATA, enumeration={
+        'pages': 2, 'rate_limit_units': {'statuses/retweets': 1}, 'complete': True})
+    tweet_data['response'] = dict(TWEET_DATA['response'],
+                                  retweeter_ids=['2', '3', '4', '5'])
+    payload = compactEncoding.encode_tweet_data(tweet_data)
+    assert compactEncoding.decode_tweet_data(payload) == tweet_data
@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import api.logging.logger as logger
+from api.logging.logger import LogWriter
+
+
+def read_lines(path):
+    with open(path) as log_file:
+        return [json.loads(line) for line in log_file]
+
+
+def test_lines_are_written_in_batches_per_file(tmpdir):
+    writer = LogWriter(str(tmpdir))
+    assert writer.enqueue('clicks', ['{"a": 1}\n', '{"a": 2}\n']) == 2
+    assert writer.enqueue('views', ['{"b": 1}\n']) == 1
+    """Nothing touches the disk in the request"""
+    assert not os.path.exists(str(tmpdir.join('clicks.jsonl')))
+    writer.flush()
+    assert read_lines(str(tmpdir.join('clicks.jsonl'))) == [{'a': 1}, {'a': 2}]
+    assert read_lines(str(tmpdir.join('views.jsonl'))) == [{'b': 1}]
+    stats = writer.get_stats()
+    assert stats['flushed'] == 3
+    assert stats['batches'] == 2
+    assert stats['buffered'] == 0
+
+
+def test_full_buffer_drops_new_lines(tmpdir):
+    writer = LogWriter(str(tmpdir), max_buffered=3)
+    assert writer.enqueue('clicks', ['{}\n'] * 2) == 2
+    assert writer.enqueue('clicks', ['{}\n'] * 2) == 1
+    assert writer.enqueue('clicks', ['{}\n']) == 0
+    assert writer.get_stats()['dropped'] == 2
+    writer.flush()
+    assert writer.enqueue('clicks', ['{}\n']) == 1
+
+
+def test_files_are_rotated_by_size(tmpdir):
+    writer = LogWriter(str(tmpdir), max_file_size=10, backup_count=2)
+    for batch in range(4):
+        writer.enqueue('clicks', ['{"batch": %s}\n' % batch])
+        writer.flush()
+    assert read_lines(str(tmpdir.join('clicks.jsonl'))) == [{'batch': 3}]
+    assert read_lines(str(tmpdir.join('clicks.jsonl.1'))) == [{'batch': 2}]
+    assert read_lines(str(tmpdir.join('clicks.jsonl.2'))) == [{'batch': 1}]
+    assert not os.path.exists(str(tmpdir.join('clicks.jsonl.3')))
+    assert writer.get_stats()['rotations'] == 3
+
+
+def test_writers_do_not_interleave_lines(tmpdir):
+    """Several writers on one folder behave like several workers"""
+    writers = [LogWriter(str(tmpdir)) for _ in range(4)]
+    line = json.dumps({'payload': 'x' * 10000}) + '\n'
+
+    def write(writer):
+        for _ in range(20):
+            writer.enqueue('clicks', [line] * 5)
+            writer.flush()
+
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(write, writers))
+    assert len(read_lines(str(tmpdir.join('clicks.jsonl')))) == 4 * 20 * 5
+
+
+def test_file_names_stay_in_the_folder():
+    assert logger.is_valid_file_name('frontend_clicks-2')
+    assert not logger.is_valid_file_name('../server')
+    assert not logger.is_valid_file_name('')
+    assert not logger.is_valid_file_name(None)
@@ -0,0 +1,114 @@
+import threading
+import os
+import pytest
+from prometheus_client import REGISTRY
+import api.neo4j.connectionManager as connectionManager
+
+
+class FakeSession:
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def run(self, query):
+        if self.driver.closed:
+            raise RuntimeError("driver closed")
+        return [{'query': query}]
+
+
+class FakeDriver:
+
+    def __init__(self):
+        self.closed = False
+
+    def session(self):
+        return FakeSession(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def process_state():
+    connectionManager.reset_driver()
+    yield
+    connectionManager.reset_driver()
+
+
+def test_reset_driver_waits_for_open_sessions():
+    driver = FakeDriver()
+    connectionManager.set_driver(driver)
+    with connectionManager.session() as db:
+        """Another thread hit an AddressError"""
+        connectionManager.reset_driver()
+        assert db.run('RETURN 1') == [{'query': 'RETURN 1'}]
+        assert not driver.closed
+    assert driver.closed
+
+
+def test_reset_driver_without_sessions_closes_at_once():
+    driver = FakeDriver()
+    connectionManager.set_driver(driver)
+    with connectionManager.session():
+        pass
+    connectionManager.reset_driver()
+    assert driver.closed
+
+
+def test_connecting_does_not_block_the_pool_metrics(monkeypatch):
+    database_up = threading.Event()
+    driver = FakeDriver()
+
+    def create_driver(log_function):
+        database_up.wait(5)
+        return driver
+    monkeypatch.setattr(connectionManager, '__create_driver', create_driver)
+    drivers = []
+    connecting = threading.Thread(
+        target=lambda: drivers.append(connectionManager.get_driver()))
+    connecting.start()
+    """The database is down, the metrics are still answered"""
+    metrics = connectionManager.get_pool_metrics()
+    assert connecting.is_alive()
+    connects = metrics['connects']
+    database_up.set()
+    connecting.join(5)
+    assert drivers == [driver]
+    assert connectionManager.get_pool_metrics()['connects'] == connects + 1
+
+
+def test_forked_process_connects_again(monkeypatch):
+    parent_driver = FakeDriver()
+    connectionManager.set_driver(parent_driver)
+    assert connectionManager.get_driver() is parent_driver
+    child_driver = FakeDriver()
+    monkeypatch.setattr(connectionManager, '__create_driver',
+                        lambda log_function: child_driver)
+    child_pid = os.getpid() + 1
+    monkeypatch.setattr(os, 'getpid', lambda: child_pid)
+    """The sockets of the parent are neither used nor closed"""
+    assert connectionManager.get_driver() is child_driver
+    assert not parent_driver.closed
+    metrics = connectionManager.get_pool_metrics()
+    assert (metrics['pid'], metrics['connects']) == (child_pid, 1)
+
+
+def test_set_driver_replaces_the_driver_until_reset(monkeypatch):
+    driver = FakeDriver()
+    connectionManager.set_driver(driver)
+    with connectionManager.session() as db:
+        assert db.driver is driver
+        assert REGISTRY.get_sample_value('tracemap_neo4j_sessions_in_use') == 1
+        assert connectionManager.get_pool_metrics()['sessions_in_use'] == 1
+    assert REGISTRY.get_sample_value('tracemap_neo4j_sessions_in_use') == 0
+    connectionManager.reset_driver()
+    new_driver = FakeDriver()
+    monkeypatch.setattr(connectionManager, '__create_driver',
+                        lambda log_function: new_driver)
+    assert connectionManager.get_driver() is new_driver
@@ -0,0 +1,125 @@
+from api.neo4j.followerCache import FollowerCache
+import api.neo4j.followerCache as followerCache
+
+RELATIONS = [('1', '2'), ('3', '2'), ('2', '1'), ('4', '3'), ('1', '4')]
+
+
+class FakeDatabase:
+
+    def __init__(self):
+        self.calls = []
+        self.relations = list(RELATIONS)
+
+    def fetch_relations(self, start_uids, end_uids):
+        self.calls.append((list(start_uids), list(end_uids)))
+        return [(start, end) for start, end in self.relations
+                if start in start_uids and end in end_uids]
+
+
+def sorted_followers(followers):
+    return {uid: sorted(user_followers)
+            for uid, user_followers in followers.items()}
+
+
+def test_get_followers_is_cached(tmpdir):
+    database = FakeDatabase()
+    cache = FollowerCache(events_file=str(tmpdir.join('events.log')))
+    expected = {'2': ['1', '3'], '1': ['2']}
+    """The first request goes to the database..."""
+    followers = cache.get_followers(['1', '2', '3'], database.fetch_relations)
+    assert sorted_followers(followers) == expected
+    assert len(database.calls) == 1
+    """...the same request is answered from the cache"""
+    followers = cache.get_followers(['3', '2', '1'], database.fetch_relations)
+    assert sorted_followers(followers) == expected
+    assert len(database.calls) == 1
+    assert cache.get_stats()['hits'] == 3
+
+
+def test_overlapping_request_only_fetches_new_uids(tmpdir):
+    database = FakeDatabase()
+    cache = FollowerCache(events_file=str(tmpdir.join('events.log')))
+    cache.get_followers(['1', '2', '3'], database.fetch_relations)
+    followers = cache.get_followers(['1', '2', '3', '4'],
+                                    database.fetch_relations)
+    assert sorted_followers(followers) == {
+        '2': ['1', '3'], '1': ['2'], '3': ['4'], '4': ['1']}
+    """Known users are only checked against the new uid"""
+    start_uids, end_uids = database.calls[1]
+    assert start_uids == ['1', '2', '3', '4']
+    assert end_uids == ['1', '2', '3', '4']
+    followers = cache.get_followers(['1', '4'], database.fetch_relations)
+    assert sorted_followers(followers) == {'4': ['1']}
+    assert len(database.calls) == 2
+
+
+def test_published_event_invalidates_user(tmpdir, monkeypatch):
+    events_file = str(tmpdir.join('events.log'))
+    monkeypatch.setattr(followerCache, 'EVENTS_FILE', events_file)
+    database = FakeDatabase()
+    cache = FollowerCache(events_file=events_file)
+    followerCache.publish_followers_changed('0')
+    cache.get_followers(['1', '2', '3'], database.fetch_relations)
+    """The Writer rewrote the followers of user 2"""
+    followerCache.publish_followers_changed('2')
+    cache.get_followers(['1', '2', '3'], database.fetch_relations)
+    assert database.calls[1] == (['1', '2', '3'], ['2'])
+    assert cache.get_stats()['invalidations'] == 1
+
+
+def test_deleted_follower_leaves_the_users_it_followed(tmpdir, monkeypatch):
+    events_file = str(tmpdir.join('events.log'))
+    monkeypatch.setattr(followerCache, 'EVENTS_FILE', events_file)
+    database = FakeDatabase()
+    cache = FollowerCache(events_file=events_file)
+    followerCache.publish_followers_changed('0')
+    followers = cache.get_followers(['1', '2', '3'], database.fetch_relations)
+    assert sorted_followers(followers)['1'] == ['2']
+    """The Writer deleted user 2, which followed user 1"""
+    database.relations = [(start, end) for start, end in RELATIONS
+                          if '2' not in (start, end)]
+    followerCache.publish_user_deleted('2', ['1'])
+    followers = cache.get_followers(['1', '2', '3'], database.fetch_relations)
+    assert followers == {}
+    assert database.calls[1][1] == ['1', '2']
+
+
+def test_least_recently_used_users_are_evicted(tmpdir):
+    database = FakeDatabase()
+    cache = FollowerCache(max_users=2,
+                          events_file=str(tmpdir.join('events.log')))
+    cache.get_followers(['1', '2', '3'], database.fetch_relations)
+    stats = cache.get_stats()
+    assert stats['users'] == 2
+    assert stats['evictions'] == 1
+
+
+def test_events_are_read_across_a_rotation(tmpdir, monkeypatch):
+    events_file = str(tmpdir.join('events.log'))
+    monkeypatch.setattr(followerCache, 'EVENTS_FILE', events_file)
+    """Room for the generation header and three events"""
+    monkeypatch.setattr(followerCache, 'MAX_EVENTS_FILE_SIZE', 24)
+    database = FakeDatabase()
+    cache = FollowerCache(events_file=events_file)
+    followerCache.publish_followers_changed('0')
+    cache.get_followers(['1', '2', '3'], database.fetch_relations)
+    """The fifth event rotates, the new file grows past the old offset"""
+    for uid in ('1', '0', '0', '0', '2', '0'):
+        followerCache.publish_followers_changed(uid)
+    cache.get_followers(['1', '2', '3'], database.fetch_relations)
+    assert database.calls[1] == (['1', '2', '3'], ['1', '2'])
+    assert cache.get_stats()['invalidations'] == 6
+
+
+def test_events_lost_with_two_rotations_drop_everything(tmpdir, monkeypatch):
+    events_file = str(tmpdir.join('events.log'))
+    monkeypatch.setattr(followerCache, 'EVENTS_FILE', events_file)
+    monkeypatch.setattr(followerCache, 'MAX_EVENTS_FILE_SIZE', 1)
+    database = FakeDatabase()
+    cache = FollowerCache(events_file=events_file)
+    followerCache.publish_followers_changed('0')
+    cache.get_followers(['1', '2', '3'], database.fetch_relations)
+    for uid in ('0', '0', '0'):
+        followerCache.publish_followers_changed(uid)
+    cache.get_followers(['1', '2', '3'], database.fetch_relations)
+    assert database.calls[1] == (['1', '2', '3'], ['1', '2', '3'])
@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+import api.neo4j.followerSnapshot as followerSnapshot
+import api.neo4j.followerCache as followerCache
+from api.neo4j.followerSnapshot import FollowerSnapshot
+
+USERS = ['1', '2', '3', '4', 'not_numeric']
+FOLLOWERS = {'2': ['1', '3'], '1': ['2'], '3': ['4']}
+
+
+class FakeSession:
+
+    def run(self, query):
+        if query == followerSnapshot.ALL_USERS_QUERY:
+            return [{'uid': uid} for uid in USERS]
+        return [{'uid': uid, 'followers': followers}
+                for uid, followers in FOLLOWERS.items()]
+
+
+@contextmanager
+def fake_session(log_function=print):
+    yield FakeSession()
+
+
+def export(tmpdir, monkeypatch):
+    events_file = str(tmpdir.join('events.log'))
+    monkeypatch.setattr(followerCache, 'EVENTS_FILE', events_file)
+    monkeypatch.setattr(followerSnapshot.connectionManager, 'session',
+                        fake_session)
+    base_directory = str(tmpdir.join('snapshot'))
+    followerSnapshot.export_snapshot(base_directory, lambda message: None)
+    return FollowerSnapshot(base_directory)
+
+
+def test_get_relations_from_snapshot(tmpdir, monkeypatch):
+    snapshot = export(tmpdir, monkeypatch)
+    relations, missing = snapshot.get_relations(['1', '2', '3'],
+                                                ['1', '2', '3'])
+    assert sorted(relations) == [('1', '2'), ('2', '1'), ('3', '2')]
+    assert missing == []
+    assert snapshot.get_stats()['relations'] == 4
+
+
+def test_users_written_after_export_are_missing(tmpdir, monkeypatch):
+    snapshot = export(tmpdir, monkeypatch)
+    followerCache.publish_followers_changed('2')
+    relations, missing = snapshot.get_relations(['1', '2', '3', '4'],
+                                                ['2', '3'])
+    assert relations == [('4', '3')]
+    assert missing == ['2']
+
+
+def test_users_a_deleted_user_followed_are_missing(tmpdir, monkeypatch):
+    snapshot = export(tmpdir, monkeypatch)
+    """The Writer deleted user 2, the row of user 1 still lists it"""
+    followerCache.publish_user_deleted('2', ['1'])
+    relations, missing = snapshot.get_relations(['1', '2', '3'],
+                                                ['1', '2', '3'])
+    assert relations == []
+    assert missing == ['1', '2']
+
+
+def test_without_snapshot_everything_is_missing(tmpdir):
+    snapshot = FollowerSnapshot(str(tmpdir.join('nothing')))
+    relations, missing = snapshot.get_relations(['1', '2'], ['1', '2'])
+    assert relations == []
+    assert missing == ['1', '2']
+    assert not snapshot.get_stats()['available']
+
+
+def test_events_are_followed_across_a_rotation(tmpdir, monkeypatch):
+    monkeypatch.setattr(followerCache, 'MAX_EVENTS_FILE_SIZE', 24)
+    tmpdir.join('events.log').write('#1\n' + '0\n' * 10)
+    snapshot = export(tmpdir, monkeypatch)
+    for uid in ('2', '0', '0', '3', '0'):
+        followerCache.publish_followers_changed(uid)
+    relations, missing = snapshot.get_relations(['1', '2', '3'], ['1', '2', '3'])
+    assert relations == [('2', '1')]
+    assert missing == ['2', '3']
+    assert snapshot.get_stats()['events_lost'] == 0
+
+
+def test_snapshot_is_unusable_after_two_rotations(tmpdir, monkeypatch):
+    snapshot = export(tmpdir, monkeypatch)
+    monkeypatch.setattr(followerCache, 'MAX_EVENTS_FILE_SIZE', 1)
+    followerCache.publish_followers_changed('0')
+    snapshot.get_relations(['1'], ['2'])
+    for uid in ('0', '0', '0'):
+        followerCache.publish_followers_changed(uid)
+    relations, missing = snapshot.get_relations(['1', '2'], ['1', '2'])
+    assert missing == ['1', '2']
+    stats = snapshot.get_stats()
+    assert not stats['available'] and stats['events_lost'] == 1
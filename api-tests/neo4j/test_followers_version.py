@@ -0,0 +1,57 @@
+import time
+import api.neo4j.neo4jApi as neo4jApi
+
+SETTLED = int(time.time()) - 3600
+
+
+class FakeDatabase:
+
+    def __init__(self):
+        self.timestamps = {'1': SETTLED, '2': SETTLED - 10, '3': str(SETTLED - 20.5)}
+
+    def request(self, request_string, parameters=None):
+        assert request_string == neo4jApi.USER_TIMESTAMPS_QUERY
+        return [{'uid': uid, 'timestamp': self.timestamps[uid]}
+                for uid in parameters['uids'] if uid in self.timestamps]
+
+
+def patch_database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(neo4jApi, '__request_database', database.request)
+    monkeypatch.setattr(neo4jApi, 'get_followers',
+                        lambda user_ids: {'1': ['2', '3'], '2': ['1']})
+    return database
+
+
+def test_etag_changes_when_a_user_is_written(monkeypatch):
+    database = patch_database(monkeypatch)
+    version = neo4jApi.get_followers_version(['1', '2', '3', '4'])
+    assert version['etag']
+    """The order of the uids does not matter"""
+    assert neo4jApi.get_followers_version(['3', '2', '1'])['etag'] == version['etag']
+    database.timestamps['2'] = SETTLED + 10
+    assert neo4jApi.get_followers_version(['1', '2', '3'])['etag'] != version['etag']
+    """A user created by the crawler is a change as well"""
+    database.timestamps['4'] = SETTLED + 20
+    assert neo4jApi.get_followers_version(['1', '2', '3', '4'])['etag'] != version['etag']
+
+
+def test_no_etag_while_a_write_may_not_be_published(monkeypatch):
+    database = patch_database(monkeypatch)
+    database.timestamps['2'] = int(time.time())
+    version = neo4jApi.get_followers_version(['1', '2', '3'])
+    assert version['etag'] is None
+    """Users written after the version are sent with the next request"""
+    assert version['version'] <= database.timestamps['2']
+
+
+def test_followers_since_only_contains_written_users(monkeypatch):
+    database = patch_database(monkeypatch)
+    version = neo4jApi.get_followers_version(['1', '2', '3'])
+    assert neo4jApi.get_followers_since(
+        ['1', '2', '3'], version['version'], version['timestamps']) == {}
+    database.timestamps['1'] = version['version'] + 1
+    database.timestamps['3'] = str(version['version'] + 2.5)
+    timestamps = neo4jApi.get_followers_version(['1', '2', '3'])['timestamps']
+    assert neo4jApi.get_followers_since(
+        ['1', '2', '3'], version['version'], timestamps) == {'1': ['2', '3'], '3': []}
@@ -0,0 +1,27 @@
+import numpy as np
+import api.neo4j.subgraphEngine as subgraphEngine
+from api.neo4j.subgraphEngine import induced_subgraph, to_indices
+
+UIDS = np.array([10, 20, 30, 40, 50], dtype=np.int64)
+# followers of 10: 20 | of 20: 10, 30, 50 | of 30: 40 | of 40, 50: none
+OFFSETS = np.array([0, 1, 4, 5, 5, 5], dtype=np.int64)
+FOLLOWERS = np.array([1, 0, 2, 4, 3], dtype=np.int32)
+
+
+def test_to_indices_skips_unknown_uids():
+    indices, strings = to_indices(UIDS, ['30', '31', 'abc', '10'])
+    assert indices.tolist() == [2, 0]
+    assert strings == ['30', '10']
+
+
+def test_induced_subgraph():
+    uids = ['10', '20', '30']
+    followers = induced_subgraph(UIDS, OFFSETS, FOLLOWERS, uids, uids)
+    assert followers == {'10': ['20'], '20': ['10', '30']}
+
+
+def test_induced_subgraph_searches_long_rows(monkeypatch):
+    """The follower row of 20 is longer than the single start uid"""
+    monkeypatch.setattr(subgraphEngine, 'LONG_ROW_FACTOR', 1)
+    followers = induced_subgraph(UIDS, OFFSETS, FOLLOWERS, ['50'], ['20'])
+    assert followers == {'20': ['50']}
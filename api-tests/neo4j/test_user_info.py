@@ -0,0 +1,91 @@
+from contextlib import contextmanager
+import api.neo4j.neo4jApi as neo4jApi
+
+USERS = {
+    '1': {'uid': '1', 'name': 'one', 'lang': 'en'},
+    '2': {'uid': '2', 'name': 'two'}
+}
+
+
+class FakeResult:
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def data(self):
+        return self.rows
+
+
+class FakeTransaction:
+    """Answers the user info queries from USERS and records them"""
+
+    def __init__(self, statements):
+        self.statements = statements
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def run(self, query, parameters):
+        self.statements.append((query, parameters))
+        if query == neo4jApi.USERS_INFO_QUERY:
+            return FakeResult([{'uid': uid, 'properties': USERS[uid]}
+                               for uid in parameters['uids'] if uid in USERS])
+        if query == neo4jApi.USERS_INFO_PROJECTION_QUERY:
+            return FakeResult([
+                {'uid': uid,
+                 'values': [USERS[uid].get(key) for key in parameters['properties']]}
+                for uid in parameters['uids'] if uid in USERS])
+        if query == neo4jApi.ADD_USER_INFO_QUERY:
+            return FakeResult([{'uid': row['uid']} for row in parameters['rows']
+                               if row['uid'] in USERS])
+        raise AssertionError("unexpected query %s" % query)
+
+
+class FakeSession:
+
+    def __init__(self, statements):
+        self.statements = statements
+
+    def begin_transaction(self):
+        return FakeTransaction(self.statements)
+
+
+def fake_database(monkeypatch):
+    statements = []
+
+    @contextmanager
+    def fake_session(log_function=print):
+        yield FakeSession(statements)
+    monkeypatch.setattr(neo4jApi.connectionManager, 'session', fake_session)
+    return statements
+
+
+def test_get_users_info_returns_all_properties(monkeypatch):
+    statements = fake_database(monkeypatch)
+    users_info = neo4jApi.get_users_info(['2', '1', '3', '1'])
+    assert users_info == USERS
+    assert statements == [(neo4jApi.USERS_INFO_QUERY, {'uids': ['1', '2', '3']})]
+
+
+def test_get_users_info_projects_the_properties(monkeypatch):
+    statements = fake_database(monkeypatch)
+    users_info = neo4jApi.get_users_info(['1', '2'], ['name', 'lang'])
+    """Missing properties are left out instead of returned as None"""
+    assert users_info == {'1': {'name': 'one', 'lang': 'en'},
+                          '2': {'name': 'two'}}
+    assert statements == [(neo4jApi.USERS_INFO_PROJECTION_QUERY, {
+        'uids': ['1', '2'], 'properties': ['name', 'lang']})]
+
+
+def test_add_user_info_bulk_writes_chunks_of_existing_users(monkeypatch):
+    statements = fake_database(monkeypatch)
+    monkeypatch.setattr(neo4jApi, 'USER_INFO_CHUNK_SIZE', 2)
+    user_info = {'response': {uid: {'name': uid} for uid in ['1', '2', '3']}}
+    """User 3 is not in the graph, it is not created"""
+    assert neo4jApi.add_user_info_bulk(user_info) == {'1': True, '2': True, '3': False}
+    assert [len(parameters['rows']) for _, parameters in statements] == [2, 1]
+    assert not neo4jApi.add_user_info(user_info)
+    assert neo4jApi.add_user_info({'response': {'1': {'name': 'one'}}})
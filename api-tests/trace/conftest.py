@@ -0,0 +1,52 @@
+import asyncio
+import threading
+import time
+import pytest
+
+"""
+Stand in for TracemapTwitterApi shared by the tests of this package
+through the fake_twitter_api fixture.
+"""
+
+TWEET_DATA = {'response': {
+    'tweet_info': {'id_str': '10', 'user': {'id_str': '1'}},
+    'retweeter_ids': ['2', '3'],
+    'retweet_info': {}
+}}
+
+
+class FakeTwitterApi:
+    """Tweet 10 has two retweets, tweet 'broken' fails"""
+
+    def __init__(self, user_info_duration: float = 0.0, released: bool = True):
+        """
+        :param user_info_duration: seconds get_user_info takes
+        :param released: False to hold get_user_info until
+        user_info_released is set
+        """
+        self.user_info_duration = user_info_duration
+        self.user_info_released = threading.Event()
+        if released:
+            self.user_info_released.set()
+
+    def get_tweet_data(self, tweet_id):
+        if tweet_id == 'broken':
+            raise RuntimeError("twitter is down")
+        return TWEET_DATA if tweet_id == '10' else {'response': []}
+
+    def get_user_info(self, user_ids):
+        self.user_info_released.wait(5)
+        time.sleep(self.user_info_duration)
+        return {'response': {uid: {'name': uid} for uid in user_ids}}
+
+    async def get_tweet_data_async(self, tweet_id):
+        return self.get_tweet_data(tweet_id)
+
+    async def get_user_info_async(self, user_ids):
+        await asyncio.sleep(self.user_info_duration)
+        return {'response': {uid: {'name': uid} for uid in user_ids}}
+
+
+@pytest.fixture
+def fake_twitter_api():
+    return FakeTwitterApi
@@ -0,0 +1,60 @@
+import asyncio
+import time
+import api.trace.traceApi as traceApi
+
+STAGE_DURATION = 0.2
+
+
+def slow_label_unknown_users(user_ids):
+    time.sleep(STAGE_DURATION)
+    return {'uncrawled': user_ids[1:], 'unwritten': []}
+
+
+def slow_get_followers(user_ids):
+    time.sleep(STAGE_DURATION)
+    return {'1': ['2', '3']}
+
+
+def patch_neo4j(monkeypatch):
+    monkeypatch.setattr(traceApi.neo4jApi, 'label_unknown_users', slow_label_unknown_users)
+    monkeypatch.setattr(traceApi.neo4jApi, 'get_followers', slow_get_followers)
+
+
+def check_trace(trace):
+    assert trace['user_ids'] == ['1', '2', '3']
+    assert trace['labels']['uncrawled'] == ['2', '3']
+    assert trace['followers'] == {'1': ['2', '3']}
+    assert sorted(trace['user_info']['response']) == ['1', '2', '3']
+    assert set(trace['timings']) == {'tweet_data', 'label_unknown_users',
+                                     'followers', 'user_info', 'total'}
+    """The three stages after the tweet data run at the same time"""
+    assert trace['timings']['total'] < 2 * STAGE_DURATION * 1000
+
+
+def test_get_trace_runs_stages_concurrently(monkeypatch, fake_twitter_api):
+    patch_neo4j(monkeypatch)
+    check_trace(traceApi.get_trace(fake_twitter_api(STAGE_DURATION), '10'))
+
+
+def test_get_trace_async_runs_stages_concurrently(monkeypatch, fake_twitter_api):
+    patch_neo4j(monkeypatch)
+    loop = asyncio.new_event_loop()
+    try:
+        check_trace(loop.run_until_complete(traceApi.get_trace_async(fake_twitter_api(STAGE_DURATION), '10')))
+    finally:
+        loop.close()
+
+
+def test_trace_without_retweets(monkeypatch, fake_twitter_api):
+    patch_neo4j(monkeypatch)
+    trace = traceApi.get_trace(fake_twitter_api(STAGE_DURATION), '11')
+    assert trace['user_ids'] == []
+    assert trace['followers'] == {}
+
+
+def test_user_ids_keep_their_first_position():
+    tweet_data = {'response': {
+        'tweet_info': {'id_str': '10', 'user': {'id_str': '2'}},
+        'retweeter_ids': ['3', '2', '4', '3']
+    }}
+    assert traceApi.get_user_ids(tweet_data) == ['2', '3', '4']
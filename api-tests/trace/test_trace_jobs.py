@@ -0,0 +1,94 @@
+import time
+import pytest
+import api.trace.traceJobs as traceJobs
+
+
+class FakeCrawler:
+    """Writes one waiting user per label_unknown_users call"""
+
+    def __init__(self):
+        self.waiting = ['2', '3']
+
+    def label_unknown_users(self, user_ids):
+        labels = {'uncrawled': list(self.waiting), 'unwritten': []}
+        if self.waiting:
+            self.waiting.pop(0)
+        return labels
+
+    def get_followers(self, user_ids):
+        written = [uid for uid in ['2', '3'] if uid not in self.waiting]
+        return {'1': written}
+
+
+@pytest.fixture(autouse=True)
+def jobs_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(traceJobs, 'JOBS_DIR', str(tmpdir))
+    monkeypatch.setattr(traceJobs, 'REFRESH_INTERVAL', 0.05)
+    crawler = FakeCrawler()
+    monkeypatch.setattr(traceJobs.neo4jApi, 'label_unknown_users', crawler.label_unknown_users)
+    monkeypatch.setattr(traceJobs.neo4jApi, 'get_followers', crawler.get_followers)
+
+
+def wait_for(job_id, condition, email='user@tracemap.info'):
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        job = traceJobs.get_job(job_id, email)
+        if job and condition(job):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not reach the condition: %s" % job)
+
+
+def test_results_become_available_progressively(fake_twitter_api):
+    twitter_api = fake_twitter_api(released=False)
+    submitted = traceJobs.submit_job(twitter_api, 'User@tracemap.info', '10')
+    job_id = submitted['job_id']
+    """Retweeters and the subgraph are there while user info is pending"""
+    job = wait_for(job_id, lambda job: 'followers' in job['result'])
+    assert job['result']['user_ids'] == ['1', '2', '3']
+    assert 'user_info' not in job['result']
+    assert job['status'] == traceJobs.RUNNING
+    twitter_api.user_info_released.set()
+    """The subgraph grows while the crawler writes the waiting users"""
+    job = wait_for(job_id, lambda job: job['status'] == traceJobs.DONE)
+    assert job['result']['followers'] == {'1': ['2', '3']}
+    assert sorted(job['result']['user_info']['response']) == ['1', '2', '3']
+    assert job['waiting_for_crawler'] == []
+    assert job['version'] > submitted['version']
+
+
+def test_jobs_are_private_and_ids_are_checked(fake_twitter_api):
+    job_id = traceJobs.submit_job(fake_twitter_api(), 'user@tracemap.info', '11')['job_id']
+    job = wait_for(job_id, lambda job: job['status'] == traceJobs.DONE)
+    assert 'email' not in job
+    assert traceJobs.get_job(job_id, 'other@tracemap.info') is None
+    assert traceJobs.get_job('../' + job_id, 'user@tracemap.info') is None
+    assert 'result' not in traceJobs.get_job(job_id, 'user@tracemap.info', False)
+
+
+def test_failed_stage_fails_the_job(fake_twitter_api):
+    job_id = traceJobs.submit_job(fake_twitter_api(), 'user@tracemap.info', 'broken')['job_id']
+    job = wait_for(job_id, lambda job: job['status'] == traceJobs.FAILED)
+    assert job['error'] == "twitter is down"
+
+
+def test_jobs_of_a_stopped_worker_are_failed(monkeypatch):
+    job = traceJobs.TraceJob('user@tracemap.info', '10')
+    job.update(status=traceJobs.RUNNING)
+    assert traceJobs.get_job(job.job_id, 'user@tracemap.info')['status'] == traceJobs.RUNNING
+    """Nothing touched the job since, its process is gone"""
+    monkeypatch.setattr(traceJobs, 'STALE_AFTER', -1)
+    job_status = traceJobs.get_job(job.job_id, 'user@tracemap.info')
+    assert job_status['status'] == traceJobs.FAILED
+    assert job_status['error'] == 'the worker running the job stopped'
+
+
+def test_heartbeat_keeps_running_jobs_alive():
+    job = traceJobs.TraceJob('user@tracemap.info', '10')
+    job.update(status=traceJobs.RUNNING)
+    before = traceJobs.get_job(job.job_id, 'user@tracemap.info')
+    time.sleep(0.01)
+    job.touch()
+    after = traceJobs.get_job(job.job_id, 'user@tracemap.info')
+    assert after['heartbeat_at'] > before['heartbeat_at']
+    assert after['version'] == before['version']
@@ -0,0 +1,79 @@
+import threading
+import pytest
+from api.twitter.tokenProvider import RateLimit
+
+"""
+Stand ins for the tokens twitterApi leases and the responses of TwitterAPI,
+shared by the tests of this package through the fake_token and
+fake_response fixtures.
+"""
+
+
+class FakeResponse:
+    """A TwitterAPI response, data that is a ValueError is no json"""
+
+    def __init__(self, data, headers=None):
+        self.data = data
+        self.headers = headers or {}
+
+    def json(self):
+        if isinstance(self.data, ValueError):
+            raise self.data
+        return self.data
+
+
+class FakeApi:
+    """The credentials of a token, replaced with every switch"""
+
+    def __init__(self, token, credentials: int):
+        self.token = token
+        self.credentials = credentials
+
+    def request(self, route, params):
+        self.token.requests.append((self.credentials, route, params))
+        if self.token.answer is not None:
+            response = self.token.answer(route, params)
+        else:
+            response = self.token.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        if isinstance(response, FakeResponse):
+            return response
+        return FakeResponse(response)
+
+
+class FakeToken:
+
+    def __init__(self, route, cleanup_last_session=True, responses=None,
+                 answer=None):
+        """
+        :param route: the route of the token
+        :param responses: answered in order, exceptions are raised
+        :param answer: function of route and params answering every
+        request instead
+        """
+        self.twitter_route = route
+        self.lock = threading.RLock()
+        self.rate_limit = RateLimit()
+        self.responses = list(responses or [])
+        self.answer = answer
+        #: (credentials, route, params) of every request
+        self.requests = []
+        self.switches = 0
+        self.api = FakeApi(self, 0)
+
+    def get_user_auth(self):
+        """New credentials come with a fresh rate limit window"""
+        self.switches += 1
+        self.rate_limit = RateLimit()
+        self.api = FakeApi(self, self.switches)
+
+
+@pytest.fixture
+def fake_response():
+    return FakeResponse
+
+
+@pytest.fixture
+def fake_token():
+    return FakeToken
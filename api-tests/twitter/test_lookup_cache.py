@@ -0,0 +1,75 @@
+import functools
+import time
+import api.twitter.twitterApi as twitterApi
+from api.twitter.lookupCache import LookupCache
+
+from test_tweet_lookup import lookup_answer, requested_ids
+
+ROUTE = 'users/lookup'
+
+
+def test_entries_expire_after_the_ttl_of_their_route(monkeypatch):
+    cache = LookupCache(route_ttls={ROUTE: 10})
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now)
+    cache.put(ROUTE, '1', {'id_str': '1'})
+    cache.put('statuses/show', '1', {'id_str': '1'})
+    assert cache.get(ROUTE, '1') == (False, {'id_str': '1'})
+    """Routes without a ttl are not cached"""
+    assert cache.get('statuses/show', '1') is None
+    monkeypatch.setattr(time, 'time', lambda: now + 11)
+    assert cache.get(ROUTE, '1') is None
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['expirations']) == (1, 1, 1)
+    assert stats['hit_ratio'] == 0.5
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = LookupCache(max_entries=2, route_ttls={ROUTE: 10})
+    cache.put(ROUTE, '1', 1)
+    cache.put(ROUTE, '2', 2)
+    cache.get(ROUTE, '1')
+    cache.put(ROUTE, '3', 3)
+    assert cache.get(ROUTE, '2') is None
+    assert cache.get(ROUTE, '1') == (False, 1)
+    assert cache.get(ROUTE, '3') == (False, 3)
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_negative_entries_use_the_negative_ttl(monkeypatch):
+    cache = LookupCache(route_ttls={ROUTE: 10}, negative_ttl=100)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now)
+    cache.put(ROUTE, '1', None, negative=True)
+    monkeypatch.setattr(time, 'time', lambda: now + 50)
+    assert cache.get(ROUTE, '1') == (True, None)
+    assert cache.get_stats()['negative_hits'] == 1
+
+
+def test_workers_share_entries_through_the_directory(tmpdir):
+    writer = LookupCache(directory=str(tmpdir), route_ttls={ROUTE: 10})
+    reader = LookupCache(directory=str(tmpdir), route_ttls={ROUTE: 10})
+    writer.put(ROUTE, '1', {'id_str': '1'})
+    assert reader.get(ROUTE, '1') == (False, {'id_str': '1'})
+    """The disk hit is kept in memory"""
+    assert reader.get(ROUTE, '1') == (False, {'id_str': '1'})
+    stats = reader.get_stats()
+    assert (stats['disk_hits'], stats['hits'], stats['entries']) == (1, 1, 1)
+
+
+def test_lookups_only_request_uncached_ids(monkeypatch, fake_token):
+    monkeypatch.setattr(twitterApi, 'Token', functools.partial(fake_token, answer=lookup_answer))
+    api = twitterApi.TracemapTwitterApi()
+    first = api.get_user_info(['10', '11', '12'])
+    second = api.get_user_info(['10', '11', '12', '14'])
+    assert sorted(first['response']) == ['10', '12']
+    assert sorted(second['response']) == ['10', '12', '14']
+    assert first['missing'] == second['missing'] == ['11']
+    """11 is remembered as an invalid user, only 14 is requested again"""
+    token = api._TracemapTwitterApi__pools[ROUTE].tokens[0]
+    assert requested_ids(token) == [['10', '11', '12'], ['14']]
+    """No user of the chunk exists, twitter answers error 17"""
+    assert api.get_user_info(['13'])['missing'] == ['13']
+    assert api.get_user_info(['13'])['missing'] == ['13']
+    assert requested_ids(token) == [['10', '11', '12'], ['14'], ['13']]
+    assert api.get_cache_stats()['negative_hits'] == 2
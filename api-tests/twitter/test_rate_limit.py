@@ -0,0 +1,67 @@
+import functools
+import time
+import api.twitter.twitterApi as twitterApi
+from api.twitter.tokenPool import TokenPool
+from api.twitter.tokenProvider import RateLimit
+
+ROUTE = 'statuses/user_timeline'
+
+
+def headers(remaining, reset_at):
+    return {'x-rate-limit-remaining': str(remaining),
+            'x-rate-limit-reset': str(int(reset_at))}
+
+
+def test_rate_limit_keeps_the_lowest_remaining_of_a_window():
+    rate_limit = RateLimit()
+    reset_at = time.time() + 60
+    rate_limit.record({})
+    assert rate_limit.remaining is None
+    rate_limit.record(headers(5, reset_at))
+    """A response of an earlier request arriving late"""
+    rate_limit.record(headers(7, reset_at))
+    assert rate_limit.remaining == 5
+    rate_limit.record(headers(0, reset_at))
+    assert rate_limit.is_exhausted()
+    rate_limit.record(headers(3, reset_at - 900))
+    assert rate_limit.remaining == 0
+
+
+def test_rate_limit_is_unknown_after_the_reset():
+    rate_limit = RateLimit()
+    rate_limit.record(headers(0, time.time() - 1))
+    assert rate_limit.remaining is None and not rate_limit.is_exhausted()
+    assert rate_limit.reset_at is not None
+
+
+def test_pool_prefers_the_token_with_most_remaining(fake_token):
+    pool = TokenPool(ROUTE, 2, 2, fake_token)
+    with pool.lease() as first, pool.lease() as second:
+        pass
+    first.rate_limit.record(headers(3, time.time() + 60))
+    second.rate_limit.record(headers(10, time.time() + 60))
+    with pool.lease() as token:
+        assert token is second
+    """Exhausted tokens are only used once every other is busy"""
+    second.rate_limit.record(headers(0, time.time() + 60))
+    with pool.lease() as token, pool.lease() as other:
+        assert token is first
+        assert other is first
+    stats = pool.get_stats()
+    assert [limit['remaining'] for limit in stats['rate_limits']] == [3, 0]
+
+
+def test_exhausted_tokens_switch_before_sending(monkeypatch, fake_token, fake_response):
+    def answer(route, params):
+        """Every response uses up the window of the credentials"""
+        return fake_response([], headers(0, time.time() + 60))
+    monkeypatch.setattr(twitterApi, 'Token', functools.partial(fake_token, answer=answer))
+    """With one token per route the pool cannot lease a fresh one instead"""
+    monkeypatch.setattr(twitterApi, 'TOKENS_PER_ROUTE', 1)
+    api = twitterApi.TracemapTwitterApi()
+    api.get_user_timeline('1')
+    api.get_user_timeline('2')
+    token = api._TracemapTwitterApi__pools[ROUTE].tokens[0]
+    """The first response used up the window, no request was refused"""
+    assert [credentials for credentials, _, _ in token.requests] == [0, 1]
+    assert token.switches == 1
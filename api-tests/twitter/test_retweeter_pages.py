@@ -0,0 +1,82 @@
+import asyncio
+import functools
+import api.twitter.twitterApi as twitterApi
+
+from test_tweet_lookup import user
+
+"""Retweeters 1 to 250, the 100 latest retweets have details"""
+RETWEETERS = [str(user_id) for user_id in range(1, 251)]
+
+
+def retweet(user_id):
+    return {
+        'id_str': '9%s' % user_id, 'lang': 'en', 'user': user(user_id),
+        'retweeted_status': {'id_str': '5', 'lang': 'en', 'user': user('1000')}
+    }
+
+
+def retweets_answer(route, params):
+    """Pages through RETWEETERS with cursors like statuses/retweeters/ids"""
+    if route == 'statuses/retweets/:5':
+        return [retweet(user_id) for user_id in RETWEETERS[:100]]
+    start = 0 if params['cursor'] == -1 else params['cursor']
+    next_cursor = start + 100 if start + 100 < len(RETWEETERS) else 0
+    return {'ids': RETWEETERS[start:start + 100], 'next_cursor': next_cursor}
+
+
+def retweets_api(monkeypatch, fake_token):
+    monkeypatch.setattr(twitterApi, 'Token', functools.partial(fake_token, answer=retweets_answer))
+    return twitterApi.TracemapTwitterApi()
+
+
+def check_tweet_data(tweet_data):
+    response = tweet_data['response']
+    assert response['retweeter_ids'] == RETWEETERS
+    assert sorted(response['retweet_info']) == sorted(RETWEETERS[:100])
+    assert response['tweet_info']['user']['id_str'] == '1000'
+    assert tweet_data['enumeration'] == {
+        'pages': 3, 'complete': True, 'rate_limit_units': {
+            'statuses/retweets': 1, 'statuses/retweeters/ids': 3}}
+
+
+def test_get_tweet_data_follows_the_cursor(monkeypatch, fake_token):
+    api = retweets_api(monkeypatch, fake_token)
+    check_tweet_data(api.get_tweet_data('5'))
+    tokens = api._TracemapTwitterApi__pools['statuses/retweeters/ids'].tokens
+    assert [params['cursor'] for token in tokens
+            for _, _, params in token.requests] == [-1, 100, 200]
+
+
+def test_get_tweet_data_async_follows_the_cursor(monkeypatch, fake_token):
+    api = retweets_api(monkeypatch, fake_token)
+    check_tweet_data(asyncio.run(api.get_tweet_data_async('5')))
+
+
+def test_iter_tweet_data_yields_new_retweeters_per_page(monkeypatch, fake_token):
+    api = retweets_api(monkeypatch, fake_token)
+    parts = list(api.iter_tweet_data('5'))
+    assert len(parts[0]['retweeter_ids']) == 100
+    """The first page only repeats the detailed retweets"""
+    assert [part['retweeter_ids'] for part in parts[1:-1]] == \
+        [RETWEETERS[100:200], RETWEETERS[200:]]
+    assert parts[-1]['enumeration']['pages'] == 3
+
+
+def test_page_limit_marks_the_enumeration_incomplete(monkeypatch, fake_token):
+    api = retweets_api(monkeypatch, fake_token)
+    monkeypatch.setattr(twitterApi, 'MAX_RETWEETER_PAGES', 2)
+    retweeters = api.get_retweeters('5')
+    assert retweeters['response'] == RETWEETERS[:200]
+    assert retweeters['enumeration']['complete'] is False
+    """Cached pages cost no rate limit units"""
+    assert api.get_retweeters('5')['enumeration']['rate_limit_units'] == {}
+
+
+def test_async_parts_match_the_sync_parts(monkeypatch, fake_token):
+    sync_parts = list(retweets_api(monkeypatch, fake_token).iter_tweet_data('5'))
+
+    async def collect():
+        api = retweets_api(monkeypatch, fake_token)
+        return [part async for part in api.iter_tweet_data_async('5')]
+
+    assert asyncio.run(collect()) == sync_parts
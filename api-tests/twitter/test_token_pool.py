@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+import pytest
+from api.twitter.tokenPool import TokenPool
+from api.twitter.tokenProvider import RateLimit
+
+ROUTE = 'users/lookup'
+
+
+class FakeToken:
+
+    def __init__(self, route, cleanup_last_session=True):
+        self.route = route
+        self.cleanup_last_session = cleanup_last_session
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.rate_limit = RateLimit()
+
+    def request(self, duration=0.05):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(duration)
+        with self.lock:
+            self.in_flight -= 1
+
+
+def use_token(pool, duration=0.05):
+    with pool.lease() as token:
+        token.request(duration)
+        return token
+
+
+def test_requests_are_spread_over_leased_tokens():
+    pool = TokenPool(ROUTE, 3, 2, FakeToken)
+    with ThreadPoolExecutor(6) as executor:
+        tokens = list(executor.map(lambda _: use_token(pool), range(6)))
+    assert len(pool.tokens) == 3
+    assert len(set(map(id, tokens))) == 3
+    """Only the first token releases the claims of the last session"""
+    assert [token.cleanup_last_session for token in pool.tokens].count(True) == 1
+    assert all(token.max_in_flight <= 2 for token in pool.tokens)
+    stats = pool.get_stats()
+    assert stats['leases'] == 6
+    assert stats['in_flight'] == 0
+    assert stats['waiting'] == 0
+
+
+def test_waiting_requests_are_served_in_order():
+    pool = TokenPool(ROUTE, 1, 1, FakeToken)
+    served = []
+    with pool.lease():
+        threads = []
+        for position in range(5):
+            thread = threading.Thread(target=lambda position=position: (
+                use_token(pool, 0), served.append(position)))
+            thread.start()
+            threads.append(thread)
+            # every request is queued before the next one starts
+            while pool.get_stats()['waiting'] < position + 1:
+                time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+    assert served == [0, 1, 2, 3, 4]
+    """The first lease waited for the token to be leased from the store"""
+    assert pool.get_stats()['waited'] == 6
+
+
+def test_async_leases_wait_on_the_event_loop():
+    pool = TokenPool(ROUTE, 2, 1, FakeToken)
+
+    async def request():
+        async with pool.lease_async() as token:
+            await asyncio.sleep(0.05)
+            return token
+
+    async def run():
+        return await asyncio.gather(*[request() for _ in range(6)])
+
+    loop = asyncio.new_event_loop()
+    try:
+        start = time.perf_counter()
+        tokens = loop.run_until_complete(run())
+        duration = time.perf_counter() - start
+    finally:
+        loop.close()
+    assert len(set(map(id, tokens))) == 2
+    """Six requests on two tokens with one request each take three rounds"""
+    assert 0.15 <= duration < 0.5
+    assert pool.get_stats()['in_flight'] == 0
+
+
+def test_failing_token_store_fails_waiting_requests():
+    def no_tokens(route, cleanup_last_session=True):
+        raise RuntimeError("token store is down")
+
+    pool = TokenPool(ROUTE, 2, 1, no_tokens)
+    with pytest.raises(RuntimeError):
+        use_token(pool)
+    assert pool.get_stats()['waiting'] == 0
@@ -0,0 +1,100 @@
+import asyncio
+import functools
+import api.twitter.twitterApi as twitterApi
+
+ROUTE = 'statuses/lookup'
+
+
+def tweet(tweet_id):
+    return {
+        'id_str': tweet_id, 'in_reply_to_status_id_str': None, 'lang': 'en',
+        'user': {'id_str': '1'}, 'favorite_count': 0, 'retweet_count': 2,
+        'created_at': 'Mon Jun 04 08:11:05 +0000 2018',
+        'entities': {'hashtags': [], 'user_mentions': []}
+    }
+
+
+def user(user_id):
+    return {
+        'id_str': user_id, 'name': 'name', 'screen_name': 'screen_name',
+        'location': '', 'lang': 'en', 'followers_count': 1, 'friends_count': 2,
+        'statuses_count': 3, 'created_at': 'Mon Jun 04 08:11:05 +0000 2018',
+        'profile_image_url': 'http://pbs.twimg.com/profile_images/1/a.jpg'
+    }
+
+
+def lookup_answer(route, params):
+    """Answers statuses/lookup and users/lookup for every even id"""
+    if route == 'users/lookup':
+        ids = params['user_id'].split(',')
+        users = [user(user_id) for user_id in ids if int(user_id) % 2 == 0]
+        """Twitter answers an error if none of the users exists"""
+        return users or {'errors': [{'code': 17}]}
+    ids = params['id'].split(',')
+    return [tweet(tweet_id) for tweet_id in ids if int(tweet_id) % 2 == 0]
+
+
+def requested_ids(token):
+    return [(params.get('user_id') or params['id']).split(',')
+            for _, _, params in token.requests]
+
+
+def lookup_api(monkeypatch, fake_token):
+    monkeypatch.setattr(twitterApi, 'Token', functools.partial(fake_token, answer=lookup_answer))
+    return twitterApi.TracemapTwitterApi()
+
+
+def check_lookup(api, result, tweet_ids):
+    assert sorted(result['response']) == sorted(i for i in tweet_ids if int(i) % 2 == 0)
+    assert sorted(result['missing']) == sorted(i for i in tweet_ids if int(i) % 2 == 1)
+    assert result['response']['10']['retweet_count'] == '2'
+    tokens = api._TracemapTwitterApi__pools[ROUTE].tokens
+    """250 ids need three requests, spread over the tokens of the pool"""
+    assert 1 <= len(tokens) <= twitterApi.TOKENS_PER_ROUTE
+    requests = [ids for token in tokens for ids in requested_ids(token)]
+    assert len(requests) == 3
+    assert all(len(ids) <= 100 for ids in requests)
+
+
+def test_get_tweets_info_chunks_across_tokens(monkeypatch, fake_token):
+    api = lookup_api(monkeypatch, fake_token)
+    tweet_ids = [str(tweet_id) for tweet_id in range(10, 260)]
+    check_lookup(api, api.get_tweets_info(tweet_ids + tweet_ids[:5]), tweet_ids)
+
+
+def test_get_tweets_info_async_chunks_across_tokens(monkeypatch, fake_token):
+    api = lookup_api(monkeypatch, fake_token)
+    tweet_ids = [str(tweet_id) for tweet_id in range(10, 260)]
+    loop = asyncio.new_event_loop()
+    try:
+        result = loop.run_until_complete(api.get_tweets_info_async(tweet_ids))
+    finally:
+        loop.close()
+    check_lookup(api, result, tweet_ids)
+
+
+def test_get_tweets_info_without_ids(monkeypatch, fake_token):
+    api = lookup_api(monkeypatch, fake_token)
+    assert api.get_tweets_info([]) == {'response': {}, 'missing': []}
+
+
+def test_get_user_info_looks_up_chunks_across_tokens(monkeypatch, fake_token):
+    api = lookup_api(monkeypatch, fake_token)
+    user_ids = [str(user_id) for user_id in range(10, 260)]
+    result = api.get_user_info(user_ids)
+    assert sorted(result['response']) == sorted(i for i in user_ids if int(i) % 2 == 0)
+    assert sorted(result['missing']) == sorted(i for i in user_ids if int(i) % 2 == 1)
+    assert result['response']['10']['followers_count'] == 1
+    assert len(result['response']['10']) == 10
+    tokens = api._TracemapTwitterApi__pools['users/lookup'].tokens
+    assert sum(len(requested_ids(token)) for token in tokens) == 3
+
+
+def test_get_user_info_async_with_only_missing_users(monkeypatch, fake_token):
+    api = lookup_api(monkeypatch, fake_token)
+    loop = asyncio.new_event_loop()
+    try:
+        result = loop.run_until_complete(api.get_user_info_async(['11', '13']))
+    finally:
+        loop.close()
+    assert result == {'response': {}, 'missing': ['11', '13']}
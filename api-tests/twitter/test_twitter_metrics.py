@@ -0,0 +1,63 @@
+import os
+from prometheus_client import REGISTRY
+import api.metrics.prometheusMetrics as prometheusMetrics
+import api.twitter.twitterApi as twitterApi
+
+ROUTE = 'statuses/lookup'
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, dict(route=ROUTE, **labels)) or 0
+
+
+def test_retries_and_token_switches_are_counted(monkeypatch, fake_token):
+    monkeypatch.setattr(twitterApi, 'RETRY_INTERVAL', 0)
+    api = twitterApi.TracemapTwitterApi()
+    token = fake_token(ROUTE, responses=[
+        ConnectionError('timeout'),
+        {'errors': [{'code': 88}]},
+        [{'id_str': '1'}]
+    ])
+    monkeypatch.setattr(twitterApi, 'Token',
+                        lambda route, cleanup_last_session=True: token)
+    before = {
+        'ok': sample('tracemap_twitter_request_duration_seconds_count', outcome='ok'),
+        'refused': sample('tracemap_twitter_request_duration_seconds_count',
+                          outcome='token refused'),
+        'connection': sample('tracemap_twitter_request_duration_seconds_count',
+                             outcome='connection error'),
+        'switches': sample('tracemap_twitter_token_switches_total')
+    }
+    assert api._TracemapTwitterApi__request_twitter(ROUTE, {'id': '1'}) == [{'id_str': '1'}]
+    assert token.switches == 1
+    assert sample('tracemap_twitter_request_duration_seconds_count', outcome='ok') == before['ok'] + 1
+    assert sample('tracemap_twitter_request_duration_seconds_count',
+                  outcome='token refused') == before['refused'] + 1
+    assert sample('tracemap_twitter_request_duration_seconds_count',
+                  outcome='connection error') == before['connection'] + 1
+    assert sample('tracemap_twitter_token_switches_total') == before['switches'] + 1
+
+
+def test_stopped_workers_leave_the_live_token_gauges(tmpdir, monkeypatch):
+    monkeypatch.setattr(prometheusMetrics, 'MULTIPROCESS_DIR', str(tmpdir))
+    for mode in ('livesum', 'liveall', 'max'):
+        tmpdir.join('gauge_%s_4242.db' % mode).write('')
+    prometheusMetrics.mark_process_dead(4242)
+    assert sorted(os.listdir(str(tmpdir))) == ['gauge_max_4242.db']
+
+
+def test_unreadable_responses_fail_the_request(monkeypatch, fake_token, fake_response):
+    monkeypatch.setattr(twitterApi, 'RETRY_INTERVAL', 0)
+    api = twitterApi.TracemapTwitterApi()
+    html_page = fake_response(ValueError("Expecting value: line 1 column 1 (char 0)"))
+    token = fake_token(ROUTE, responses=[html_page, html_page, html_page,
+                                         [{'id_str': '1'}]])
+    monkeypatch.setattr(twitterApi, 'Token',
+                        lambda route, cleanup_last_session=True: token)
+    before = sample('tracemap_twitter_request_duration_seconds_count',
+                    outcome='unreadable')
+    response, outcome = api._TracemapTwitterApi__request(ROUTE, {'id': '1'}, '', False)
+    assert (response, outcome) == ({}, twitterApi.ERROR)
+    assert len(token.requests) == 3
+    assert sample('tracemap_twitter_request_duration_seconds_count',
+                  outcome='unreadable') == before + 3
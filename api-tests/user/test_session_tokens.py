@@ -0,0 +1,60 @@
+from collections import OrderedDict
+import pytest
+import api.user.sessionTokens as sessionTokens
+
+
+@pytest.fixture(autouse=True)
+def fresh_sessions(tmpdir, monkeypatch):
+    monkeypatch.setattr(sessionTokens, 'REVOCATIONS_FILE', str(tmpdir.join('sessions.log')))
+    monkeypatch.setattr(sessionTokens, '__secret', b'test secret')
+    monkeypatch.setattr(sessionTokens, '__revoked_at', {})
+    monkeypatch.setattr(sessionTokens, '__revocations_offset', 0)
+    monkeypatch.setattr(sessionTokens, '__validated', OrderedDict())
+
+
+def test_signed_token_is_checked_without_database():
+    token = sessionTokens.issue_token('user@tracemap.info')
+    assert sessionTokens.is_signed(token)
+    """No function for unsigned tokens is needed to validate it"""
+    assert sessionTokens.check_session('user@tracemap.info', token)
+    assert not sessionTokens.check_session('other@tracemap.info', token)
+    """A changed expiry breaks the signature"""
+    version, issued_at, expires_at, signature = token.split('.')
+    forged = '.'.join([version, issued_at, str(int(expires_at) + 1), signature])
+    assert not sessionTokens.check_session('user@tracemap.info', forged)
+
+
+def test_expired_token_is_refused(monkeypatch):
+    monkeypatch.setattr(sessionTokens, 'SESSION_LIFETIME', -1)
+    token = sessionTokens.issue_token('user@tracemap.info')
+    assert not sessionTokens.check_session('user@tracemap.info', token)
+
+
+def test_revocation_refuses_older_tokens_in_every_process(monkeypatch):
+    token = sessionTokens.issue_token('user@tracemap.info')
+    assert sessionTokens.check_session('user@tracemap.info', token)
+    sessionTokens.revoke_sessions('user@tracemap.info')
+    assert not sessionTokens.check_session('user@tracemap.info', token)
+    assert sessionTokens.check_session(
+        'user@tracemap.info', sessionTokens.issue_token('user@tracemap.info'))
+    """Another process only knows the revocations file"""
+    monkeypatch.setattr(sessionTokens, '__revoked_at', {})
+    monkeypatch.setattr(sessionTokens, '__revocations_offset', 0)
+    monkeypatch.setattr(sessionTokens, '__validated', OrderedDict())
+    assert not sessionTokens.check_session('user@tracemap.info', token)
+
+
+def test_unsigned_tokens_are_cached():
+    calls = []
+
+    def check_unsigned(email, session_token):
+        calls.append(session_token)
+        return session_token == 'saved token'
+
+    for _ in range(3):
+        assert sessionTokens.check_session('user@tracemap.info', 'saved token', check_unsigned)
+    assert not sessionTokens.check_session('user@tracemap.info', 'wrong token', check_unsigned)
+    assert calls == ['saved token', 'wrong token']
+    """Revoked users can not use their saved token anymore"""
+    sessionTokens.revoke_sessions('user@tracemap.info')
+    assert not sessionTokens.check_session('user@tracemap.info', 'saved token', check_unsigned)
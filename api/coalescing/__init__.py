@@ -0,0 +1 @@
+__all__ = ["singleFlight"]
\ No newline at end of file
@@ -0,0 +1,208 @@
+from prometheus_client import Counter
+import asyncio
+import fcntl
+import hashlib
+import json
+import threading
+import time
+import os
+
+"""
+Single flight coalescing of identical concurrent calls.
+
+Callers of the same function with the same arguments while a call is in
+flight wait for it and get its result instead of calling upstream again.
+Threads of a process share the flight in memory. Workers share it through
+lock files in FLIGHTS_DIR: the worker holding the exclusive lock of a key
+calls upstream, others wait for the lock, and the leader writes its result
+to a file for them when it sees that someone is waiting.
+
+Shared results are the same object for all callers of a process, they
+must not be modified.
+"""
+
+FLIGHTS_DIR = os.environ.get('SINGLE_FLIGHT_DIR', './flights')
+"""Seconds after which result and lock files are removed"""
+RESULT_TTL = 60
+LOCK_TTL = 60 * 60
+PRUNE_INTERVAL = 60
+
+CALLS = Counter(
+    'tracemap_single_flight_calls',
+    'Calls by whether they went upstream or shared the result of another '
+    'thread or worker', ['function', 'outcome'])
+
+
+class Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self, directory: str = FLIGHTS_DIR):
+        """
+        :param directory: the store shared with the other workers,
+        None to coalesce only within the process
+        """
+        self.directory = directory
+        self.__lock = threading.Lock()
+        self.__flights = {}
+        self.__async_flights = {}
+        self.__last_prune = 0
+        self.__stats = {
+            'calls': 0,
+            'executed': 0,
+            'shared_in_process': 0,
+            'shared_across_workers': 0
+        }
+
+    @staticmethod
+    def __key(name: str, arguments) -> str:
+        return hashlib.sha1(json.dumps(
+            [name, arguments], sort_keys=True).encode()).hexdigest()
+
+    def __count(self, name: str, outcome: str):
+        with self.__lock:
+            self.__stats['calls'] += 1
+            self.__stats[outcome] += 1
+        CALLS.labels(name, outcome).inc()
+
+    def call(self, name: str, arguments, function, *args):
+        """
+        Call function(*args) unless an identical call is in flight.  
+        :param name: name of the upstream call, used in the counters
+        :param arguments: json serializable arguments identifying the call
+        :param function: the upstream call
+        :returns: the result of the call, shared with concurrent callers
+        """
+        key = self.__key(name, arguments)
+        with self.__lock:
+            flight = self.__flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = Flight()
+                self.__flights[key] = flight
+        if not is_leader:
+            flight.done.wait()
+            self.__count(name, 'shared_in_process')
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = self.__call_across_workers(name, key, function, args)
+            return flight.result
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self.__lock:
+                del self.__flights[key]
+            flight.done.set()
+
+    def __call_across_workers(self, name: str, key: str, function, args: tuple):
+        if self.directory is None:
+            self.__count(name, 'executed')
+            return function(*args)
+        os.makedirs(self.directory, exist_ok=True)
+        lock_path = os.path.join(self.directory, key + '.lock')
+        waiting_path = os.path.join(self.directory, key + '.waiting')
+        result_path = os.path.join(self.directory, key + '.json')
+        with open(lock_path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                waiting_since = time.time()
+                open(waiting_path, 'a').close()
+                # returns when the other worker released its lock
+                fcntl.flock(lock_file, fcntl.LOCK_SH)
+                shared = self.__read_result(result_path, waiting_since)
+                if shared is not None:
+                    self.__count(name, 'shared_across_workers')
+                    return shared['result']
+                # the other worker failed or did not see us waiting
+                self.__count(name, 'executed')
+                return function(*args)
+            os.utime(lock_path)
+            self.__count(name, 'executed')
+            result = function(*args)
+            if os.path.exists(waiting_path):
+                self.__write_result(result_path, result)
+                os.remove(waiting_path)
+        self.__prune()
+        return result
+
+    @staticmethod
+    def __write_result(result_path: str, result):
+        try:
+            payload = json.dumps({'written_at': time.time(), 'result': result})
+        except (TypeError, ValueError):
+            return
+        temporary_path = '%s.%s.tmp' % (result_path, os.getpid())
+        with open(temporary_path, 'w') as result_file:
+            result_file.write(payload)
+        os.replace(temporary_path, result_path)
+
+    @staticmethod
+    def __read_result(result_path: str, written_after: float):
+        try:
+            with open(result_path) as result_file:
+                shared = json.load(result_file)
+        except (OSError, ValueError):
+            return None
+        if shared['written_at'] < written_after:
+            return None
+        return shared
+
+    def __prune(self):
+        """Remove old result and lock files, at most every PRUNE_INTERVAL"""
+        now = time.time()
+        if now - self.__last_prune < PRUNE_INTERVAL:
+            return
+        self.__last_prune = now
+        for entry in os.scandir(self.directory):
+            ttl = LOCK_TTL if entry.name.endswith('.lock') else RESULT_TTL
+            try:
+                if entry.stat().st_mtime < now - ttl:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+
+    async def call_async(self, name: str, arguments, coroutine_function, *args):
+        """
+        Like call for coroutines, coalescing the calls of the event loop.
+        The upstream call runs as a task of its own, cancelling one of
+        the waiting callers, the first one included, does not cancel it.
+        """
+        key = self.__key(name, arguments)
+        task = self.__async_flights.get(key)
+        if task is not None:
+            self.__count(name, 'shared_in_process')
+        else:
+            task = asyncio.ensure_future(coroutine_function(*args))
+            self.__async_flights[key] = task
+            self.__count(name, 'executed')
+
+            def land(task):
+                if self.__async_flights.get(key) is task:
+                    del self.__async_flights[key]
+                # nobody may be waiting, mark the exception as retrieved
+                if not task.cancelled():
+                    task.exception()
+
+            task.add_done_callback(land)
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> dict:
+        """
+        Return how many calls went upstream and how many were deduplicated.
+        :returns: dict of counters of the calling process
+        """
+        with self.__lock:
+            return dict(self.__stats)
+
+
+single_flight = SingleFlight()
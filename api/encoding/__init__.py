@@ -0,0 +1 @@
+__all__ = ["compactEncoding"]
\ No newline at end of file
@@ -0,0 +1,134 @@
+from itertools import chain
+import msgpack
+import numpy as np
+
+"""
+Compact columnar MessagePack encoding of the graph responses, sent instead
+of JSON to clients accepting MIMETYPE.
+
+Every uid is sent once in the 'uids' list, relations and rows refer to
+uids by their position. Index arrays are little endian uint32 binaries,
+which clients can view as a Uint32Array without parsing.
+
+get_followers:
+    {'uids': [uid, ...], 'users': <uint32>, 'offsets': <uint32>,
+     'followers': <uint32>}
+    the followers of uids[users[i]] are
+    uids[followers[offsets[i]:offsets[i + 1]]]
+
+get_tweet_data:
+    {'response': {'tweet_info': {...}, 'uids': [uid, ...], 'detailed': n,
+     'retweets': {key: [value per retweeter]},
+     'users': {key: [value per retweeter]}}, 'enumeration': {...}}
+    uids are the retweeter_ids, the first n of them have a retweet in
+    retweet_info. The columns follow the order of these n uids,
+    properties a retweet does not have are None
+"""
+
+MIMETYPE = 'application/x-msgpack'
+INDEX_DTYPE = np.dtype('<u4')
+
+
+def __pack(document: dict) -> bytes:
+    return msgpack.packb(document, use_bin_type=True)
+
+
+def __unpack(payload: bytes) -> dict:
+    return msgpack.unpackb(payload, raw=False)
+
+
+def __index_list(data: bytes) -> list:
+    return np.frombuffer(data, dtype=INDEX_DTYPE).tolist()
+
+
+def encode_followers(followers: dict) -> bytes:
+    """
+    Encode a get_followers response.  
+    :param followers: dict of {uid: [follower uids]}
+    :returns: the MessagePack document as bytes
+    """
+    all_followers = list(chain.from_iterable(followers.values()))
+    # the users come first, so users[i] is i
+    uids = list(dict.fromkeys(chain(followers, all_followers)))
+    index = {uid: position for position, uid in enumerate(uids)}
+    offsets = np.zeros(len(followers) + 1, dtype=INDEX_DTYPE)
+    np.cumsum([len(user_followers) for user_followers in followers.values()],
+              out=offsets[1:])
+    follower_indices = np.fromiter(map(index.__getitem__, all_followers),
+                                   dtype=INDEX_DTYPE, count=len(all_followers))
+    return __pack({
+        'uids': uids,
+        'users': np.arange(len(followers), dtype=INDEX_DTYPE).tobytes(),
+        'offsets': offsets.tobytes(),
+        'followers': follower_indices.tobytes()
+    })
+
+
+def decode_followers(payload: bytes) -> dict:
+    """Decode encode_followers output into {uid: [follower uids]}"""
+    document = __unpack(payload)
+    uids = document['uids']
+    offsets = __index_list(document['offsets'])
+    followers = list(map(uids.__getitem__, __index_list(document['followers'])))
+    return {uids[user]: followers[offsets[row]:offsets[row + 1]]
+            for row, user in enumerate(__index_list(document['users']))}
+
+
+def __columns(rows: list) -> dict:
+    """Turn a list of dicts into a dict of equally long value lists"""
+    keys = []
+    for row in rows:
+        for key in row:
+            if key not in keys:
+                keys.append(key)
+    return {key: [row.get(key) for row in rows] for key in keys}
+
+
+def encode_tweet_data(tweet_data: dict) -> bytes:
+    """
+    Encode a get_tweet_data response.  
+    :param tweet_data: the dict returned by TracemapTwitterApi.get_tweet_data
+    :returns: the MessagePack document as bytes
+    """
+    response = tweet_data.get('response')
+    extra = {key: value for key, value in tweet_data.items() if key != 'response'}
+    if not response:
+        return __pack(dict(extra, response=[]))
+    retweet_info = response['retweet_info']
+    detailed = [uid for uid in response['retweeter_ids'] if uid in retweet_info]
+    uids = detailed + [uid for uid in response['retweeter_ids']
+                       if uid not in retweet_info]
+    retweets = []
+    users = []
+    for uid in detailed:
+        retweet = dict(retweet_info[uid])
+        users.append(retweet.pop('user', {}))
+        retweets.append(retweet)
+    return __pack(dict(extra, response={
+        'tweet_info': response['tweet_info'],
+        'uids': uids,
+        'detailed': len(detailed),
+        'retweets': __columns(retweets),
+        'users': __columns(users)
+    }))
+
+
+def decode_tweet_data(payload: bytes) -> dict:
+    """Decode encode_tweet_data output into the get_tweet_data response"""
+    document = __unpack(payload)
+    response = document['response']
+    if not response:
+        return document
+    retweet_info = {}
+    for position, uid in enumerate(response['uids'][:response['detailed']]):
+        retweet = {key: values[position] for key, values
+                   in response['retweets'].items()}
+        retweet['user'] = {key: values[position] for key, values
+                           in response['users'].items()}
+        retweet_info[uid] = retweet
+    document['response'] = {
+        'tweet_info': response['tweet_info'],
+        'retweeter_ids': response['uids'],
+        'retweet_info': retweet_info
+    }
+    return document
@@ -1,14 +1,178 @@
+from api.metrics.prometheusMetrics import LOG_EVENTS
+import atexit
+import fcntl
 import json
+import re
+import threading
 import os
 
-log_folder_path = './logs/'
+"""
+Buffered ingestion of the frontend logs.
+
+save_logs serializes the log objects and queues them in memory. A writer
+thread of every process appends the queued lines of a file in one write,
+every FLUSH_INTERVAL or as soon as FLUSH_SIZE lines are waiting. Writes
+and rotations hold a lock next to the log file, so workers neither
+interleave their lines nor rotate a file twice. Once MAX_BUFFERED lines
+are waiting, new ones are dropped instead of growing the worker.
+"""
+
+log_folder_path = os.environ.get('LOG_FOLDER', './logs/')
+FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', 1))
+FLUSH_SIZE = 500
+MAX_BUFFERED = int(os.environ.get('LOG_MAX_BUFFERED', 10000))
+"""Bytes after which <name>.jsonl is rotated to <name>.jsonl.1 and so on"""
+MAX_FILE_SIZE = int(os.environ.get('LOG_MAX_FILE_SIZE', 50 * 1024 * 1024))
+BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+FILE_NAME_PATTERN = re.compile('[A-Za-z0-9_-]+')
+
+
+class LogWriter:
+
+    def __init__(self, folder: str = log_folder_path, max_buffered: int = MAX_BUFFERED,
+                 max_file_size: int = MAX_FILE_SIZE, backup_count: int = BACKUP_COUNT):
+        """
+        :param folder: the folder of the jsonl files
+        :param max_buffered: lines kept in memory before new ones are dropped
+        :param max_file_size: bytes after which a file is rotated
+        :param backup_count: rotated files kept of every log file
+        """
+        self.folder = folder
+        self.max_buffered = max_buffered
+        self.max_file_size = max_file_size
+        self.backup_count = backup_count
+        self.__condition = threading.Condition()
+        #: file name -> lines waiting to be written
+        self.__buffers = {}
+        self.__buffered = 0
+        self.__thread = None
+        self.__thread_pid = None
+        self.__stats = {
+            'accepted': 0,
+            'dropped': 0,
+            'flushed': 0,
+            'failed': 0,
+            'batches': 0,
+            'rotations': 0
+        }
+
+    def enqueue(self, file_name: str, lines: list) -> int:
+        """
+        Queue lines for a log file, as many as the buffer has room for.
+        :param file_name: the name of the log file without extension
+        :param lines: the lines to append, each ending with a newline
+        :returns: the number of accepted lines, the others were dropped
+        """
+        with self.__condition:
+            accepted = lines[:max(self.max_buffered - self.__buffered, 0)]
+            if accepted:
+                self.__buffers.setdefault(file_name, []).extend(accepted)
+                self.__buffered += len(accepted)
+            self.__count('accepted', len(accepted))
+            self.__count('dropped', len(lines) - len(accepted))
+            self.__start_thread()
+            if self.__buffered >= FLUSH_SIZE:
+                self.__condition.notify()
+        return len(accepted)
+
+    def __count(self, outcome: str, amount: int):
+        if amount:
+            self.__stats[outcome] += amount
+            LOG_EVENTS.labels(outcome).inc(amount)
+
+    def __start_thread(self):
+        """Start the writer, again in a forked worker. Caller holds the lock"""
+        if self.__thread is not None and self.__thread_pid == os.getpid() \
+                and self.__thread.is_alive():
+            return
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread_pid = os.getpid()
+        self.__thread.start()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(
+                    lambda: self.__buffered >= FLUSH_SIZE, FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """Write all queued lines, one batch per file"""
+        with self.__condition:
+            buffers, self.__buffers = self.__buffers, {}
+            self.__buffered = 0
+        for file_name, lines in buffers.items():
+            try:
+                rotated = self.__write(file_name, lines)
+            except OSError:
+                with self.__condition:
+                    self.__count('failed', len(lines))
+                continue
+            with self.__condition:
+                self.__count('flushed', len(lines))
+                self.__stats['batches'] += 1
+                self.__stats['rotations'] += rotated
+
+    def __write(self, file_name: str, lines: list) -> bool:
+        """Append lines under the file's lock, return if it was rotated"""
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, file_name + '.jsonl')
+        with open(path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            rotated = os.path.exists(path) and \
+                os.path.getsize(path) >= self.max_file_size
+            if rotated:
+                self.__rotate(path)
+            with open(path, 'a') as log_file:
+                log_file.write(''.join(lines))
+        return rotated
+
+    def __rotate(self, path: str):
+        """Shift <path>.1 to <path>.2 and so on, the oldest is overwritten"""
+        if self.backup_count < 1:
+            os.remove(path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists('%s.%s' % (path, index)):
+                os.replace('%s.%s' % (path, index), '%s.%s' % (path, index + 1))
+        os.replace(path, path + '.1')
+
+    def get_stats(self) -> dict:
+        """
+        Return the counters of this process.
+        :returns: dict of accepted, dropped, flushed and failed lines,
+        written batches, rotations and the lines waiting right now
+        """
+        with self.__condition:
+            stats = dict(self.__stats)
+            stats['buffered'] = self.__buffered
+        return stats
+
+
+log_writer = LogWriter()
+# lines still waiting when a worker stops
+atexit.register(log_writer.flush)
+
+
+def is_valid_file_name(filename) -> bool:
+    """Log files are named by the frontend, they must stay in the folder"""
+    return isinstance(filename, str) and \
+        FILE_NAME_PATTERN.fullmatch(filename) is not None
+
+
+def save_logs(log_objects, filename):
+    """Takes a list of log objects and queues them to be appended
+    as json objects to the according jsonl file"""
+    lines = [json.dumps(log_object) + "\n" for log_object in log_objects]
+    accepted = log_writer.enqueue(filename, lines)
+    return {
+        "logging": "success" if accepted == len(lines) else "dropped",
+        "accepted": accepted,
+        "dropped": len(lines) - accepted
+    }
+
 
 def save_log(log_object, filename):
-    """Takes the log params and appends them as a
+    """Takes the log params and queues them to be appended as a
     json object to the according jsonl file"""
-    if not os.path.exists(log_folder_path):
-        os.makedirs(log_folder_path)
-    with open("%s%s.jsonl" % (log_folder_path, filename), "a") as log_file:
-        log_file.write(json.dumps(log_object) + "\n")
-    return {"logging": "success"}
-    
\ No newline at end of file
+    return save_logs([log_object], filename)
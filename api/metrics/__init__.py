@@ -0,0 +1 @@
+__all__ = ["prometheusMetrics"]
\ No newline at end of file
@@ -0,0 +1,97 @@
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest, multiprocess
+import atexit
+import os
+
+"""
+Prometheus metrics of the api. With prometheus_multiproc_dir set, as
+wsgi-conf.ini and make start-asgi do, every worker writes its samples to
+that directory and /metrics sums them up over all workers. Processes
+without it, like the crawler, only keep their metrics in memory.
+Workers remove their livesum gauges when they stop, a worker uwsgi or
+uvicorn replaced would otherwise keep counting its tokens forever.
+"""
+
+MULTIPROCESS_DIR = os.environ.get('prometheus_multiproc_dir') or \
+    os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+REQUEST_DURATION = Histogram(
+    'tracemap_http_request_duration_seconds',
+    'Duration of api requests until the response is returned',
+    ['endpoint', 'method', 'status'])
+NEO4J_SESSION_DURATION = Histogram(
+    'tracemap_neo4j_session_duration_seconds',
+    'Duration of neo4j sessions, one per query or transaction',
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+NEO4J_SESSION_WAIT = Histogram(
+    'tracemap_neo4j_session_wait_seconds',
+    'Time spent waiting for a free session of the connection pool',
+    buckets=(.0001, .001, .01, .1, 1, 10))
+NEO4J_POOL_SIZE = Gauge(
+    'tracemap_neo4j_pool_size',
+    'Sessions the neo4j connection pools may open at once',
+    multiprocess_mode='livesum')
+NEO4J_SESSIONS_IN_USE = Gauge(
+    'tracemap_neo4j_sessions_in_use',
+    'Sessions of the neo4j connection pools open right now',
+    multiprocess_mode='livesum')
+TWITTER_REQUEST_DURATION = Histogram(
+    'tracemap_twitter_request_duration_seconds',
+    'Duration of single requests to twitter by route and outcome',
+    ['route', 'outcome'])
+TWITTER_RETRY_SLEEP = Counter(
+    'tracemap_twitter_retry_sleep_seconds',
+    'Seconds spent waiting before retrying a failed twitter request',
+    ['route'])
+TWITTER_TOKEN_SWITCHES = Counter(
+    'tracemap_twitter_token_switches',
+    'Switches to another token after twitter refused one',
+    ['route'])
+TWITTER_TOKEN_WAIT = Histogram(
+    'tracemap_twitter_token_wait_seconds',
+    'Time requests waited for a token of the pool of their route',
+    ['route'],
+    buckets=(.0001, .001, .01, .1, 1, 10, 60))
+TWITTER_TOKENS_LEASED = Gauge(
+    'tracemap_twitter_tokens_leased',
+    'Tokens the token pools of the route hold',
+    ['route'], multiprocess_mode='livesum')
+TWITTER_TOKENS_IN_FLIGHT = Gauge(
+    'tracemap_twitter_tokens_in_flight',
+    'Requests using a token of the pools of the route right now',
+    ['route'], multiprocess_mode='livesum')
+TWITTER_CACHE_LOOKUPS = Counter(
+    'tracemap_twitter_cache_lookups',
+    'Lookups of the twitter response cache by route and outcome',
+    ['route', 'outcome'])
+LOG_EVENTS = Counter(
+    'tracemap_log_events',
+    'Frontend log events by whether they were accepted, dropped because '
+    'the buffer was full, flushed to their file or failed to be written',
+    ['outcome'])
+
+
+def generate() -> tuple:
+    """
+    Render the metrics of all workers.
+    :returns: tuple of the exposition text and its content type
+    """
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int = None):
+    """
+    Drop the live gauges of a stopped worker from the totals.
+    :param pid: the stopped process, this process by default
+    """
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(pid or os.getpid(), MULTIPROCESS_DIR)
+
+
+# uwsgi and uvicorn run the exit handlers of workers they stop
+atexit.register(mark_process_dead)
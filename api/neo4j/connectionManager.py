@@ -0,0 +1,224 @@
+from neo4j.v1 import GraphDatabase
+from contextlib import contextmanager
+from api.metrics.prometheusMetrics import NEO4J_SESSION_DURATION, NEO4J_SESSION_WAIT, \
+    NEO4J_POOL_SIZE, NEO4J_SESSIONS_IN_USE
+import threading
+import time
+import os
+
+"""
+Owns the one neo4j driver (and with it the bolt connection pool) of a process.
+Every component asks this module for sessions instead of creating its own
+driver. The driver is bound to the pid that created it, so forked uwsgi
+workers and crawler processes transparently open their own pool instead of
+sharing sockets with their parent. A reset driver is closed once the
+sessions other threads still have open on it are released.
+"""
+
+MAX_POOL_SIZE = int(os.environ.get('NEO4J_MAX_POOL_SIZE', 50))
+RETRY_INTERVAL = 5
+
+__state_lock = threading.Lock()
+#: held while connecting, the state lock stays free for the metrics
+__connect_lock = None
+__driver = None
+__driver_pid = None
+__session_slots = None
+__metrics = {}
+#: driver -> sessions open on it
+__open_sessions = {}
+#: reset drivers closed when their last session is released
+__retired_drivers = set()
+
+
+def __reset_process_state():
+    """Reset everything bound to a process. Caller holds the state lock"""
+    global __driver, __driver_pid, __session_slots, __metrics
+    global __open_sessions, __retired_drivers, __connect_lock
+    __driver = None
+    __connect_lock = threading.Lock()
+    __driver_pid = os.getpid()
+    # drivers of the parent are never closed here, their sockets are not ours
+    __open_sessions = {}
+    __retired_drivers = set()
+    NEO4J_POOL_SIZE.set(MAX_POOL_SIZE)
+    NEO4J_SESSIONS_IN_USE.set(0)
+    __session_slots = threading.BoundedSemaphore(MAX_POOL_SIZE)
+    __metrics = {
+        'pid': __driver_pid,
+        'max_pool_size': MAX_POOL_SIZE,
+        'connects': 0,
+        'sessions_in_use': 0,
+        'sessions_in_use_peak': 0,
+        'acquisitions': 0,
+        'acquisition_wait_total': 0.0,
+        'acquisition_wait_max': 0.0
+    }
+
+
+def __create_driver(log_function):
+    """Create a driver and retry until the database is reachable"""
+    while True:
+        try:
+            driver = GraphDatabase.driver(
+                os.environ.get('NEO4J_URI'), auth=(
+                    os.environ.get('NEO4J_USER'),
+                    os.environ.get('NEO4J_PASSWORD')
+                ),
+                max_connection_pool_size=MAX_POOL_SIZE
+            )
+            log_function("Process %s connected to the database." % os.getpid())
+            return driver
+        except Exception as exc:
+            log_function("ERROR -> %s. Could not connect to the database. "
+                         "Retrying in %ss..." % (exc, RETRY_INTERVAL))
+            time.sleep(RETRY_INTERVAL)
+            continue
+
+
+def get_driver(log_function=print):
+    """
+    Return the driver of the calling process and create it on first use
+    or after a fork.
+    :param log_function: called with status messages while connecting
+    :returns: the shared neo4j driver
+    """
+    return __current_driver(log_function, False)
+
+
+def __current_driver(log_function, open_session: bool):
+    """Return the driver, counting a session on it if open_session"""
+    global __driver
+    while True:
+        with __state_lock:
+            if __driver_pid != os.getpid():
+                # inherited sockets belong to the parent, never reuse them
+                __reset_process_state()
+            if __driver is not None:
+                if open_session:
+                    __open_sessions[__driver] = __open_sessions.get(__driver, 0) + 1
+                return __driver
+            connect_lock = __connect_lock
+        # one thread connects, the others wait for its driver
+        with connect_lock:
+            with __state_lock:
+                connected = __driver is not None or __driver_pid != os.getpid()
+            if connected:
+                continue
+            driver = __create_driver(log_function)
+            with __state_lock:
+                if __driver is None and __driver_pid == os.getpid():
+                    __driver, driver = driver, None
+                    __metrics['connects'] += 1
+            if driver is not None:
+                # set_driver installed another one meanwhile
+                __close(driver)
+
+
+def __release_driver(driver):
+    """Count a session of driver as closed, close it if it was reset"""
+    with __state_lock:
+        if driver not in __open_sessions:
+            # opened before a fork
+            return
+        __open_sessions[driver] -= 1
+        if __open_sessions[driver] > 0:
+            return
+        del __open_sessions[driver]
+        if driver not in __retired_drivers:
+            return
+        __retired_drivers.discard(driver)
+    __close(driver)
+
+
+def __close(driver):
+    try:
+        driver.close()
+    except Exception:
+        pass
+
+
+def set_driver(driver):
+    """
+    Use the given driver in the calling process instead of connecting,
+    e.g. a local stand in for benchmarks.
+    :param driver: object with a session() method like the neo4j driver
+    """
+    global __driver
+    with __state_lock:
+        if __driver_pid != os.getpid():
+            __reset_process_state()
+        __driver = driver
+
+
+def reset_driver():
+    """
+    Drop the driver of the calling process, e.g. after an AddressError.
+    The next session will connect again. Sessions other threads have open
+    on the old driver keep working, it is closed after the last of them.
+    """
+    global __driver
+    with __state_lock:
+        if __driver_pid != os.getpid():
+            __reset_process_state()
+        driver, __driver = __driver, None
+        if driver is None:
+            return
+        if driver in __open_sessions:
+            __retired_drivers.add(driver)
+            return
+    __close(driver)
+
+
+@contextmanager
+def session(log_function=print):
+    """
+    Open a session on the shared driver. The number of concurrently open
+    sessions is bounded by the pool size and the time spent waiting for a
+    free slot is recorded in the pool metrics.
+    :param log_function: called with status messages while connecting
+    """
+    driver = __current_driver(log_function, True)
+    slots = __session_slots
+    wait_start = time.perf_counter()
+    slots.acquire()
+    wait_time = time.perf_counter() - wait_start
+    NEO4J_SESSION_WAIT.observe(wait_time)
+    with __state_lock:
+        __metrics['acquisitions'] += 1
+        __metrics['acquisition_wait_total'] += wait_time
+        __metrics['acquisition_wait_max'] = max(
+            __metrics['acquisition_wait_max'], wait_time)
+        __metrics['sessions_in_use'] += 1
+        NEO4J_SESSIONS_IN_USE.inc()
+        __metrics['sessions_in_use_peak'] = max(
+            __metrics['sessions_in_use_peak'], __metrics['sessions_in_use'])
+    session_start = time.perf_counter()
+    try:
+        with driver.session() as db_session:
+            yield db_session
+    finally:
+        NEO4J_SESSION_DURATION.observe(time.perf_counter() - session_start)
+        with __state_lock:
+            if slots is __session_slots:
+                __metrics['sessions_in_use'] -= 1
+                NEO4J_SESSIONS_IN_USE.dec()
+        slots.release()
+        __release_driver(driver)
+
+
+def get_pool_metrics() -> dict:
+    """
+    Return the pool metrics of the calling process.
+    :returns: dict with pool size, sessions in use and acquisition wait times
+    """
+    with __state_lock:
+        if __driver_pid != os.getpid():
+            __reset_process_state()
+        metrics = dict(__metrics)
+    if metrics['acquisitions']:
+        metrics['acquisition_wait_avg'] = \
+            metrics['acquisition_wait_total'] / metrics['acquisitions']
+    else:
+        metrics['acquisition_wait_avg'] = 0.0
+    return metrics
@@ -0,0 +1,323 @@
+from collections import OrderedDict, deque
+import threading
+import secrets
+import fcntl
+import time
+import sys
+import os
+
+"""
+Cache for the follower subgraphs returned by neo4jApi.get_followers.
+
+For every user the cache stores the followers found so far together with
+the set of uids that were already checked as possible followers. A request
+for a uid set only queries the database for the users and candidates that
+were not checked yet, so overlapping traces reuse each others results.
+
+The crawler's Writer publishes "followers of user X changed" events by
+appending the uid to a shared events file. Every cache reads new events
+before it answers a request and drops the entries of the changed users.
+A deleted user also takes its relations out of the follower lists of the
+users it followed, the Writer publishes those users together with it.
+A full events file is renamed to EVENTS_FILE.1, readers tell the files
+apart by the generation in their first line and finish the renamed one
+before starting the new one. Only a reader that missed two rotations
+loses events.
+"""
+
+EVENTS_FILE = os.environ.get('FOLLOWER_EVENTS_FILE', './events/followers.log')
+MAX_EVENTS_FILE_SIZE = 10 * 1024 * 1024
+
+
+def publish_followers_changed(user_id: str):
+    """
+    Tell all follower caches that the followers of a user changed.
+    :param user_id: the uid of the user whose followers were rewritten
+    """
+    __publish([user_id])
+
+
+def publish_user_deleted(user_id: str, followed_ids: list):
+    """
+    Tell all follower caches that a user and its relations were deleted.
+    :param user_id: the uid of the deleted user
+    :param followed_ids: the uids of the users it followed, their
+    followers changed as well
+    """
+    __publish([user_id] + list(followed_ids))
+
+
+def __publish(user_ids: list):
+    """Append the uids to the events file in one write"""
+    events_folder = os.path.dirname(EVENTS_FILE)
+    if events_folder and not os.path.exists(events_folder):
+        os.makedirs(events_folder, exist_ok=True)
+    # writers of all processes append and rotate one at a time
+    with open(EVENTS_FILE + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        line = "".join("%s\n" % user_id for user_id in user_ids)
+        if os.path.exists(EVENTS_FILE) and \
+                os.path.getsize(EVENTS_FILE) > MAX_EVENTS_FILE_SIZE:
+            os.replace(EVENTS_FILE, EVENTS_FILE + '.1')
+        if not os.path.exists(EVENTS_FILE):
+            # inodes are reused, the header tells the files apart
+            line = "#%s\n%s" % (secrets.token_hex(8), line)
+        with open(EVENTS_FILE, 'a') as events_file:
+            events_file.write(line)
+
+
+def __open_events(path: str):
+    """
+    Open an events file and read its generation header.  
+    :returns: tuple of the file, its generation or None for files without
+    a header, and the offset of the first event
+    """
+    events = open(path, 'rb')
+    header = events.readline()
+    if header.startswith(b'#') and header.endswith(b'\n'):
+        return events, header[1:-1].decode(), len(header)
+    return events, None, 0
+
+
+def events_position(events_file: str) -> tuple:
+    """Return the (generation, offset) of the end of the events file"""
+    try:
+        events, generation, _ = __open_events(events_file)
+    except OSError:
+        return None, 0
+    with events:
+        return generation, os.fstat(events.fileno()).st_size
+
+
+def __read_lines(path: str, generation, offset: int):
+    """
+    Read the complete lines after offset of the file of a generation.  
+    :returns: tuple of the offset after the last complete line and the
+    lines, None if path is not a file of that generation
+    """
+    try:
+        events, file_generation, first_event = __open_events(path)
+    except OSError:
+        return None
+    with events:
+        size = os.fstat(events.fileno()).st_size
+        if file_generation != generation or size < offset:
+            return None
+        offset = max(offset, first_event)
+        events.seek(offset)
+        data = events.read(size - offset)
+    # only complete lines, a partial one is read again next time
+    complete = data[:data.rfind(b'\n') + 1]
+    return offset + len(complete), \
+        [line for line in complete.decode().splitlines() if line]
+
+
+def read_events(events_file: str, position: tuple) -> tuple:
+    """
+    Read the uids published since position, across a rotation.  
+    :param events_file: the file publish_followers_changed writes to
+    :param position: (generation, offset) from events_position or the
+    last call
+    :returns: tuple of the new position, the uids and False if events
+    were lost, in which case the position is the end of the file
+    """
+    generation, offset = position
+    read = __read_lines(events_file, generation, offset)
+    if read is not None:
+        return (generation, read[0]), read[1], True
+    try:
+        events, current_generation, _ = __open_events(events_file)
+        events.close()
+    except OSError:
+        return position, [], True
+    rotated = __read_lines(events_file + '.1', generation, offset)
+    if rotated is None and (generation is not None or offset > 0):
+        return events_position(events_file), [], False
+    # the file did not exist or was rotated since the last call
+    read = __read_lines(events_file, current_generation, 0)
+    if read is None:
+        return events_position(events_file), [], False
+    uids = rotated[1] if rotated is not None else []
+    return (current_generation, read[0]), uids + read[1], True
+
+
+class FollowerCache:
+
+    def __init__(self, max_users: int = 100000, ttl: int = 3600,
+                 events_file: str = EVENTS_FILE):
+        """
+        :param max_users: number of users kept before the least recently
+        used ones are evicted
+        :param ttl: seconds after which a users entry is refetched
+        :param events_file: the file the Writer publishes its events to
+        """
+        self.max_users = max_users
+        self.ttl = ttl
+        self.events_file = events_file
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__events_lock = threading.Lock()
+        self.__events_position = None
+        #: increased with every invalidation
+        self.__version = 0
+        #: (version, uid) of recent invalidations, uid None drops everything
+        self.__invalidation_log = deque(maxlen=10000)
+        self.__stats = {
+            'hits': 0,
+            'partial_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    def get_followers(self, user_ids: list, fetch_relations) -> dict:
+        """
+        Return the followers of every user among user_ids.
+        :param user_ids: the uids of the subgraph
+        :param fetch_relations: function taking a list of start uids and a
+        list of end uids and returning (start_uid, end_uid) tuples of all
+        FOLLOWS relations between them
+        :returns: dict of {uid: [follower uids]} like neo4jApi.get_followers
+        """
+        uids = frozenset(user_ids)
+        self.__read_events()
+        followers = {}
+        missing_users = []
+        missing_candidates = set()
+        with self.__lock:
+            version = self.__version
+            now = time.time()
+            # checked sets are shared between users, compare each only once
+            unchecked_lookup = {}
+            for uid in uids:
+                entry = self.__entries.get(uid)
+                if entry is not None and now - entry['timestamp'] > self.ttl:
+                    del self.__entries[uid]
+                    self.__stats['evictions'] += 1
+                    entry = None
+                if entry is None:
+                    self.__stats['misses'] += 1
+                    missing_users.append(uid)
+                    missing_candidates = set(uids)
+                    continue
+                self.__entries.move_to_end(uid)
+                user_followers = entry['followers'] & uids
+                if user_followers:
+                    followers[uid] = user_followers
+                checked = entry['checked']
+                if id(checked) not in unchecked_lookup:
+                    unchecked_lookup[id(checked)] = uids - checked
+                unchecked = unchecked_lookup[id(checked)]
+                if unchecked:
+                    self.__stats['partial_hits'] += 1
+                    missing_users.append(uid)
+                    missing_candidates |= unchecked
+                else:
+                    self.__stats['hits'] += 1
+        if missing_users:
+            fetched = {uid: set() for uid in missing_users}
+            relations = fetch_relations(sorted(missing_candidates),
+                                        sorted(missing_users))
+            for start_uid, end_uid in relations:
+                if end_uid in fetched:
+                    fetched[end_uid].add(start_uid)
+            for uid, user_followers in fetched.items():
+                if user_followers:
+                    followers[uid] = followers.get(uid, set()) | user_followers
+            self.__read_events()
+            self.__fill(fetched, frozenset(missing_candidates), version)
+        return {uid: list(user_followers)
+                for uid, user_followers in followers.items()}
+
+    def __fill(self, fetched: dict, candidates: frozenset, version: int):
+        """
+        Store fetched followers, except for users that were invalidated
+        while the relations were fetched.
+        """
+        with self.__lock:
+            skipped = set()
+            if version != self.__version:
+                log = self.__invalidation_log
+                if not log or log[0][0] > version + 1:
+                    # the log does not reach back far enough
+                    return
+                for logged_version, uid in log:
+                    if logged_version > version:
+                        if uid is None:
+                            return
+                        skipped.add(uid)
+            now = time.time()
+            merged_checked = {}
+            for uid, user_followers in fetched.items():
+                if uid in skipped:
+                    continue
+                entry = self.__entries.get(uid)
+                if entry is None:
+                    self.__entries[uid] = {
+                        'timestamp': now,
+                        'followers': user_followers,
+                        'checked': candidates
+                    }
+                    continue
+                checked = entry['checked']
+                if id(checked) not in merged_checked:
+                    merged_checked[id(checked)] = checked | candidates
+                entry['checked'] = merged_checked[id(checked)]
+                entry['followers'] = entry['followers'] | user_followers
+            while len(self.__entries) > self.max_users:
+                self.__entries.popitem(last=False)
+                self.__stats['evictions'] += 1
+
+    def invalidate(self, user_id: str):
+        """Drop the cached followers of one user"""
+        with self.__lock:
+            self.__version += 1
+            self.__invalidation_log.append((self.__version, user_id))
+            self.__stats['invalidations'] += 1
+            self.__entries.pop(user_id, None)
+
+    def clear(self):
+        """Drop all cached followers"""
+        with self.__lock:
+            self.__version += 1
+            self.__invalidation_log.append((self.__version, None))
+            self.__stats['invalidations'] += len(self.__entries)
+            self.__entries.clear()
+
+    def __read_events(self):
+        """Apply the events the Writer published since the last call"""
+        with self.__events_lock:
+            if self.__events_position is None:
+                # older events are reflected in the empty cache already
+                self.__events_position = events_position(self.events_file)
+                return
+            self.__events_position, uids, complete = read_events(
+                self.events_file, self.__events_position)
+            if not complete:
+                self.clear()
+            for uid in uids:
+                self.invalidate(uid)
+
+    def get_stats(self) -> dict:
+        """
+        Return hit ratio and memory use of the cache.
+        :returns: dict of counters, number of cached users and relations
+        and the estimated size of the cached sets in bytes
+        """
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['users'] = len(self.__entries)
+            stats['relations'] = 0
+            estimated_bytes = sys.getsizeof(self.__entries)
+            checked_sets = {}
+            for uid, entry in self.__entries.items():
+                stats['relations'] += len(entry['followers'])
+                estimated_bytes += sys.getsizeof(entry['followers'])
+                checked_sets[id(entry['checked'])] = entry['checked']
+            for checked in checked_sets.values():
+                estimated_bytes += sys.getsizeof(checked)
+            stats['checked_sets'] = len(checked_sets)
+            stats['estimated_bytes'] = estimated_bytes
+        lookups = stats['hits'] + stats['partial_hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,232 @@
+from array import array
+import numpy as np
+import threading
+import shutil
+import json
+import time
+import os
+
+import api.neo4j.connectionManager as connectionManager
+import api.neo4j.followerCache as followerCache
+import api.neo4j.subgraphEngine as subgraphEngine
+
+"""
+Read only snapshot of all FOLLOWS relations in compressed sparse row form.
+
+A snapshot directory contains
+    uids.bin       sorted int64 uids, the position of a uid is its index
+    offsets.bin    int64, followers of index i are followers[offsets[i]:offsets[i+1]]
+    followers.bin  sorted follower indices per user (int32, int64 if needed)
+    meta.json      creation time, sizes and the follower events position
+The files are memory mapped read only, so all uwsgi workers share the same
+pages of the page cache. The current snapshot is the target of the
+'current' symlink in the base directory, which the exporter swaps atomically.
+
+Users whose followers the Writer changed after the export (known from the
+follower events file) are reported as missing, so the caller can read
+them from neo4j. A deleted user is published together with the users it
+followed, their rows still contain it and are reported as missing too. Readers follow the events file across one rotation, a
+snapshot whose reader missed two rotations is not used until the next
+export, get_stats counts these in events_lost. The export therefore
+has to run more often than the events file rotates.
+"""
+
+ALL_USERS_QUERY = 'MATCH (u:USER) RETURN u.uid AS uid'
+ALL_FOLLOWERS_QUERY = 'MATCH (u:USER) WHERE (u)<-[:FOLLOWS]-() ' +\
+    'RETURN u.uid AS uid, [(f:USER)-[:FOLLOWS]->(u) | f.uid] AS followers'
+
+
+def export_snapshot(base_directory: str, log_function=print) -> str:
+    """
+    Dump all FOLLOWS relations of the database into a new snapshot and
+    make it the current one. Older snapshots except the previous one
+    are deleted.
+    :param base_directory: the directory holding the snapshots
+    :param log_function: called with progress messages
+    :returns: the path of the new snapshot
+    """
+    created = time.time()
+    directory = os.path.join(base_directory, 'snapshot-%d' % created)
+    os.makedirs(directory)
+    # later events are applied on top of the snapshot by the readers
+    events_generation, events_offset = followerCache.events_position(
+        followerCache.EVENTS_FILE)
+
+    # an array of python ints needs a fraction of the memory of a list
+    uid_buffer = array('q')
+    with connectionManager.session(log_function) as session:
+        for record in session.run(ALL_USERS_QUERY):
+            uid = subgraphEngine.parse_uid(record['uid'])
+            if uid is not None:
+                uid_buffer.append(uid)
+    uids = np.unique(np.frombuffer(uid_buffer, dtype=np.int64))
+    del uid_buffer
+    log_function("%s users read." % len(uids))
+    index_typecode = 'i' if len(uids) < 2 ** 31 else 'q'
+    index_dtype = np.dtype(index_typecode)
+
+    # rows arrive in database order and are reordered by index afterwards
+    row_starts = np.zeros(len(uids), dtype=np.int64)
+    row_lengths = np.zeros(len(uids), dtype=np.int64)
+    rows_path = os.path.join(directory, 'rows.tmp')
+    num_relations = 0
+    with open(rows_path, 'wb') as rows_file:
+        with connectionManager.session(log_function) as session:
+            for record in session.run(ALL_FOLLOWERS_QUERY):
+                indices, _ = subgraphEngine.to_indices(uids, [record['uid']])
+                if len(indices) == 0:
+                    continue
+                row, _ = subgraphEngine.to_indices(uids, record['followers'])
+                row = np.unique(row).astype(index_dtype)
+                row_starts[indices[0]] = num_relations
+                row_lengths[indices[0]] = len(row)
+                row.tofile(rows_file)
+                num_relations += len(row)
+    log_function("%s relations read." % num_relations)
+
+    offsets = np.zeros(len(uids) + 1, dtype=np.int64)
+    np.cumsum(row_lengths, out=offsets[1:])
+    with open(rows_path, 'rb') as rows_file, \
+            open(os.path.join(directory, 'followers.bin'), 'wb') as followers_file:
+        for index in np.flatnonzero(row_lengths):
+            rows_file.seek(int(row_starts[index]) * index_dtype.itemsize)
+            followers_file.write(
+                rows_file.read(int(row_lengths[index]) * index_dtype.itemsize))
+    os.remove(rows_path)
+    uids.tofile(os.path.join(directory, 'uids.bin'))
+    offsets.tofile(os.path.join(directory, 'offsets.bin'))
+    with open(os.path.join(directory, 'meta.json'), 'w') as meta_file:
+        json.dump({
+            'created': created,
+            'users': len(uids),
+            'relations': num_relations,
+            'index_typecode': index_typecode,
+            'events_file': followerCache.EVENTS_FILE,
+            'events_generation': events_generation,
+            'events_offset': events_offset
+        }, meta_file)
+
+    current_link = os.path.join(base_directory, 'current')
+    temporary_link = current_link + '.tmp'
+    if os.path.lexists(temporary_link):
+        os.remove(temporary_link)
+    previous = os.readlink(current_link) if os.path.islink(current_link) else None
+    os.symlink(os.path.basename(directory), temporary_link)
+    os.replace(temporary_link, current_link)
+    for name in os.listdir(base_directory):
+        if name.startswith('snapshot-') and \
+                name not in (os.path.basename(directory), previous):
+            shutil.rmtree(os.path.join(base_directory, name))
+    log_function("Snapshot %s is now current." % directory)
+    return directory
+
+
+class FollowerSnapshot:
+
+    def __init__(self, base_directory: str):
+        """
+        :param base_directory: the directory export_snapshot writes to
+        """
+        self.base_directory = base_directory
+        self.__lock = threading.Lock()
+        self.__state = None
+        self.__stats = {
+            'served_users': 0,
+            'missing_users': 0,
+            'reloads': 0,
+            'events_lost': 0
+        }
+
+    def __open(self, directory: str) -> dict:
+        """Memory map the files of one snapshot"""
+        with open(os.path.join(directory, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+        state = {'directory': directory, 'meta': meta, 'stale': set(),
+                 'events_position': (meta.get('events_generation'),
+                                     meta['events_offset']),
+                 'usable': True}
+        for name, typecode in (('uids', 'q'), ('offsets', 'q'),
+                               ('followers', meta['index_typecode'])):
+            path = os.path.join(directory, name + '.bin')
+            if os.path.getsize(path) == 0:
+                # empty files can not be mapped
+                state[name] = np.empty(0, dtype=np.dtype(typecode))
+            else:
+                state[name] = np.memmap(path, dtype=np.dtype(typecode), mode='r')
+        return state
+
+    def __current_state(self):
+        """Return the state of the current snapshot, reopen it if it changed"""
+        current_link = os.path.join(self.base_directory, 'current')
+        try:
+            directory = os.path.join(self.base_directory,
+                                     os.readlink(current_link))
+        except OSError:
+            return None
+        with self.__lock:
+            if self.__state is None or self.__state['directory'] != directory:
+                try:
+                    self.__state = self.__open(directory)
+                    self.__stats['reloads'] += 1
+                except (OSError, ValueError, KeyError):
+                    self.__state = None
+                    return None
+            state = self.__state
+            if state['usable']:
+                self.__read_events(state)
+        return state if state['usable'] else None
+
+    def __read_events(self, state: dict):
+        """Collect users whose followers changed after the export"""
+        state['events_position'], uids, complete = followerCache.read_events(
+            state['meta']['events_file'], state['events_position'])
+        if not complete:
+            # changes are unknown until the next snapshot
+            state['usable'] = False
+            self.__stats['events_lost'] += 1
+        state['stale'].update(uids)
+
+    def get_relations(self, start_uids: list, end_uids: list) -> tuple:
+        """
+        Return the FOLLOWS relations from start_uids to end_uids.
+        :param start_uids: uids of the possible followers
+        :param end_uids: uids of the followed users
+        :returns: list of (start_uid, end_uid) tuples and the list of
+        end_uids the snapshot can not answer (changed since the export
+        or no snapshot available)
+        """
+        state = self.__current_state()
+        if state is None:
+            self.__stats['missing_users'] += len(end_uids)
+            return [], list(end_uids)
+        missing = [end_uid for end_uid in end_uids
+                   if end_uid in state['stale']]
+        served = [end_uid for end_uid in end_uids
+                  if end_uid not in state['stale']]
+        followers = subgraphEngine.induced_subgraph(
+            state['uids'], state['offsets'], state['followers'],
+            start_uids, served)
+        relations = [(follower, end_uid)
+                     for end_uid, user_followers in followers.items()
+                     for follower in user_followers]
+        self.__stats['served_users'] += len(end_uids) - len(missing)
+        self.__stats['missing_users'] += len(missing)
+        return relations, missing
+
+    def get_stats(self) -> dict:
+        """
+        Return information about the current snapshot.
+        :returns: dict with the snapshot meta data and usage counters
+        """
+        state = self.__current_state()
+        stats = dict(self.__stats)
+        if state is None:
+            stats['available'] = False
+            return stats
+        stats['available'] = True
+        stats['directory'] = state['directory']
+        stats['created'] = state['meta']['created']
+        stats['users'] = state['meta']['users']
+        stats['relations'] = state['meta']['relations']
+        stats['stale_users'] = len(state['stale'])
+        return stats
@@ -1,125 +1,258 @@
-from neo4j.v1 import GraphDatabase, basic_auth
+import api.neo4j.connectionManager as connectionManager
+from api.coalescing.singleFlight import single_flight
+from api.neo4j.followerCache import FollowerCache
+from api.neo4j.followerSnapshot import FollowerSnapshot
+import hashlib
 import json
 import time
 import os
 import math
 
-"""This function accesses the database with a query 'request_string' """
-def __request_database(request_string):
-    uri = os.environ.get('NEO4J_URI')
-    driver = GraphDatabase.driver(uri, auth=(os.environ.get('NEO4J_USER'),
-                                  os.environ.get('NEO4J_PASSWORD')))
-    with driver.session() as session:
+"""This function accesses the database with a query 'request_string'
+and an optional dictionary of query 'parameters' """
+def __request_database(request_string, parameters=None):
+    with connectionManager.session() as session:
         with session.begin_transaction() as transaction:
-            return transaction.run(request_string).data()
-
-"""This function creates a lookup map between Twitter uids and neo4j node ids"""
-def __build_lookup_dictionary(node_list):
-    result_dictionary = {}
-    for node in node_list:
-        result_dictionary.update({node.id:node.properties['uid']})
-    return result_dictionary
-
-"""This function formats a property dictionary to insert it in a Cypher query"""
-def __format_property_string(property_dictionary):
-    if property_dictionary == {}:
-        return '{}'
-    property_string = '{'
-    for key in property_dictionary.keys():
-        value = property_dictionary[key]
-        property_string += key + ': '
-        if type(value) is str:
-            property_string += '"' + value + '", '
-        else:
-            property_string += str(value) + ', '
-    property_string = property_string[:-2]
-    property_string += '}'
-    return property_string
+            return transaction.run(request_string, parameters or {}).data()
+
+"""This function accesses the database like __request_database, but yields
+the records while the driver receives them instead of collecting them"""
+def __stream_database(request_string, parameters=None):
+    with connectionManager.session() as session:
+        for record in session.run(request_string, parameters or {}):
+            yield record
+
+"""This query returns one [start_uid, end_uid] row per FOLLOWS relation
+from a user in $start_uids to a user in $end_uids. Every user is looked up
+through the uid index and the query text stays the same for every request,
+so its plan is cached"""
+FOLLOWERS_QUERY = 'UNWIND $start_uids AS uid ' +\
+    'MATCH (f:USER {uid: uid})-[:FOLLOWS]->(u:USER) ' +\
+    'WHERE u.uid IN $end_uids ' +\
+    'RETURN f.uid AS start_uid, u.uid AS end_uid'
+
+"""Same relations as FOLLOWERS_QUERY, aggregated to one row per user"""
+FOLLOWERS_ADJACENCY_QUERY = 'UNWIND $start_uids AS uid ' +\
+    'MATCH (f:USER {uid: uid})-[:FOLLOWS]->(u:USER) ' +\
+    'WHERE u.uid IN $end_uids ' +\
+    'RETURN u.uid AS end_uid, COLLECT(f.uid) AS start_uids'
+
+"""Number of NDJSON lines sent to the client in one chunk"""
+STREAM_CHUNK_SIZE = 500
+
+"""Follower subgraphs of earlier requests, invalidated by the crawler"""
+follower_cache = FollowerCache(
+    max_users=int(os.environ.get('FOLLOWER_CACHE_SIZE', 100000)),
+    ttl=int(os.environ.get('FOLLOWER_CACHE_TTL', 3600)))
+
+"""Memory mapped snapshot of all relations, written by
+bin/exportFollowerSnapshot.py"""
+follower_snapshot = FollowerSnapshot(
+    os.environ.get('FOLLOWER_SNAPSHOT_DIR', './snapshot'))
+
+"""This function gets the relations from users in start_uids to users
+in end_uids as (start_uid, end_uid) tuples. The snapshot answers for all
+users it knows, users written after the export are read from the database"""
+def __fetch_relations(start_uids, end_uids):
+    relations, missing_end_uids = follower_snapshot.get_relations(
+        start_uids, end_uids)
+    if not missing_end_uids:
+        return relations
+    database_response = __request_database(FOLLOWERS_QUERY, {
+        'start_uids': start_uids,
+        'end_uids': missing_end_uids
+    })
+    return relations + [(relation['start_uid'], relation['end_uid'])
+                        for relation in database_response]
 
 """This function gets all relations in the database between a set of users"""
 def get_followers(user_ids):
-    followers_dictionary = {}
-    database_query = ''
-    first_iteration = True
     if len(user_ids) <= 1:
-        return followers_dictionary
-    for uid in user_ids:
-        if first_iteration:
-            database_query += 'MATCH (u:USER) WHERE u.uid = "' + uid + '" '
-            first_iteration = False
-            continue
-        database_query += 'OR u.uid = "' + uid + '" '
-    database_query += 'WITH COLLECT(u) AS us UNWIND us AS u1 UNWIND us AS u2 '
-    database_query += 'MATCH (u1)-[r]->(u2) RETURN COLLECT(r), us;'
-    database_response = __request_database(database_query)
-    if database_response == []:
-        return followers_dictionary
-    dictionary_lookup = __build_lookup_dictionary(database_response[0]['us'])
-    for relation in database_response[0]['COLLECT(r)']:
-        user = dictionary_lookup[relation.end]
-        follower = dictionary_lookup[relation.start]
-        if user not in followers_dictionary:
-            followers_dictionary.update({user:[follower]})
+        return {}
+    # identical concurrent requests of all threads and workers share one read
+    return single_flight.call(
+        'get_followers', sorted(set(user_ids)), __get_followers, user_ids)
+
+
+def __get_followers(user_ids):
+    return follower_cache.get_followers(user_ids, __fetch_relations)
+
+
+"""This query returns the timestamp of the last write of every user in
+$uids that exists in the database"""
+USER_TIMESTAMPS_QUERY = 'UNWIND $uids AS uid ' +\
+    'MATCH (user:USER {uid: uid}) ' +\
+    'RETURN user.uid AS uid, user.timestamp AS timestamp'
+
+"""Seconds within which the crawler publishes a written user to the
+follower caches, more recent writes may not be in a cached subgraph yet"""
+VERSION_GRACE = int(os.environ.get('FOLLOWERS_VERSION_GRACE', 10))
+
+def __numeric_timestamp(timestamp):
+    """Timestamps are ints written by the crawler or strings of profiles"""
+    try:
+        return float(timestamp)
+    except (TypeError, ValueError):
+        return 0.0
+
+"""This function returns the version of the follower subgraph of a set of
+users, derived from the timestamps the crawler writes with their followers.
+'etag' changes whenever one of the users is written and is None while a
+write is too recent to rely on, 'version' is the since_version to send
+with the next request to only get users written after this one"""
+def get_followers_version(user_ids, since_version=None):
+    uids = sorted(set(str(uid) for uid in user_ids))
+    database_response = __request_database(USER_TIMESTAMPS_QUERY, {'uids': uids})
+    timestamps = {row['uid']: row['timestamp'] for row in database_response}
+    now = time.time()
+    settled = now - VERSION_GRACE
+    etag = None
+    if not any(settled < __numeric_timestamp(timestamp) <= now
+               for timestamp in timestamps.values()):
+        etag = hashlib.sha1(json.dumps(
+            [sorted(timestamps.items()), since_version], default=str
+        ).encode()).hexdigest()
+    return {
+        'etag': etag,
+        'version': math.floor(settled),
+        'timestamps': timestamps
+    }
+
+"""This function returns the followers of the users that were written at
+or after since_version, users without followers get an empty list. The
+timestamps are those of get_followers_version"""
+def get_followers_since(user_ids, since_version, timestamps):
+    changed = [uid for uid, timestamp in timestamps.items()
+               if __numeric_timestamp(timestamp) >= since_version]
+    if not changed:
+        return {}
+    followers = get_followers(user_ids)
+    return {uid: followers.get(uid, []) for uid in changed}
+
+
+"""This function streams the relations between a set of users as NDJSON.
+Every line is either one [follower, user] pair or, with group_by_user,
+one {user: [followers]} object. Lines are yielded in chunks while the
+records arrive, so memory use does not grow with the size of the graph"""
+def stream_followers(user_ids, group_by_user=False):
+    if len(user_ids) <= 1:
+        return
+    uids = sorted(set(user_ids))
+    parameters = {'start_uids': uids, 'end_uids': uids}
+    if group_by_user:
+        records = __stream_database(FOLLOWERS_ADJACENCY_QUERY, parameters)
+    else:
+        records = __stream_database(FOLLOWERS_QUERY, parameters)
+    chunk = []
+    for record in records:
+        if group_by_user:
+            line = {record['end_uid']: record['start_uids']}
         else:
-            followers_dictionary[user].append(follower)
-    return followers_dictionary
+            line = [record['start_uid'], record['end_uid']]
+        chunk.append(json.dumps(line))
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+"""This query sets the properties of every existing user in $rows, a list
+of {uid, properties} maps, and returns the uids that were found"""
+ADD_USER_INFO_QUERY = 'UNWIND $rows AS row ' +\
+    'MATCH (user:USER {uid: row.uid}) ' +\
+    'SET user += row.properties ' +\
+    'RETURN user.uid AS uid'
+
+"""Number of users written per statement by add_user_info_bulk"""
+USER_INFO_CHUNK_SIZE = 1000
+
+"""This function writes the profiles of a TwitterApi.get_user_info response
+in one transaction and returns {uid: True/False} for every user.
+It does not create new nodes, users missing in the database get False"""
+def add_user_info_bulk(user_info):
+    if 'response' not in user_info.keys():
+        return {}
+    rows = [{'uid': str(user_id), 'properties': properties}
+            for user_id, properties in user_info['response'].items()]
+    written = set()
+    with connectionManager.session() as session:
+        with session.begin_transaction() as transaction:
+            for index in range(0, len(rows), USER_INFO_CHUNK_SIZE):
+                chunk = rows[index:index + USER_INFO_CHUNK_SIZE]
+                database_response = transaction.run(
+                    ADD_USER_INFO_QUERY, {'rows': chunk}).data()
+                written.update(row['uid'] for row in database_response)
+    return {row['uid']: row['uid'] in written for row in rows}
 
 
-"""This function does not create new nodes, users must be in database already"""
+"""This function does not create new nodes, users must be in database already.
+It returns False unless the info of every user was written"""
 def add_user_info(user_info):
     if 'response' not in user_info.keys():
         """The user_info dictionary does not contain the 'response' key..."""
         return False
-    success = True
-    for user_id in user_info['response'].keys():
-        database_query = 'MATCH (user:USER {uid: "'+user_id+'"}) ' +\
-            'SET user += ' +\
-            __format_property_string(user_info['response'][user_id]) + ' ' +\
-            'RETURN user'
-        database_response = __request_database(database_query)
-        if database_response == []:
-            """So far, it does not check if info was written correctly"""
-            success = False
-    return success
+    return all(add_user_info_bulk(user_info).values())
+
+
+"""These queries return all properties or only the $properties of every
+user in $uids that exists in the database"""
+USERS_INFO_QUERY = 'UNWIND $uids AS uid ' +\
+    'MATCH (user:USER {uid: uid}) ' +\
+    'RETURN user.uid AS uid, properties(user) AS properties'
+USERS_INFO_PROJECTION_QUERY = 'UNWIND $uids AS uid ' +\
+    'MATCH (user:USER {uid: uid}) ' +\
+    'RETURN user.uid AS uid, [key IN $properties | user[key]] AS values'
+
+"""This function gets the info of many users from the database in one query.
+With a list of property names only those properties are returned"""
+def get_users_info(user_ids, properties=None):
+    uids = sorted(set(str(uid) for uid in user_ids))
+    users_info = {}
+    if properties is None:
+        database_response = __request_database(USERS_INFO_QUERY,
+                                               {'uids': uids})
+        for row in database_response:
+            users_info[row['uid']] = row['properties']
+        return users_info
+    properties = list(properties)
+    database_response = __request_database(USERS_INFO_PROJECTION_QUERY, {
+        'uids': uids,
+        'properties': properties
+    })
+    for row in database_response:
+        users_info[row['uid']] = {
+            key: value for key, value in zip(properties, row['values'])
+            if value is not None
+        }
+    return users_info
 
 
 """This function gets info of ONE user per time from the database"""
 def get_user_info(user_id):
-    database_query = 'MATCH (user:USER {uid: "'+user_id+'"}) ' +\
-        'RETURN user'
-    database_response = __request_database(database_query)
-    """Just to be on the safe side"""
-    if len(database_response) == 0:
-        return {}
-    return {user_id:database_response[0]['user'].properties}
+    return get_users_info([user_id])
+
 
+"""This query creates missing users, labels every user in $uids that was
+never crawled or whose crawl is older than $outdated as PRIORITY1 and
+returns the uids of users still waiting to be crawled or written"""
+LABEL_UNKNOWN_USERS_QUERY = 'UNWIND $uids AS uid ' +\
+    'MERGE (user:USER {uid: uid}) ' +\
+    'FOREACH (ignoreMe IN CASE WHEN (user:PRIORITY2 OR ' +\
+    '(user:PRIORITY3 AND user.timestamp < $outdated) OR ' +\
+    "LABELS(user) = ['USER']) THEN [1] ELSE [] END | " +\
+    'SET user:PRIORITY1 REMOVE user:PRIORITY2, user:PRIORITY3) ' +\
+    'RETURN COLLECT(CASE WHEN user:PRIORITY1 THEN uid END) AS uncrawled, ' +\
+    'COLLECT(CASE WHEN user:QUEUED THEN uid END) AS unwritten'
 
 def label_unknown_users(user_ids):
     time_now = math.floor(time.time())
     three_month = 60 * 60 * 24 * 90
-
-    query = "WITH %s AS USERS " % user_ids
-    query += "FOREACH (U IN USERS | MERGE (X:USER{uid:U}) "
-    query += "FOREACH (ignoreMe in CASE WHEN (X:PRIORITY2 OR "
-    query += "(X:PRIORITY3 AND X.timestamp < %s) OR " % (time_now - three_month)
-    query += "LABELS(X)=['USER']) "
-    query += "THEN [1] ELSE [] END | "
-    query += "SET X:PRIORITY1 REMOVE X:PRIORITY2, X:PRIORITY3))"
-    __request_database(query)
-
-    query2 = "WITH %s AS USERS " % user_ids
-    query2 += "MATCH (u:PRIORITY1) "
-    query2 += "WHERE u.uid IN USERS "
-    query2 += "RETURN COLLECT(u.uid) as uncrawled"
-    uncrawled = __request_database(query2)[0]["uncrawled"]
-
-    query2 = "WITH %s AS USERS " % user_ids
-    query2 += "MATCH (u:QUEUED) "
-    query2 += "WHERE u.uid IN USERS "
-    query2 += "RETURN COLLECT(u.uid) as unwritten"
-    unwritten = __request_database(query2)[0]["unwritten"]
-
+    database_response = __request_database(LABEL_UNKNOWN_USERS_QUERY, {
+        'uids': sorted(set(str(uid) for uid in user_ids)),
+        'outdated': time_now - three_month
+    })
     return {
-        "uncrawled": uncrawled,
-        "unwritten": unwritten
+        "uncrawled": database_response[0]["uncrawled"],
+        "unwritten": database_response[0]["unwritten"]
     }
@@ -0,0 +1,126 @@
+import numpy as np
+
+"""
+Vectorized induced subgraph computation on compressed sparse row arrays.
+
+uids       sorted int64 array, the position of a uid is its index
+offsets    int64 array, followers of index i are followers[offsets[i]:offsets[i+1]]
+followers  sorted follower indices per user
+"""
+
+
+def parse_uid(uid):
+    """Return the uid as int or None for uids that are not numeric"""
+    try:
+        return int(uid)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_indices(uids: np.ndarray, user_ids: list) -> tuple:
+    """
+    Look up the indices of uid strings in the sorted uids array.
+    :param uids: the sorted int64 uids
+    :param user_ids: list of uid strings
+    :returns: the found indices and the uid strings they belong to
+    """
+    numeric_ids = []
+    numeric_strings = []
+    for user_id in user_ids:
+        numeric_id = parse_uid(user_id)
+        if numeric_id is not None:
+            numeric_ids.append(numeric_id)
+            numeric_strings.append(user_id)
+    if not numeric_ids or len(uids) == 0:
+        return np.empty(0, dtype=np.int64), []
+    values = np.array(numeric_ids, dtype=np.int64)
+    indices = np.searchsorted(uids, values)
+    indices[indices == len(uids)] = 0
+    found = uids[indices] == values
+    strings = [user_id for user_id, is_found in zip(numeric_strings, found)
+               if is_found]
+    return indices[found], strings
+
+
+def __members(sorted_values: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """Return the candidates that are contained in sorted_values"""
+    positions = np.searchsorted(sorted_values, candidates)
+    positions[positions == len(sorted_values)] = 0
+    return candidates[sorted_values[positions] == candidates]
+
+
+"""Maximum number of follower indices gathered into one array at a time"""
+GATHER_LIMIT = 4 * 1024 * 1024
+"""Rows this many times longer than the start set are binary searched"""
+LONG_ROW_FACTOR = 32
+
+
+def __membership_bitmap(size: int, indices: np.ndarray) -> np.ndarray:
+    """Return a bitmap with one bit per index up to size, set for indices"""
+    bitmap = np.zeros((size >> 3) + 1, dtype=np.uint8)
+    np.bitwise_or.at(bitmap, indices >> 3,
+                     np.left_shift(1, indices & 7).astype(np.uint8))
+    return bitmap
+
+
+def induced_subgraph(uids: np.ndarray, offsets: np.ndarray,
+                     followers: np.ndarray, start_uids: list,
+                     end_uids: list) -> dict:
+    """
+    Find, for every user in end_uids, its followers among start_uids.
+    Follower rows are gathered in batches and tested against a bitmap of
+    the start indices, very long rows are binary searched for the start
+    indices instead. Dense subgraphs have many more relations than start
+    users, so the uid strings are built once per start user.
+    :returns: dict of {end_uid: [start_uid, ...]} like get_followers
+    """
+    start_indices, _ = to_indices(uids, start_uids)
+    # same dtype as the follower rows, mixed dtypes make searches slow
+    start_indices = np.unique(start_indices).astype(followers.dtype)
+    result = {}
+    if len(start_indices) == 0:
+        return result
+    start_strings = np.array([str(uid) for uid in uids[start_indices].tolist()],
+                             dtype=object)
+    end_indices, end_strings = to_indices(uids, end_uids)
+    row_starts = offsets[end_indices]
+    lengths = offsets[end_indices + 1] - row_starts
+    long_row_length = LONG_ROW_FACTOR * len(start_indices)
+
+    for position in np.flatnonzero(lengths > long_row_length):
+        row = followers[row_starts[position]:row_starts[position] + lengths[position]]
+        matches = __members(row, start_indices)
+        if len(matches):
+            result[end_strings[position]] = \
+                start_strings[np.searchsorted(start_indices, matches)].tolist()
+
+    rows = np.flatnonzero((lengths > 0) & (lengths <= long_row_length))
+    if len(rows) == 0:
+        return result
+    bitmap = __membership_bitmap(len(uids), start_indices)
+    batch_start = 0
+    while batch_start < len(rows):
+        batch_lengths = np.cumsum(lengths[rows[batch_start:]])
+        batch_end = batch_start + max(
+            1, int(np.searchsorted(batch_lengths, GATHER_LIMIT, side='right')))
+        batch = rows[batch_start:batch_end]
+        batch_start = batch_end
+        # positions of all followers of the batch rows in one array
+        counts = lengths[batch]
+        row_of_value = np.repeat(np.arange(len(batch)), counts)
+        first_value = np.cumsum(counts) - counts
+        positions = np.arange(counts.sum()) - np.repeat(first_value, counts) + \
+            np.repeat(row_starts[batch], counts)
+        values = followers[positions]
+        is_member = (bitmap[values >> 3] >> (values & 7).astype(np.uint8)) & 1
+        is_member = is_member.astype(bool)
+        matched_rows = row_of_value[is_member]
+        matched_uids = start_strings[
+            np.searchsorted(start_indices, values[is_member])].tolist()
+        matches_per_row = np.bincount(matched_rows, minlength=len(batch))
+        offset = 0
+        for row, num_matches in zip(batch.tolist(), matches_per_row.tolist()):
+            if num_matches:
+                result[end_strings[row]] = matched_uids[offset:offset + num_matches]
+                offset += num_matches
+    return result
@@ -1,23 +1,18 @@
-from neo4j.v1 import GraphDatabase, basic_auth
 from neo4j.exceptions import CypherError
+import api.neo4j.connectionManager as connectionManager
 import json
 import time
 import os
 
 class TracemapUserAdapter:
 
-    def __init__(self):
-        uri = os.environ.get('NEO4J_URI')
-        self.driver = GraphDatabase.driver(uri, auth=(os.environ.get('NEO4J_USER'),
-        os.environ.get('NEO4J_PASSWORD')))
-
     def __request_database(self, query: str) -> object:
         """
         Takes a query and returns the neo4j data response of that query  
         :param query: the query string  
         :returns: database response data object
         """
-        with self.driver.session() as session:
+        with connectionManager.session() as session:
             with session.begin_transaction() as transaction:
                 try:
                     response_data = transaction.run(query).data()
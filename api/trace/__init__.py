@@ -0,0 +1 @@
+__all__ = ["traceApi"]
\ No newline at end of file
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+import os
+
+import api.neo4j.neo4jApi as neo4jApi
+
+"""
+Builds everything the frontend needs to render one trace. The tweet data
+is fetched first, labelling, the follower subgraph and the profiles of
+the retweeters only need the user ids and are fetched concurrently.
+"""
+
+TRACE_THREADS = int(os.environ.get('TRACE_THREADS', 8))
+__executor = ThreadPoolExecutor(max_workers=TRACE_THREADS)
+
+
+def __timed(timings: dict, stage: str, function, *arguments):
+    """Call function and record its duration in ms under stage"""
+    start = time.perf_counter()
+    try:
+        return function(*arguments)
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+
+async def __timed_async(timings: dict, stage: str, awaitable):
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+
+def get_user_ids(tweet_data: dict) -> list:
+    """Return the author and the retweeters of a get_tweet_data response"""
+    response = tweet_data.get('response')
+    if not response:
+        return []
+    author_id = response['tweet_info'].get('user', {}).get('id_str')
+    author_ids = [author_id] if author_id else []
+    return list(dict.fromkeys(author_ids + response['retweeter_ids']))
+
+
+def __compose(tweet_data: dict, user_ids: list, labels: dict, followers: dict,
+              user_info: dict, timings: dict, start: float) -> dict:
+    timings['total'] = round((time.perf_counter() - start) * 1000, 1)
+    return {
+        'tweet_data': tweet_data,
+        'user_ids': user_ids,
+        'labels': labels,
+        'followers': followers,
+        'user_info': user_info,
+        'timings': timings
+    }
+
+
+def get_trace(twitter_api, tweet_id: str) -> dict:
+    """
+    Fetch tweet data, label unknown users, the follower subgraph and the
+    user info of a trace in one call.  
+    :param twitter_api: the TracemapTwitterApi of the server
+    :param tweet_id: the id of the retweeted tweet
+    :returns: dict with the responses of get_tweet_data, label_unknown_users,
+    get_followers and get_user_info and the duration of every stage in ms
+    """
+    start = time.perf_counter()
+    timings = {}
+    tweet_data = __timed(timings, 'tweet_data', twitter_api.get_tweet_data, tweet_id)
+    user_ids = get_user_ids(tweet_data)
+    if not user_ids:
+        return __compose(tweet_data, [], {'uncrawled': [], 'unwritten': []}, {},
+                         {'response': {}}, timings, start)
+    labels = __executor.submit(__timed, timings, 'label_unknown_users',
+                               neo4jApi.label_unknown_users, user_ids)
+    followers = __executor.submit(__timed, timings, 'followers',
+                                  neo4jApi.get_followers, user_ids)
+    user_info = __executor.submit(__timed, timings, 'user_info',
+                                  twitter_api.get_user_info, user_ids)
+    return __compose(tweet_data, user_ids, labels.result(), followers.result(),
+                     user_info.result(), timings, start)
+
+
+async def get_trace_async(twitter_api, tweet_id: str) -> dict:
+    """Like get_trace, for the event loop of the asgi server"""
+    loop = asyncio.get_event_loop()
+    start = time.perf_counter()
+    timings = {}
+    tweet_data = await __timed_async(timings, 'tweet_data',
+                                     twitter_api.get_tweet_data_async(tweet_id))
+    user_ids = get_user_ids(tweet_data)
+    if not user_ids:
+        return __compose(tweet_data, [], {'uncrawled': [], 'unwritten': []}, {},
+                         {'response': {}}, timings, start)
+    labels, followers, user_info = await asyncio.gather(
+        __timed_async(timings, 'label_unknown_users', loop.run_in_executor(
+            None, neo4jApi.label_unknown_users, user_ids)),
+        __timed_async(timings, 'followers', loop.run_in_executor(
+            None, neo4jApi.get_followers, user_ids)),
+        __timed_async(timings, 'user_info', twitter_api.get_user_info_async(user_ids)))
+    return __compose(tweet_data, user_ids, labels, followers, user_info,
+                     timings, start)
@@ -0,0 +1,273 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import re
+import secrets
+import threading
+import time
+import os
+
+import api.neo4j.neo4jApi as neo4jApi
+import api.trace.traceApi as traceApi
+
+"""
+Trace jobs for tweets whose trace takes longer than a request may.
+
+submit_job returns a job id at once, a pool of the submitting process runs
+the stages and writes the job to JOBS_DIR after every stage, so any worker
+answers polls. The retweeters are available first, the labels, followers
+and user info as their stages finish. While users of the trace wait for
+the crawler the job is "following": every REFRESH_INTERVAL it checks which
+of them were written and fetches the follower subgraph again when some
+were, for at most FOLLOW_DURATION seconds.
+
+Only the submitting process runs a job, it rewrites heartbeat_at of its
+unfinished jobs every HEARTBEAT_INTERVAL. get_job reports jobs without a
+heartbeat for STALE_AFTER seconds as failed, their process is gone.
+"""
+
+JOBS_DIR = os.environ.get('TRACE_JOBS_DIR', './jobs')
+JOB_THREADS = int(os.environ.get('TRACE_JOB_THREADS', 4))
+REFRESH_INTERVAL = int(os.environ.get('TRACE_JOB_REFRESH_INTERVAL', 30))
+FOLLOW_DURATION = int(os.environ.get('TRACE_JOB_FOLLOW_DURATION', 60 * 30))
+HEARTBEAT_INTERVAL = 10
+STALE_AFTER = int(os.environ.get('TRACE_JOB_STALE_AFTER', 60))
+"""Seconds after their last update job files are removed"""
+JOB_TTL = 60 * 60 * 24
+PRUNE_INTERVAL = 60 * 10
+JOB_ID_PATTERN = re.compile('[0-9a-f]{32}')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FOLLOWING = 'following'
+DONE = 'done'
+FAILED = 'failed'
+
+"""Jobs wait on their stages, which therefore run on a pool of their own"""
+__job_executor = ThreadPoolExecutor(max_workers=JOB_THREADS)
+__stage_executor = ThreadPoolExecutor(max_workers=traceApi.TRACE_THREADS)
+__prune_lock = threading.Lock()
+__last_prune = 0
+#: unfinished jobs of this process
+__live_jobs = set()
+__heartbeat_lock = threading.Lock()
+__heartbeat_pid = None
+
+
+class TraceJob:
+
+    def __init__(self, email: str, tweet_id: str):
+        self.lock = threading.Lock()
+        now = time.time()
+        self.document = {
+            'job_id': secrets.token_hex(16),
+            'email': email.lower(),
+            'tweet_id': tweet_id,
+            'status': QUEUED,
+            'version': 0,
+            'created_at': now,
+            'updated_at': now,
+            'heartbeat_at': now,
+            'waiting_for_crawler': [],
+            'error': None,
+            'result': {'timings': {}}
+        }
+
+    @property
+    def job_id(self) -> str:
+        return self.document['job_id']
+
+    def update(self, result: dict = None, timings: dict = None, **fields):
+        """
+        Apply changes and publish the new version of the job.
+        :param result: entries replacing those of the result
+        :param timings: stage durations in ms
+        :param fields: fields of the job like status
+        """
+        with self.lock:
+            self.document.update(fields)
+            self.document['result'].update(result or {})
+            self.document['result']['timings'].update(timings or {})
+            self.document['version'] += 1
+            self.document['updated_at'] = self.document['heartbeat_at'] = time.time()
+            self.__write()
+
+    @property
+    def finished(self) -> bool:
+        with self.lock:
+            return self.document['status'] in (DONE, FAILED)
+
+    def touch(self):
+        """Tell pollers the job is alive, without a new version"""
+        with self.lock:
+            if self.document['status'] not in (DONE, FAILED):
+                self.document['heartbeat_at'] = time.time()
+                self.__write()
+
+    def __write(self):
+        """Replace the job file at once, readers never see a partial one"""
+        path = os.path.join(JOBS_DIR, self.job_id + '.json')
+        temporary_path = '%s.%s.tmp' % (path, threading.get_ident())
+        with open(temporary_path, 'w') as job_file:
+            json.dump(self.document, job_file)
+        os.replace(temporary_path, path)
+
+
+def submit_job(twitter_api, email: str, tweet_id: str) -> dict:
+    """
+    Start tracing a tweet in the background.
+    :param twitter_api: the TracemapTwitterApi of the server
+    :param email: the email of the user, only they can read the job
+    :param tweet_id: the id of the retweeted tweet
+    :returns: dict with the job_id, status and version of the new job
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    __prune()
+    job = TraceJob(email, tweet_id)
+    job.update()
+    submitted = {key: job.document[key] for key in ('job_id', 'status', 'version')}
+    with __heartbeat_lock:
+        __live_jobs.add(job)
+    __start_heartbeat()
+    __job_executor.submit(__run, job, twitter_api)
+    return submitted
+
+
+def __start_heartbeat():
+    """Start the heartbeat thread once per process, uwsgi forks workers"""
+    global __heartbeat_pid
+    with __heartbeat_lock:
+        if __heartbeat_pid == os.getpid():
+            return
+        __heartbeat_pid = os.getpid()
+    threading.Thread(target=__beat, daemon=True).start()
+
+
+def __beat():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        with __heartbeat_lock:
+            for job in [job for job in __live_jobs if job.finished]:
+                __live_jobs.discard(job)
+            jobs = list(__live_jobs)
+        for job in jobs:
+            try:
+                job.touch()
+            except OSError:
+                continue
+
+
+def get_job(job_id: str, email: str, include_result: bool = True) -> dict:
+    """
+    Read the latest version of a job from any worker.
+    :param job_id: the id returned by submit_job
+    :param email: the email of the user polling
+    :param include_result: False to only return the progress
+    :returns: the job without the email of its user, None for unknown
+    jobs or jobs of other users. Unfinished jobs whose process stopped
+    are failed.
+    """
+    if not isinstance(job_id, str) or not JOB_ID_PATTERN.fullmatch(job_id):
+        return None
+    try:
+        with open(os.path.join(JOBS_DIR, job_id + '.json')) as job_file:
+            document = json.load(job_file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(email, str) or document.pop('email') != email.lower():
+        return None
+    if document['status'] not in (DONE, FAILED) and \
+            time.time() - document.get('heartbeat_at', document['updated_at']) > STALE_AFTER:
+        document['status'] = FAILED
+        document['error'] = 'the worker running the job stopped'
+    if not include_result:
+        del document['result']
+    return document
+
+
+def __run_stage(job: TraceJob, stage: str, key: str, function, *arguments):
+    """Run one stage and publish its result under key"""
+    start = time.perf_counter()
+    result = function(*arguments)
+    job.update(result={key: result}, timings={
+        stage: round((time.perf_counter() - start) * 1000, 1)})
+    return result
+
+
+def __run(job: TraceJob, twitter_api):
+    try:
+        job.update(status=RUNNING)
+        tweet_data = __run_stage(job, 'tweet_data', 'tweet_data',
+                                 twitter_api.get_tweet_data, job.document['tweet_id'])
+        user_ids = traceApi.get_user_ids(tweet_data)
+        job.update(result={'user_ids': user_ids})
+        if not user_ids:
+            job.update(status=DONE, result={
+                'labels': {'uncrawled': [], 'unwritten': []},
+                'followers': {},
+                'user_info': {'response': {}}})
+            return
+        stages = [
+            __stage_executor.submit(__run_stage, job, 'label_unknown_users', 'labels',
+                                    neo4jApi.label_unknown_users, user_ids),
+            __stage_executor.submit(__run_stage, job, 'followers', 'followers',
+                                    neo4jApi.get_followers, user_ids),
+            __stage_executor.submit(__run_stage, job, 'user_info', 'user_info',
+                                    twitter_api.get_user_info, user_ids)
+        ]
+        labels = [stage.result() for stage in stages][0]
+        __follow_crawler(job, user_ids, labels, time.time() + FOLLOW_DURATION)
+    except Exception as exc:
+        job.update(status=FAILED, error=str(exc))
+
+
+def __waiting_for_crawler(labels: dict) -> list:
+    return sorted(set(labels['uncrawled']) | set(labels['unwritten']))
+
+
+def __follow_crawler(job: TraceJob, user_ids: list, labels: dict, until: float):
+    """Finish the job or check on the crawler again after REFRESH_INTERVAL"""
+    waiting = __waiting_for_crawler(labels)
+    if not waiting or time.time() + REFRESH_INTERVAL > until:
+        job.update(status=DONE, waiting_for_crawler=waiting)
+        return
+    with job.lock:
+        changed = job.document['status'] != FOLLOWING or \
+            job.document['waiting_for_crawler'] != waiting
+    if changed:
+        job.update(status=FOLLOWING, waiting_for_crawler=waiting)
+    timer = threading.Timer(REFRESH_INTERVAL, __job_executor.submit,
+                            [__refresh, job, user_ids, until])
+    timer.daemon = True
+    timer.start()
+
+
+def __refresh(job: TraceJob, user_ids: list, until: float):
+    """Publish the subgraph again when the crawler wrote waiting users"""
+    try:
+        with job.lock:
+            waiting = list(job.document['waiting_for_crawler'])
+        labels = neo4jApi.label_unknown_users(user_ids)
+        if len(__waiting_for_crawler(labels)) < len(waiting):
+            start = time.perf_counter()
+            followers = neo4jApi.get_followers(user_ids)
+            job.update(result={'labels': labels, 'followers': followers}, timings={
+                'followers': round((time.perf_counter() - start) * 1000, 1)})
+        __follow_crawler(job, user_ids, labels, until)
+    except Exception as exc:
+        job.update(status=FAILED, error=str(exc))
+
+
+def __prune():
+    """Remove jobs not updated for JOB_TTL, at most every PRUNE_INTERVAL"""
+    global __last_prune
+    now = time.time()
+    with __prune_lock:
+        if now - __last_prune < PRUNE_INTERVAL:
+            return
+        __last_prune = now
+    for entry in os.scandir(JOBS_DIR):
+        try:
+            if entry.stat().st_mtime < now - JOB_TTL:
+                os.remove(entry.path)
+        except OSError:
+            continue
@@ -0,0 +1,203 @@
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import time
+import os
+
+from api.metrics.prometheusMetrics import TWITTER_CACHE_LOOKUPS
+
+"""
+Cache for twitter responses that change slowly.
+
+Entries live for the ttl of their route in an LRU bounded by max_entries.
+With a directory, entries are also written there as one json file per
+key, so the workers of a server share what any of them fetched. Invalid
+users (error codes 50 and 63, or users missing from a lookup) are cached
+as negative entries for NEGATIVE_TTL, so they are not requested again.
+"""
+
+"""Seconds the responses of a route stay valid, other routes are not cached"""
+ROUTE_TTLS = {
+    'statuses/lookup': 60 * 60,
+    'users/lookup': 60 * 60,
+    'statuses/user_timeline': 60 * 5,
+    'statuses/retweets': 60,
+    'statuses/retweeters/ids': 60
+}
+NEGATIVE_TTL = int(os.environ.get('TWITTER_CACHE_NEGATIVE_TTL', 60 * 60 * 6))
+CACHE_SIZE = int(os.environ.get('TWITTER_CACHE_SIZE', 50000))
+CACHE_DIR = os.environ.get('TWITTER_CACHE_DIR') or None
+MAX_DISK_ENTRIES = int(os.environ.get('TWITTER_CACHE_DISK_ENTRIES', 500000))
+PRUNE_INTERVAL = 60 * 10
+
+
+class LookupCache:
+
+    def __init__(self, max_entries: int = CACHE_SIZE, directory: str = CACHE_DIR,
+                 route_ttls: dict = None, negative_ttl: int = NEGATIVE_TTL,
+                 max_disk_entries: int = MAX_DISK_ENTRIES):
+        """
+        :param max_entries: entries kept in memory before the least
+        recently used ones are evicted
+        :param directory: the folder shared by the workers, None to only
+        cache in memory
+        :param route_ttls: seconds entries of a route are valid
+        :param negative_ttl: seconds invalid users are remembered
+        :param max_disk_entries: files kept in the directory at most
+        """
+        self.max_entries = max_entries
+        self.directory = directory
+        self.route_ttls = ROUTE_TTLS if route_ttls is None else route_ttls
+        self.negative_ttl = negative_ttl
+        self.max_disk_entries = max_disk_entries
+        #: (route, key) -> (expires_at, negative, value)
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__last_prune = 0
+        self.__stats = {
+            'hits': 0,
+            'negative_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+
+    def is_cached_route(self, route: str) -> bool:
+        return self.route_ttls.get(route, 0) > 0
+
+    def get(self, route: str, key: str):
+        """
+        Look up an entry in memory, then on disk.
+        :param route: the twitter route
+        :param key: identifies the response within the route
+        :returns: tuple (negative, value) of a valid entry, None on a miss
+        """
+        if not self.is_cached_route(route):
+            return None
+        now = time.time()
+        with self.__lock:
+            entry = self.__entries.get((route, key))
+            if entry is not None and entry[0] <= now:
+                del self.__entries[(route, key)]
+                self.__stats['expirations'] += 1
+                entry = None
+            if entry is not None:
+                self.__entries.move_to_end((route, key))
+                self.__count(route, 'negative_hits' if entry[1] else 'hits')
+                return entry[1], entry[2]
+        entry = self.__read(route, key, now)
+        with self.__lock:
+            if entry is None:
+                self.__count(route, 'misses')
+                return None
+            self.__remember((route, key), entry)
+            self.__count(route, 'disk_hits')
+        return entry[1], entry[2]
+
+    def put(self, route: str, key: str, value, negative: bool = False):
+        """
+        Store a response, or an invalid user with negative.
+        :param value: json serializable response of twitter
+        """
+        if not self.is_cached_route(route):
+            return
+        ttl = self.negative_ttl if negative else self.route_ttls[route]
+        entry = (time.time() + ttl, negative, value)
+        with self.__lock:
+            self.__remember((route, key), entry)
+            self.__stats['stores'] += 1
+        if self.directory is not None:
+            self.__write(route, key, entry)
+
+    def __count(self, route: str, outcome: str):
+        """Caller holds the lock"""
+        self.__stats[outcome] += 1
+        TWITTER_CACHE_LOOKUPS.labels(route, outcome).inc()
+
+    def __remember(self, cache_key: tuple, entry: tuple):
+        """Caller holds the lock"""
+        self.__entries[cache_key] = entry
+        self.__entries.move_to_end(cache_key)
+        while len(self.__entries) > self.max_entries:
+            self.__entries.popitem(last=False)
+            self.__stats['evictions'] += 1
+
+    def __path(self, route: str, key: str) -> str:
+        name = hashlib.sha1(json.dumps([route, key]).encode()).hexdigest()
+        return os.path.join(self.directory, name + '.json')
+
+    def __read(self, route: str, key: str, now: float):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.__path(route, key)) as entry_file:
+                expires_at, negative, value = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        if expires_at <= now:
+            return None
+        return expires_at, negative, value
+
+    def __write(self, route: str, key: str, entry: tuple):
+        path = self.__path(route, key)
+        temporary_path = '%s.%s.%s.tmp' % (path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary_path, 'w') as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(temporary_path, path)
+        except (OSError, TypeError, ValueError):
+            # the disk tier is best effort, memory still has the entry
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return
+        self.__prune()
+
+    def __prune(self):
+        """
+        Remove expired files, and the oldest ones above max_disk_entries,
+        at most every PRUNE_INTERVAL.
+        """
+        now = time.time()
+        with self.__lock:
+            if now - self.__last_prune < PRUNE_INTERVAL:
+                return
+            self.__last_prune = now
+        files = []
+        for entry in os.scandir(self.directory):
+            try:
+                modified = entry.stat().st_mtime
+                # no entry lives longer than the largest ttl
+                if modified < now - max([self.negative_ttl] + list(self.route_ttls.values())):
+                    os.remove(entry.path)
+                else:
+                    files.append((modified, entry.path))
+            except OSError:
+                continue
+        files.sort()
+        for _, path in files[:max(len(files) - self.max_disk_entries, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+    def clear(self):
+        """Drop all entries in memory"""
+        with self.__lock:
+            self.__entries.clear()
+
+    def get_stats(self) -> dict:
+        """
+        Return hit ratio and size of the cache in this process.
+        :returns: dict of counters, the entries in memory and the hit ratio
+        """
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['entries'] = len(self.__entries)
+        lookups = stats['hits'] + stats['negative_hits'] + \
+            stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = 1 - stats['misses'] / lookups if lookups else 0.0
+        return stats
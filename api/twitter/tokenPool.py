@@ -0,0 +1,237 @@
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import math
+import threading
+import time
+
+from api.metrics.prometheusMetrics import TWITTER_TOKEN_WAIT, \
+    TWITTER_TOKENS_IN_FLIGHT, TWITTER_TOKENS_LEASED
+
+"""
+Pool of the tokens a worker leases for one twitter route.
+
+Every request leases a token for one attempt. Requests are served in the
+order they arrive, threads and coroutines of the event loop share one
+queue. A request gets an idle token if there is one, otherwise another
+token is leased from the token store until the pool has size tokens.
+Then tokens are shared, the least busy first, by at most max_in_flight
+requests each, later requests wait. Tokens with the most requests left
+in their rate limit window are preferred, exhausted ones come last.
+"""
+
+
+class TokenSlot:
+
+    def __init__(self, token):
+        self.token = token
+        self.in_flight = 0
+
+
+class Waiter:
+
+    def __init__(self, wake):
+        #: called with the lock of the pool held once slot or error is set
+        self.wake = wake
+        self.slot = None
+        self.error = None
+        #: False if a token was free when the request arrived
+        self.queued = False
+
+
+class TokenPool:
+
+    def __init__(self, route: str, size: int, max_in_flight: int, token_factory):
+        """
+        :param route: the twitter route of the tokens
+        :param size: tokens leased at most
+        :param max_in_flight: requests sharing one token at most
+        :param token_factory: called like Token with the route and
+        cleanup_last_session to lease another token
+        """
+        self.route = route
+        self.size = max(size, 1)
+        self.max_in_flight = max(max_in_flight, 1)
+        self.token_factory = token_factory
+        self.__lock = threading.Lock()
+        self.__slots = []
+        self.__waiters = deque()
+        #: tokens being leased right now
+        self.__growing = 0
+        self.__first_lease = True
+        self.__stats = {
+            'leases': 0,
+            'waited': 0,
+            'wait_seconds': 0.0
+        }
+
+    @property
+    def tokens(self) -> list:
+        with self.__lock:
+            return [slot.token for slot in self.__slots]
+
+    @staticmethod
+    def __budget(slot: TokenSlot) -> float:
+        """Requests the token of a slot may still start in its window"""
+        remaining = slot.token.rate_limit.remaining
+        if remaining is None:
+            return math.inf
+        return remaining - slot.in_flight
+
+    def __pick(self):
+        """Return the slot for the next waiter, None to wait. Caller holds the lock"""
+        idle = [slot for slot in self.__slots
+                if slot.in_flight == 0 and self.__budget(slot) > 0]
+        if idle:
+            return max(idle, key=self.__budget)
+        if len(self.__slots) + self.__growing < self.size:
+            # another token serves the waiter better than a shared or exhausted one
+            return None
+        candidates = [slot for slot in self.__slots
+                      if slot.in_flight < self.max_in_flight]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda slot: (
+            self.__budget(slot) <= 0, slot.in_flight, -self.__budget(slot)))
+
+    def __assign(self):
+        """Hand slots to the waiters in arrival order. Caller holds the lock"""
+        while self.__waiters:
+            slot = self.__pick()
+            if slot is None:
+                return
+            waiter = self.__waiters.popleft()
+            slot.in_flight += 1
+            TWITTER_TOKENS_IN_FLIGHT.labels(self.route).inc()
+            waiter.slot = slot
+            waiter.wake()
+
+    def __enqueue(self, waiter: Waiter) -> bool:
+        """
+        Queue a waiter behind the earlier ones.
+        :returns: True if the caller has to lease another token with __grow
+        """
+        with self.__lock:
+            self.__waiters.append(waiter)
+            self.__assign()
+            waiter.queued = waiter.slot is None
+            if waiter.slot is None and \
+                    len(self.__slots) + self.__growing < self.size:
+                self.__growing += 1
+                return True
+            return False
+
+    def __grow(self):
+        """Lease another token from the store, outside of the lock"""
+        with self.__lock:
+            cleanup_last_session = self.__first_lease
+            self.__first_lease = False
+        try:
+            token = self.token_factory(
+                self.route, cleanup_last_session=cleanup_last_session)
+        except Exception as exc:
+            with self.__lock:
+                self.__growing -= 1
+                if not self.__slots and not self.__growing:
+                    # nothing will ever serve the waiters
+                    while self.__waiters:
+                        waiter = self.__waiters.popleft()
+                        waiter.error = exc
+                        waiter.wake()
+            return
+        with self.__lock:
+            self.__growing -= 1
+            self.__slots.append(TokenSlot(token))
+            TWITTER_TOKENS_LEASED.labels(self.route).inc()
+            self.__assign()
+
+    def __claim(self, waiter: Waiter, start: float) -> TokenSlot:
+        """Return the slot of a served waiter and record its wait"""
+        if waiter.error is not None:
+            raise waiter.error
+        wait = time.perf_counter() - start
+        TWITTER_TOKEN_WAIT.labels(self.route).observe(wait)
+        with self.__lock:
+            self.__stats['leases'] += 1
+            if waiter.queued:
+                self.__stats['waited'] += 1
+            self.__stats['wait_seconds'] += wait
+        return waiter.slot
+
+    def __release(self, slot: TokenSlot):
+        with self.__lock:
+            slot.in_flight -= 1
+            TWITTER_TOKENS_IN_FLIGHT.labels(self.route).dec()
+            self.__assign()
+
+    def __abandon(self, waiter: Waiter):
+        """Take back the place or the slot of a cancelled waiter"""
+        with self.__lock:
+            if waiter in self.__waiters:
+                self.__waiters.remove(waiter)
+                return
+        if waiter.slot is not None:
+            self.__release(waiter.slot)
+
+    @contextmanager
+    def lease(self):
+        """
+        Lease a token for one request, waiting for a free one.
+        :returns: context manager giving the token
+        """
+        start = time.perf_counter()
+        served = threading.Event()
+        waiter = Waiter(served.set)
+        if self.__enqueue(waiter):
+            self.__grow()
+        served.wait()
+        slot = self.__claim(waiter, start)
+        try:
+            yield slot.token
+        finally:
+            self.__release(slot)
+
+    @asynccontextmanager
+    async def lease_async(self):
+        """Like lease, waiting on the event loop instead of a thread"""
+        start = time.perf_counter()
+        loop = asyncio.get_event_loop()
+        served = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(
+                lambda: served.done() or served.set_result(None))
+
+        waiter = Waiter(wake)
+        try:
+            if self.__enqueue(waiter):
+                await loop.run_in_executor(None, self.__grow)
+            await served
+        except asyncio.CancelledError:
+            self.__abandon(waiter)
+            raise
+        slot = self.__claim(waiter, start)
+        try:
+            yield slot.token
+        finally:
+            self.__release(slot)
+
+    def get_stats(self) -> dict:
+        """
+        Return the utilisation of the pool in this process.
+        :returns: dict of leased tokens, requests in flight and waiting,
+        leases, leases that had to wait, the seconds waited in total and
+        the rate limit window of every token
+        """
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['tokens'] = len(self.__slots)
+            stats['size'] = self.size
+            stats['max_in_flight'] = self.max_in_flight
+            stats['in_flight'] = sum(slot.in_flight for slot in self.__slots)
+            stats['rate_limits'] = [{
+                'remaining': slot.token.rate_limit.remaining,
+                'reset_at': slot.token.rate_limit.reset_at
+            } for slot in self.__slots]
+            stats['waiting'] = len(self.__waiters)
+        return stats
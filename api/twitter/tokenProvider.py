@@ -1,45 +1,87 @@
-from neo4j.v1 import GraphDatabase
 from TwitterAPI import TwitterAPI
+import api.neo4j.connectionManager as connectionManager
 import json
 import os
+import threading
 import time
 import math
 
 
+class RateLimit:
+    """
+    The rate limit window of a token as twitter reported it in the
+    x-rate-limit headers of the last responses.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__remaining = None
+        #: epoch seconds the window resets, kept after it passed
+        self.reset_at = None
+
+    def record(self, headers):
+        """
+        Update the window from the headers of a response.  
+        :param headers: the headers of a twitter response, responses
+        without rate limit headers are ignored
+        """
+        try:
+            remaining = int(headers['x-rate-limit-remaining'])
+            reset_at = int(headers['x-rate-limit-reset'])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self.__lock:
+            # responses of concurrent requests arrive in any order
+            if self.reset_at is None or reset_at > self.reset_at:
+                self.__remaining, self.reset_at = remaining, reset_at
+            elif reset_at == self.reset_at:
+                self.__remaining = min(self.__remaining, remaining)
+
+    @property
+    def remaining(self):
+        """Requests left in the current window, None if unknown or reset"""
+        with self.__lock:
+            if self.reset_at is None or self.reset_at <= time.time():
+                return None
+            return self.__remaining
+
+    def is_exhausted(self) -> bool:
+        remaining = self.remaining
+        return remaining is not None and remaining <= 0
+
+
 class Token:
 
     RATE_LIMIT = "application/rate_limit_status"
 
-    def __init__(self, twitter_route: str):
+    def __init__(self, twitter_route: str, cleanup_last_session: bool = True):
+        """
+        :param twitter_route: the route the token is claimed for
+        :param cleanup_last_session: release all tokens claimed for the route
+        before, False for additional tokens of a route
+        """
         self.twitter_route = twitter_route
-        self.neo4j_driver = self.__connect_to_db()
+        #: held while the credentials of the route are switched
+        self.lock = threading.RLock()
         self.app_token = os.environ.get('APP_TOKEN')
         self.app_secret = os.environ.get('APP_SECRET')
-        self.__cleanup_last_session()
+        self.rate_limit = RateLimit()
+        if cleanup_last_session:
+            self.__cleanup_last_session()
         self.get_user_auth()
 
-    def __connect_to_db(self):
-        while True:
-            try:
-                driver = GraphDatabase.driver(
-                    os.environ.get('NEO4J_URI'), auth=(
-                        os.environ.get('NEO4J_USER'),
-                        os.environ.get('NEO4J_PASSWORD')
-                    )
-                )
-                return driver
-            except Exception as exc:
-                print("ERROR on neo4j driver initialization -> %s" % exc)
-                time.sleep(5)
-                continue
-
     def get_user_auth(self):
         """
         Return old token by updating the reset time
         and get a free token.
         """
         if hasattr(self, 'api'):
-            self.__update_reset_time()
+            if self.rate_limit.reset_at is not None:
+                # the headers told the reset time, no need to ask twitter
+                self.__store_reset_time(self.rate_limit.reset_at)
+            else:
+                self.__update_reset_time()
+            self.rate_limit = RateLimit()
         # get new credentials from the db and block them
         # for 1000min by setting the timestamp
         user_token = ""
@@ -54,7 +96,7 @@ class Token:
             query += "SET h.`%s`=%s " % (self.twitter_route, distant_time)
             query += "RETURN h.token as token, "
             query += "h.secret as secret"
-            with self.neo4j_driver.session() as db:
+            with connectionManager.session() as db:
                 results = db.run(query).data()
                 user_token = results[0]["token"]
                 user_secret = results[0]["secret"]
@@ -88,9 +130,7 @@ class Token:
                 for route in resources[category].keys():
                     if self.twitter_route in route:
                         reset_time = resources[category][route]['reset']
-            query = "MATCH (h:TOKEN{token:'%s'}) " % self.user_token
-            query += "SET h.`%s`=%s" % (self.twitter_route, reset_time)
-            self.__run_query(query)
+            self.__store_reset_time(reset_time)
         except Exception as exc:
             print("14 - ERROR -> %s. Failed to reset the token's timestamp." % exc)
             if 'errors' in parsed_response:
@@ -106,6 +146,11 @@ class Token:
                 print(
                     "Unknown error in _update_reset_time(). parsed_response = %s" % parsed_response)
 
+    def __store_reset_time(self, reset_time: int):
+        query = "MATCH (h:TOKEN{token:'%s'}) " % self.user_token
+        query += "SET h.`%s`=%s" % (self.twitter_route, reset_time)
+        self.__run_query(query)
+
     def __cleanup_last_session(self):
         """
         Remove properties for initialized twitter_route
@@ -117,22 +162,23 @@ class Token:
 
     def __run_query(self, query: str):
         print("running query: %s" % query)
-        with self.neo4j_driver.session() as db:
-            while True:
-                try:
+        while True:
+            try:
+                with connectionManager.session() as db:
                     db.run(query)
-                    break
-                except Exception as exc:
-                    e_name = type(exc).__name__
-                    if e_name == "TransientError":
-                        print(
-                            "8 - ERROR -> %s. DB data is locked. Retrying..." % e_name)
-                        print(str(exc))
-                        time.sleep(2)
-                        continue
-                    elif e_name == "AddressError":
-                        self.neo4j_driver = self.__connect_to_db()
-                    else:
-                        print("9 - UNKNOWN ERROR -> %s." % e_name)
-                        time.sleep(2)
-                        continue
+                break
+            except Exception as exc:
+                e_name = type(exc).__name__
+                if e_name == "TransientError":
+                    print(
+                        "8 - ERROR -> %s. DB data is locked. Retrying..." % e_name)
+                    print(str(exc))
+                    time.sleep(2)
+                    continue
+                elif e_name == "AddressError":
+                    connectionManager.reset_driver()
+                    continue
+                else:
+                    print("9 - UNKNOWN ERROR -> %s." % e_name)
+                    time.sleep(2)
+                    continue
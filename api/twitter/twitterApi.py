@@ -1,37 +1,291 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import json
+import threading
 import time
 import os
 
 from TwitterAPI import TwitterAPI
+from api.coalescing.singleFlight import single_flight
+from api.metrics.prometheusMetrics import TWITTER_REQUEST_DURATION, \
+    TWITTER_RETRY_SLEEP, TWITTER_TOKEN_SWITCHES
+from api.twitter.lookupCache import LookupCache
+from api.twitter.tokenPool import TokenPool
 from api.twitter.tokenProvider import Token
 
 
+"""Seconds to wait before retrying a request that failed to connect"""
+RETRY_INTERVAL = 10
+"""Responses that are not json, like html error pages, before a request fails"""
+MAX_UNREADABLE_RESPONSES = 3
+"""Ids statuses/lookup and users/lookup accept per request"""
+LOOKUP_CHUNK_SIZE = 100
+"""Chunks of one batch that are looked up at the same time"""
+LOOKUP_TOKENS = int(os.environ.get('TWEET_LOOKUP_TOKENS', 4))
+"""Tokens a worker leases per route and requests sharing one token at most"""
+TOKENS_PER_ROUTE = int(os.environ.get('TWITTER_TOKENS_PER_ROUTE', 4))
+MAX_IN_FLIGHT_PER_TOKEN = int(os.environ.get('TWITTER_MAX_IN_FLIGHT_PER_TOKEN', 2))
+"""Pages of statuses/retweeters/ids followed at most per tweet, 100 ids each"""
+MAX_RETWEETER_PAGES = int(os.environ.get('TWITTER_MAX_RETWEETER_PAGES', 50))
+"""Outcomes of a single request attempt"""
+DONE = 'done'
+INVALID = 'invalid user'
+ERROR = 'error'
+RETRY_NOW = 'retry now'
+RETRY_LATER = 'retry later'
+UNREADABLE = 'unreadable'
+"""What plans yield to __run and __run_async, see __run"""
+REQUEST = 'request'
+REQUESTS = 'requests'
+PART = 'part'
+
+
 class TracemapTwitterApi:
 
+    def __init__(self):
+        self.__pools_lock = threading.Lock()
+        #: route -> TokenPool, created with the first request of the route
+        self.__pools = {}
+        self.__cache = LookupCache()
+
+    def __get_pool(self, route: str) -> TokenPool:
+        with self.__pools_lock:
+            if route not in self.__pools:
+                self.__pools[route] = TokenPool(
+                    route, TOKENS_PER_ROUTE, MAX_IN_FLIGHT_PER_TOKEN, Token)
+            return self.__pools[route]
+
+    def get_pool_stats(self) -> dict:
+        """
+        Return the utilisation of the token pools of this worker.
+        :returns: dict of route -> TokenPool.get_stats()
+        """
+        with self.__pools_lock:
+            pools = dict(self.__pools)
+        return {route: pool.get_stats() for route, pool in pools.items()}
+
+    def get_cache_stats(self) -> dict:
+        """
+        Return hits and misses of the response cache of this worker.
+        :returns: dict like LookupCache.get_stats()
+        """
+        return self.__cache.get_stats()
+
+    def __attempt_request(self, route: str, params: dict, route_extension: str,
+                          token_instance: Token) -> tuple:
+        """
+        Send one request to twitter and switch the token if twitter asks
+        for it, or before if the rate limit headers tell the window of
+        the token is used up.  
+        :param token_instance: the token leased for the request  
+        :returns: tuple of the parsed response and DONE, INVALID, ERROR,
+        RETRY_NOW, RETRY_LATER or UNREADABLE
+        """
+        with token_instance.lock:
+            if token_instance.rate_limit.is_exhausted():
+                # twitter would refuse the request, switch before sending it
+                TWITTER_TOKEN_SWITCHES.labels(token_instance.twitter_route).inc()
+                token_instance.get_user_auth()
+            api = token_instance.api
+            rate_limit = token_instance.rate_limit
+        start = time.perf_counter()
+        try:
+            response = api.request("%s%s" % (route, route_extension), params)
+            rate_limit.record(response.headers)
+        except Exception as exc:
+            print("Error while requesting Twitter: %s" % exc)
+            TWITTER_REQUEST_DURATION.labels(route, 'connection error').observe(
+                time.perf_counter() - start)
+            return None, RETRY_LATER
+        duration = time.perf_counter() - start
+        try:
+            parsed_response = response.json()
+        except ValueError as exc:
+            print("Twitter answered no json: %s" % exc)
+            TWITTER_REQUEST_DURATION.labels(route, 'unreadable').observe(duration)
+            return None, UNREADABLE
+        print(parsed_response)
+        error_response = self.__check_error(token_instance, api, parsed_response)
+        if error_response:
+            if error_response == 'continue':
+                TWITTER_REQUEST_DURATION.labels(route, 'token refused').observe(duration)
+                return None, RETRY_NOW
+            else:
+                TWITTER_REQUEST_DURATION.labels(route, 'error').observe(duration)
+                return {}, INVALID if error_response == 'invalid user' else ERROR
+        else:
+            TWITTER_REQUEST_DURATION.labels(route, 'ok').observe(duration)
+            return parsed_response, DONE
+
     def __request_twitter(self, route: str, params: dict, route_extension: str = "") -> dict:
-        if not hasattr(self, route):
-            token_instance = Token(route)
-            setattr(self, route, token_instance)
-        api = getattr(self, route).api
+        return self.__request(route, params, route_extension)[0]
+
+    def __cached(self, route: str, key: str):
+        """Return the cached (response, outcome) of a request, None on a miss"""
+        cached = self.__cache.get(route, key)
+        if cached is None:
+            return None
+        negative, response = cached
+        return response, INVALID if negative else DONE
+
+    def __remember(self, route: str, key: str, response, outcome: str):
+        """Cache a response, failed requests are not cached"""
+        if outcome in (DONE, INVALID):
+            self.__cache.put(route, key, response, outcome == INVALID)
+
+    def __request(self, route: str, params: dict, route_extension: str = "",
+                  cache: bool = True, units: dict = None) -> tuple:
+        """
+        Request a route, from the cache if it holds the response. Identical
+        concurrent requests of all threads and workers share one upstream request.  
+        :param cache: False if the caller caches the items of the response
+        :param units: dict of route -> rate limit units, counts the
+        requests this call sent to twitter
+        :returns: tuple of the response and its outcome
+        """
+        key = json.dumps([route_extension, params], sort_keys=True)
+        cached = self.__cached(route, key) if cache else None
+        if cached is not None:
+            return cached
+        response, outcome = single_flight.call(
+            route, [route_extension, params], self.__request_upstream,
+            route, params, route_extension, units)
+        if cache:
+            self.__remember(route, key, response, outcome)
+        return response, outcome
+
+    def __request_upstream(self, route: str, params: dict, route_extension: str,
+                           units: dict = None) -> tuple:
+        pool = self.__get_pool(route)
+        unreadable = 0
+        while True:
+            # the token is only held for the attempt, not while waiting to retry
+            with pool.lease() as token_instance:
+                response, outcome = self.__attempt_request(
+                    route, params, route_extension, token_instance)
+            self.__count_unit(units, route, outcome)
+            unreadable += outcome == UNREADABLE
+            if unreadable == MAX_UNREADABLE_RESPONSES:
+                return {}, ERROR
+            if outcome in (RETRY_LATER, UNREADABLE):
+                TWITTER_RETRY_SLEEP.labels(route).inc(RETRY_INTERVAL)
+                time.sleep(RETRY_INTERVAL)
+            elif outcome != RETRY_NOW:
+                return response, outcome
+
+    async def __request_async(self, route: str, params: dict, route_extension: str = "",
+                              cache: bool = True, units: dict = None) -> tuple:
+        """
+        Like __request, but only the request itself occupies a thread of
+        the event loop's executor, waiting for a token or a retry does not.
+        """
+        key = json.dumps([route_extension, params], sort_keys=True)
+        cached = self.__cached(route, key) if cache else None
+        if cached is not None:
+            return cached
+        response, outcome = await single_flight.call_async(
+            route, [route_extension, params], self.__request_upstream_async,
+            route, params, route_extension, units)
+        if cache:
+            self.__remember(route, key, response, outcome)
+        return response, outcome
+
+    async def __request_upstream_async(self, route: str, params: dict,
+                                       route_extension: str, units: dict = None) -> tuple:
+        loop = asyncio.get_event_loop()
+        pool = self.__get_pool(route)
+        unreadable = 0
+        while True:
+            async with pool.lease_async() as token_instance:
+                response, outcome = await loop.run_in_executor(
+                    None, self.__attempt_request, route, params, route_extension,
+                    token_instance)
+            self.__count_unit(units, route, outcome)
+            unreadable += outcome == UNREADABLE
+            if unreadable == MAX_UNREADABLE_RESPONSES:
+                return {}, ERROR
+            if outcome in (RETRY_LATER, UNREADABLE):
+                TWITTER_RETRY_SLEEP.labels(route).inc(RETRY_INTERVAL)
+                await asyncio.sleep(RETRY_INTERVAL)
+            elif outcome != RETRY_NOW:
+                return response, outcome
+
+    def __run(self, plan):
+        """
+        Run a plan, the request logic shared by the sync and async methods.  
+        :param plan: generator yielding (REQUEST, arguments of __request),
+        which is sent the (response, outcome) tuple, (REQUESTS, [arguments])
+        for concurrent requests, which is sent the list of tuples, and
+        (PART, part) for every part of its result
+        :returns: generator of the parts
+        """
+        reply = None
         while True:
             try:
-                response = api.request("%s%s" % (route, route_extension), params)
-            except Exception as exc:
-                print("Error while requesting Twitter: %s" % exc)
-                time.sleep(10)
-                continue
-            parsed_response = response.json()
-            print(parsed_response)
-            error_response = self.__check_error(token_instance, parsed_response)
-            if error_response:
-                if error_response == 'continue':
-                    continue
-                else:
-                    return {}
+                kind, value = plan.send(reply)
+            except StopIteration:
+                return
+            reply = None
+            if kind == REQUEST:
+                reply = self.__request(*value)
+            elif kind == REQUESTS:
+                with ThreadPoolExecutor(max_workers=min(len(value), LOOKUP_TOKENS)) as executor:
+                    reply = list(executor.map(lambda arguments: self.__request(*arguments),
+                                              value))
             else:
-                return parsed_response
+                yield value
 
-    def __check_error(self, token_instance, response: dict) -> str:
+    async def __run_async(self, plan):
+        """Like __run, without blocking the event loop"""
+        reply = None
+        while True:
+            try:
+                kind, value = plan.send(reply)
+            except StopIteration:
+                return
+            reply = None
+            if kind == REQUEST:
+                reply = await self.__request_async(*value)
+            elif kind == REQUESTS:
+                reply = await asyncio.gather(*[self.__request_async(*arguments)
+                                               for arguments in value])
+            else:
+                yield value
+
+    def __result(self, plan):
+        """Run a plan and return its last part"""
+        return list(self.__run(plan))[-1]
+
+    async def __result_async(self, plan):
+        return [part async for part in self.__run_async(plan)][-1]
+
+    @staticmethod
+    def __map_parts(plan, function):
+        """
+        Pass the requests of a plan on and its parts through function,
+        parts it turns into None are dropped.
+        """
+        reply = None
+        while True:
+            try:
+                kind, value = plan.send(reply)
+            except StopIteration:
+                return
+            reply = None
+            if kind == PART:
+                value = function(value)
+                if value is not None:
+                    yield PART, value
+            else:
+                reply = yield kind, value
+
+    @staticmethod
+    def __count_unit(units: dict, route: str, outcome: str):
+        """Every answer of twitter, refusals included, used up one unit of the window"""
+        if units is not None and outcome != RETRY_LATER:
+            units[route] = units.get(route, 0) + 1
+
+    def __check_error(self, token_instance, api, response: dict) -> str:
         error_response = ""
         if 'error' in response:
             error_response = self.__check_twitter_error_code(
@@ -43,8 +297,11 @@ class TracemapTwitterApi:
             return ""
         else:
             if error_response == "Switch helper":
-                token_instance.get_user_auth()
-
+                with token_instance.lock:
+                    # concurrent requests of the route switch only once
+                    if token_instance.api is api:
+                        TWITTER_TOKEN_SWITCHES.labels(token_instance.twitter_route).inc()
+                        token_instance.get_user_auth()
                 return "continue"
             elif error_response in ("Invalid user", "Not authorized"):
                 return "invalid user"
@@ -54,6 +311,7 @@ class TracemapTwitterApi:
     @staticmethod
     def __check_twitter_error_code(code: int) -> str:
         return {
+            17: "Invalid user",
             32: "Switch helper",
             50: "Invalid user",
             63: "Invalid user",
@@ -63,64 +321,266 @@ class TracemapTwitterApi:
             131: "Internal error"
         }.get(code, "Unknown error %s" % code)
 
+    def __format_users_info(self, users: dict, missing: list) -> dict:
+        return {
+            'response': {user_id: self.__format_user_info(user)
+                         for user_id, user in users.items()},
+            'missing': missing
+        }
+
     def get_user_info(self, uid_list: list) -> dict:
-        """Request user information, return a dictionary"""
-        results = {'response': {}}
-        route = "users/show"
-        for id in uid_list:
-            params = {'user_id': id}
-            data = self.__request_twitter(route, params)
-            results['response'][str(id)] = self.__format_user_info(data)
-        return results
+        """
+        Request user information with up to 100 ids per request,
+        chunks are requested concurrently with different tokens.  
+        :param uid_list: list of user ids
+        :returns: {'response': {uid: <user info>},
+        'missing': [ids of suspended or deleted users]}
+        """
+        return self.__result(self.__lookup_plan(
+            "users/lookup", 'user_id', uid_list, self.__format_users_info))
 
-    def get_tweet_info(self, tweet_id: str) -> dict:
-        """Request tweet information, return a dictionary"""
-        route = "statuses/lookup"
-        params = {'id': tweet_id}
-        data = self.__request_twitter(route, params)
+    async def get_user_info_async(self, uid_list: list) -> dict:
+        """Like get_user_info, without blocking the event loop"""
+        return await self.__result_async(self.__lookup_plan(
+            "users/lookup", 'user_id', uid_list, self.__format_users_info))
+
+    def __tweet_info_plan(self, tweet_id: str):
+        data, _ = yield REQUEST, ("statuses/lookup", {'id': tweet_id})
         if data != []:
-            return self.__format_tweet_info(data)
+            yield PART, self.__format_tweet_info(data)
         else:
-            return data
+            yield PART, data
 
-    def get_retweeters(self, tweet_id: str) -> dict:
-        """Request the 100 last retweet ids, return them as a list"""
+    def get_tweet_info(self, tweet_id: str) -> dict:
+        """Request tweet information, return a dictionary"""
+        return self.__result(self.__tweet_info_plan(tweet_id))
+
+    async def get_tweet_info_async(self, tweet_id: str) -> dict:
+        """Like get_tweet_info, without blocking the event loop"""
+        return await self.__result_async(self.__tweet_info_plan(tweet_id))
+
+    @staticmethod
+    def __lookup_chunks(ids: list) -> list:
+        """Split unique ids into chunks the lookup routes accept"""
+        unique_ids = list(dict.fromkeys(str(id) for id in ids))
+        return [unique_ids[start:start + LOOKUP_CHUNK_SIZE]
+                for start in range(0, len(unique_ids), LOOKUP_CHUNK_SIZE)]
+
+    def __cached_items(self, route: str, ids: list) -> tuple:
+        """
+        Look up unique ids of a lookup route in the cache.  
+        :returns: tuple of {id: cached item}, [cached invalid ids] and
+        the chunks of the ids that were not cached
+        """
+        items, missing, uncached = {}, [], []
+        for id in dict.fromkeys(str(id) for id in ids):
+            cached = self.__cache.get(route, id)
+            if cached is None:
+                uncached.append(id)
+            elif cached[0]:
+                missing.append(id)
+            else:
+                items[id] = cached[1]
+        return items, missing, self.__lookup_chunks(uncached)
+
+    def __store_items(self, route: str, chunks: list, responses: list,
+                      items: dict, missing: list):
+        """Add the items of lookup responses, cache them and the missing ids"""
+        for chunk, (data, outcome) in zip(chunks, responses):
+            for item in data or []:
+                items[item['id_str']] = item
+                self.__cache.put(route, item['id_str'], item)
+            for id in chunk:
+                if id not in items:
+                    missing.append(id)
+                    # a failed request says nothing about its ids
+                    if outcome in (DONE, INVALID):
+                        self.__cache.put(route, id, None, negative=True)
+
+    def __lookup_plan(self, route: str, id_param: str, ids: list, format_items):
+        """
+        Look up the ids that are not cached, 100 per request, all
+        requests at the same time.  
+        :param format_items: called with {id: item} and the missing ids
+        """
+        items, missing, chunks = self.__cached_items(route, ids)
+        if chunks:
+            responses = yield REQUESTS, [
+                (route, {id_param: ','.join(chunk)}, "", False) for chunk in chunks]
+            self.__store_items(route, chunks, responses, items, missing)
+        yield PART, format_items(items, missing)
+
+    def __format_tweets_info(self, tweets: dict, missing: list) -> dict:
+        return {
+            'response': {tweet_id: self.__format_tweet(tweet)
+                         for tweet_id, tweet in tweets.items()},
+            'missing': missing
+        }
+
+    def get_tweets_info(self, tweet_ids: list) -> dict:
+        """
+        Request the information of many tweets with up to 100 ids per
+        request, chunks are requested concurrently with different tokens.  
+        :param tweet_ids: list of tweet ids
+        :returns: {'response': {tweet_id: <tweet info like get_tweet_info>},
+        'missing': [ids of deleted or protected tweets]}
+        """
+        return self.__result(self.__lookup_plan(
+            "statuses/lookup", 'id', tweet_ids, self.__format_tweets_info))
+
+    async def get_tweets_info_async(self, tweet_ids: list) -> dict:
+        """Like get_tweets_info, without blocking the event loop"""
+        return await self.__result_async(self.__lookup_plan(
+            "statuses/lookup", 'id', tweet_ids, self.__format_tweets_info))
+
+    @staticmethod
+    def __new_enumeration() -> dict:
+        return {'pages': 0, 'rate_limit_units': {}, 'complete': False}
+
+    @staticmethod
+    def __retweeters_params(tweet_id: str, cursor: int) -> dict:
+        return {'id': str(tweet_id), 'count': 100, 'cursor': cursor,
+                'stringify_ids': 'true'}
+
+    def __retweeter_pages_plan(self, tweet_id: str, enumeration: dict):
         route = 'statuses/retweeters/ids'
-        params = {'id': str(tweet_id)}
-        data = self.__request_twitter(route, params)
-        response = {}
-        response['response'] = data['ids']
-        retweeters = response['response']
-        # change user_ids from num to string
-        for index, num in enumerate(retweeters):
-            retweeters[index] = str(num)
-        return response
+        cursor = -1
+        while enumeration['pages'] < MAX_RETWEETER_PAGES:
+            data, outcome = yield REQUEST, (
+                route, self.__retweeters_params(tweet_id, cursor), "", True,
+                enumeration['rate_limit_units'])
+            if outcome != DONE:
+                return
+            enumeration['pages'] += 1
+            cursor = data.get('next_cursor', 0)
+            enumeration['complete'] = not cursor
+            yield PART, [str(user_id) for user_id in data.get('ids', [])]
+            if not cursor:
+                return
 
-    def get_tweet_data(self, tweet_id: str) -> dict:
-        """Request full tweet information, including retweet and user information"""
-        route = "statuses/retweets"
-        route_extension = '/:%s' % tweet_id
-        params = {'count': 100}
-        data = self.__request_twitter(route, params, route_extension)
-        results = {}
-        if len(data) == 0:
-            results['response'] = []
+    def iter_retweeter_pages(self, tweet_id: str, enumeration: dict = None):
+        """
+        Follow the cursor of statuses/retweeters/ids for at most
+        MAX_RETWEETER_PAGES pages.  
+        :param enumeration: dict counting the pages and rate limit units,
+        complete is set once the last page arrived
+        :returns: generator of the retweeter ids of every page
+        """
+        if enumeration is None:
+            enumeration = self.__new_enumeration()
+        return self.__run(self.__retweeter_pages_plan(tweet_id, enumeration))
+
+    def iter_retweeter_pages_async(self, tweet_id: str, enumeration: dict = None):
+        """Like iter_retweeter_pages, without blocking the event loop"""
+        if enumeration is None:
+            enumeration = self.__new_enumeration()
+        return self.__run_async(self.__retweeter_pages_plan(tweet_id, enumeration))
+
+    def __retweeters_plan(self, tweet_id: str):
+        enumeration = self.__new_enumeration()
+        retweeters = []
+        yield from self.__map_parts(
+            self.__retweeter_pages_plan(tweet_id, enumeration), retweeters.extend)
+        yield PART, {'response': list(dict.fromkeys(retweeters)),
+                     'enumeration': enumeration}
+
+    def get_retweeters(self, tweet_id: str) -> dict:
+        """Request the ids of all retweeters twitter returns, return them as a list"""
+        return self.__result(self.__retweeters_plan(tweet_id))
+
+    def __tweet_data_plan(self, tweet_id: str):
+        enumeration = self.__new_enumeration()
+        data, _ = yield REQUEST, (
+            "statuses/retweets", {'count': 100}, '/:%s' % tweet_id, True,
+            enumeration['rate_limit_units'])
+        if len(data) > 0:
+            tweet_data = self.__format_tweet_data(data)
+            seen = set(tweet_data['retweeter_ids'])
+            yield PART, tweet_data
+            yield from self.__map_parts(
+                self.__retweeter_pages_plan(tweet_id, enumeration),
+                lambda page: self.__unseen(page, seen))
+        yield PART, {'enumeration': enumeration}
+
+    def iter_tweet_data(self, tweet_id: str):
+        """
+        Request the tweet with its 100 latest retweets, then page through
+        the ids of the other retweeters.  
+        :returns: generator of the parts of get_tweet_data as they arrive:
+        {'tweet_info', 'retweeter_ids', 'retweet_info'} first, then
+        {'retweeter_ids'} with the new ids of every page and
+        {'enumeration'} last. Without retweets only the enumeration.
+        """
+        return self.__run(self.__tweet_data_plan(tweet_id))
+
+    def iter_tweet_data_async(self, tweet_id: str):
+        """Like iter_tweet_data, without blocking the event loop"""
+        return self.__run_async(self.__tweet_data_plan(tweet_id))
+
+    @staticmethod
+    def __unseen(ids: list, seen: set) -> dict:
+        """Return the part with the ids not seen before, None without any"""
+        new_ids = [user_id for user_id in dict.fromkeys(ids) if user_id not in seen]
+        seen.update(new_ids)
+        return {'retweeter_ids': new_ids} if new_ids else None
+
+    @staticmethod
+    def __merge_tweet_data(results: dict, part: dict):
+        """Add a part of iter_tweet_data to a get_tweet_data response"""
+        if 'tweet_info' in part:
+            results['response'] = dict(
+                part, retweeter_ids=list(part['retweeter_ids']))
+        elif 'retweeter_ids' in part:
+            results['response']['retweeter_ids'] += part['retweeter_ids']
         else:
-            results['response'] = self.__format_tweet_data(data)
-        return results
+            results['enumeration'] = part['enumeration']
 
-    def get_user_timeline(self, user_id: str) -> dict:
-        """Get the latest tweets of a user.
-        Returns last 200 retweets."""
+    def __merged_tweet_data_plan(self, tweet_id: str):
+        results = {'response': []}
+        yield from self.__map_parts(
+            self.__tweet_data_plan(tweet_id),
+            lambda part: self.__merge_tweet_data(results, part))
+        yield PART, results
+
+    def get_tweet_data(self, tweet_id: str) -> dict:
+        """
+        Request full tweet information, including retweet and user information.
+        The retweeter_ids start with the retweets that have details in
+        retweet_info, followed by the other retweeters.
+        """
+        return self.__result(self.__merged_tweet_data_plan(tweet_id))
+
+    async def get_tweet_data_async(self, tweet_id: str) -> dict:
+        """Like get_tweet_data, without blocking the event loop"""
+        return await self.__result_async(self.__merged_tweet_data_plan(tweet_id))
+
+    def stream_tweet_data(self, tweet_id: str):
+        """Yield the parts of iter_tweet_data as ndjson lines"""
+        for part in self.iter_tweet_data(tweet_id):
+            yield json.dumps(part) + '\n'
+
+    async def stream_tweet_data_async(self, tweet_id: str):
+        async for part in self.iter_tweet_data_async(tweet_id):
+            yield json.dumps(part) + '\n'
+
+    def __user_timeline_plan(self, user_id: str):
         params = {
             'user_id': str(user_id),
             'exclude_replies': False,
             'count': 200,
             'tweet_mode': 'extended'
         }
-        route = "statuses/user_timeline"
-        data = self.__request_twitter(route, params)
-        return data
+        data, _ = yield REQUEST, ("statuses/user_timeline", params)
+        yield PART, data
+
+    def get_user_timeline(self, user_id: str) -> dict:
+        """Get the latest tweets of a user.
+        Returns last 200 retweets."""
+        return self.__result(self.__user_timeline_plan(user_id))
+
+    async def get_user_timeline_async(self, user_id: str) -> dict:
+        """Like get_user_timeline, without blocking the event loop"""
+        return await self.__result_async(self.__user_timeline_plan(user_id))
 
     @staticmethod
     def __parse_properties(data, keys: list) -> dict:
@@ -151,8 +611,14 @@ class TracemapTwitterApi:
         data = data[0]
         response = {}
         response['response'] = {}
-        response['response'][data['id_str']] = {}
-        tweet_dict = response['response'][data['id_str']]
+        response['response'][data['id_str']] = \
+            TracemapTwitterApi.__format_tweet(data)
+        return (response)
+
+    @staticmethod
+    def __format_tweet(data: dict) -> dict:
+        """Format one tweet of a statuses/lookup response"""
+        tweet_dict = {}
         tweet_dict["reply_to"] = str(data['in_reply_to_status_id_str'])
         tweet_dict["lang"] = str(data['lang'])
         tweet_dict["author"] = str(data['user']['id_str'])
@@ -162,7 +628,7 @@ class TracemapTwitterApi:
         # The following values are lists
         tweet_dict["hashtags"] = data['entities']['hashtags']
         tweet_dict["user_mentions"] = data['entities']['user_mentions']
-        return (response)
+        return tweet_dict
 
     def __format_tweet_data(self, data: dict) -> dict:
         response = {}
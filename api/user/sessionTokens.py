@@ -0,0 +1,208 @@
+from collections import OrderedDict
+import base64
+import hashlib
+import hmac
+import threading
+import time
+import os
+
+"""
+Session tokens that are verified without the database.
+
+A token is "v1.<issued_at>.<expires_at>.<signature>" with millisecond
+timestamps and an HMAC-SHA256 signature of the email and both timestamps.
+Revoking the sessions of a user appends "<email> <revoked_at>" to a shared
+revocations file, every process reads new lines before it validates a
+token and refuses tokens issued before the revocation.
+
+Validated sessions are kept in a small TTL cache, so tokens from before
+signed sessions only reach the database once per CACHE_TTL.
+"""
+
+SESSION_LIFETIME = int(os.environ.get('SESSION_LIFETIME', 60 * 60 * 24))
+CACHE_TTL = int(os.environ.get('SESSION_CACHE_TTL', 60))
+CACHE_SIZE = 10000
+SECRET_FILE = os.environ.get('SESSION_SECRET_FILE', './user-data/session_secret')
+REVOCATIONS_FILE = os.environ.get('SESSION_REVOCATIONS_FILE', './events/sessions.log')
+TOKEN_VERSION = 'v1'
+
+__lock = threading.Lock()
+__secret = None
+__revoked_at = {}
+__revocations_offset = 0
+#: (email, session_token) -> time until which the session counts as valid
+__validated = OrderedDict()
+
+
+def __get_secret() -> bytes:
+    """
+    Return the signing secret from SESSION_SECRET or the secret file,
+    which is created once and shared by all processes.
+    """
+    global __secret
+    if __secret is None:
+        if os.environ.get('SESSION_SECRET'):
+            __secret = os.environ['SESSION_SECRET'].encode()
+        else:
+            __secret = __read_or_create_secret_file()
+    return __secret
+
+
+def __read_or_create_secret_file() -> bytes:
+    secret_folder = os.path.dirname(SECRET_FILE)
+    if secret_folder and not os.path.exists(secret_folder):
+        os.makedirs(secret_folder, exist_ok=True)
+    try:
+        descriptor = os.open(SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(descriptor, 'wb') as secret_file:
+            secret_file.write(base64.b64encode(os.urandom(32)))
+    # a process that lost the race may read before the winner wrote
+    while True:
+        with open(SECRET_FILE, 'rb') as secret_file:
+            secret = secret_file.read().strip()
+        if secret:
+            return secret
+        time.sleep(0.01)
+
+
+def __sign(email: str, issued_at: int, expires_at: int) -> str:
+    message = ('%s\n%s\n%s' % (email.lower(), issued_at, expires_at)).encode()
+    return hmac.new(__get_secret(), message, hashlib.sha256).hexdigest()
+
+
+def __now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def issue_token(email: str) -> str:
+    """
+    Create a signed session token for a user.
+    :param email: the users email
+    :returns: the session token string
+    """
+    issued_at = __now_ms()
+    with __lock:
+        __read_revocations()
+        # never issue a token the last revocation would refuse
+        issued_at = max(issued_at, __revoked_at.get(email.lower(), 0) + 1)
+    expires_at = issued_at + SESSION_LIFETIME * 1000
+    return '%s.%s.%s.%s' % (TOKEN_VERSION, issued_at, expires_at,
+                            __sign(email, issued_at, expires_at))
+
+
+def is_signed(session_token: str) -> bool:
+    """Tell signed tokens from the random tokens saved in the database"""
+    return isinstance(session_token, str) and \
+        session_token.startswith(TOKEN_VERSION + '.')
+
+
+def __verify(email: str, session_token: str, now: int):
+    """Return the expiry of a valid signed token, None otherwise"""
+    parts = session_token.split('.')
+    if len(parts) != 4:
+        return None
+    try:
+        issued_at = int(parts[1])
+        expires_at = int(parts[2])
+    except ValueError:
+        return None
+    if not hmac.compare_digest(parts[3], __sign(email, issued_at, expires_at)):
+        return None
+    if expires_at <= now or issued_at <= __revoked_at.get(email.lower(), -1):
+        return None
+    return expires_at
+
+
+def check_session(email: str, session_token: str, check_unsigned=None) -> bool:
+    """
+    Validate a session token, from the cache if it was validated recently.
+    :param email: the users email
+    :param session_token: the input session_token
+    :param check_unsigned: function taking email and session_token that
+    validates tokens which are not signed, e.g. against the database
+    :returns: The boolean result of the check
+    """
+    if not isinstance(email, str) or not isinstance(session_token, str):
+        return False
+    now = __now_ms()
+    key = (email.lower(), session_token)
+    with __lock:
+        __read_revocations()
+        valid_until = __validated.get(key)
+        if valid_until is not None:
+            if valid_until > now:
+                __validated.move_to_end(key)
+                return True
+            del __validated[key]
+        if is_signed(session_token):
+            expires_at = __verify(email, session_token, now)
+            if expires_at is None:
+                return False
+            __cache(key, min(expires_at, now + CACHE_TTL * 1000))
+            return True
+        revoked = key[0] in __revoked_at
+    # unsigned tokens of users with revoked sessions are refused
+    if revoked or check_unsigned is None or \
+            not check_unsigned(email, session_token):
+        return False
+    with __lock:
+        if key[0] not in __revoked_at:
+            __cache(key, now + CACHE_TTL * 1000)
+    return True
+
+
+def __cache(key: tuple, valid_until: int):
+    """Remember a validated session. Caller holds the lock"""
+    __validated[key] = valid_until
+    __validated.move_to_end(key)
+    while len(__validated) > CACHE_SIZE:
+        __validated.popitem(last=False)
+
+
+def revoke_sessions(email: str):
+    """
+    Invalidate all sessions of a user that were issued until now,
+    in every process.
+    :param email: the users email
+    """
+    revocations_folder = os.path.dirname(REVOCATIONS_FILE)
+    if revocations_folder and not os.path.exists(revocations_folder):
+        os.makedirs(revocations_folder, exist_ok=True)
+    with __lock:
+        __read_revocations()
+        revoked_at = max(__now_ms(), __revoked_at.get(email.lower(), 0) + 1)
+        with open(REVOCATIONS_FILE, 'a') as revocations_file:
+            revocations_file.write("%s %s\n" % (email.lower(), revoked_at))
+        __apply_revocation(email.lower(), revoked_at)
+
+
+def __apply_revocation(email: str, revoked_at: int):
+    """Remember a revocation and drop cached sessions. Caller holds the lock"""
+    if revoked_at > __revoked_at.get(email, -1):
+        __revoked_at[email] = revoked_at
+    for key in [key for key in __validated if key[0] == email]:
+        del __validated[key]
+
+
+def __read_revocations():
+    """Apply revocations appended since the last call. Caller holds the lock"""
+    global __revocations_offset
+    try:
+        size = os.path.getsize(REVOCATIONS_FILE)
+    except OSError:
+        return
+    if size <= __revocations_offset:
+        return
+    with open(REVOCATIONS_FILE, 'rb') as revocations_file:
+        revocations_file.seek(__revocations_offset)
+        data = revocations_file.read(size - __revocations_offset)
+    # only complete lines, a partial one is read again next time
+    complete = data[:data.rfind(b'\n') + 1]
+    __revocations_offset += len(complete)
+    for line in complete.decode().splitlines():
+        email, _, revoked_at = line.rpartition(' ')
+        if email:
+            __apply_revocation(email, int(revoked_at))
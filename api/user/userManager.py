@@ -4,6 +4,7 @@ import string
 import random
 import os
 import api.user.mailService as mailService
+import api.user.sessionTokens as sessionTokens
 from api.neo4j.tracemapUserAdapter import TracemapUserAdapter
 userAdapter = TracemapUserAdapter()
 
@@ -79,14 +80,19 @@ def register_user(username: str, email: str) -> object:
 
 def check_session(email: string, session_token: string) -> bool:
     """
-    Gets the valid saved session_token from the database
-    and if it exists, compares it with the given session_token  
+    Verifies a signed session_token locally. Tokens from before signed
+    sessions are compared with the saved session_token in the database,
+    recently validated sessions are answered from a cache.  
     :param email: the users email
     :param session_token: the input session_token
     :returns: The boolean result of the check
     """
+    return sessionTokens.check_session(email, session_token, __check_saved_session)
+
+
+def __check_saved_session(email: str, session_token: str) -> bool:
     db_session_token = userAdapter.get_user_session_token(email)
-    return db_session_token == session_token
+    return bool(db_session_token) and db_session_token == session_token
 
 
 def check_password(email: str, password:str) -> object:
@@ -101,14 +107,8 @@ def check_password(email: str, password:str) -> object:
     db_password_hash = userAdapter.get_user_password_hash(email)
     if db_password_hash:
         if check_password_hash(db_password_hash, password.strip()):
-            db_session_token = userAdapter.get_user_session_token(email)
-            if db_session_token:
-                session_token = db_session_token
-            else:
-                session_token = generate_token()
-                userAdapter.set_user_session_token(email, session_token)
             return {
-                'session_token': session_token
+                'session_token': sessionTokens.issue_token(email)
             }
         else:
             return {
@@ -130,6 +130,7 @@ def delete_user(email: str, password: str) -> object:
     result = check_password(email, password)
     if 'session_token' in result:
         if userAdapter.delete_user(email):
+            sessionTokens.revoke_sessions(email)
             return {
                 'deleted': True
             }
@@ -144,20 +145,23 @@ def delete_user(email: str, password: str) -> object:
 
 def change_password(email:str, old_password: str, new_password: str) -> object:
     """
-    Changes the password of a user if the old_password is correct  
+    Changes the password of a user if the old_password is correct and
+    ends all sessions of the user except for a new one returned here  
     :param email: the users email  
     :param old_password: the users actual password  
     :param new_password: the users new password  
-    :returns: on success {'password_changed': True} else
-    {'error': 'Your old password is wrong.'}
+    :returns: on success {'password_changed': True, 'session_token': <new session_token>}
+    else {'error': 'Your old password is wrong.'}
     """
     # no need to check if email is correct, because user is already logged in
     if 'session_token' in check_password(email, old_password):
         hash = generate_password_hash(new_password)
         response = userAdapter.set_user_password_hash(email, hash)
         if response:
+            sessionTokens.revoke_sessions(email)
             return {
-                'passwort_changed': response
+                'passwort_changed': response,
+                'session_token': sessionTokens.issue_token(email)
             }
         else:
             return {
@@ -200,6 +204,7 @@ def reset_password(email: str, reset_token: str) -> str:
         password = __generate_random_pass()
         password_hash = generate_password_hash(password)
         userAdapter.set_user_password_hash(email, password_hash)
+        sessionTokens.revoke_sessions(email)
         username = userAdapter.get_user_username(email)
         mailService.send_new_password(username, email, password)
         return 'You received an email with a new password.'
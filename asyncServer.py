@@ -0,0 +1,653 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import hashlib
+import time
+import os
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import api.encoding.compactEncoding as compactEncoding
+import api.metrics.prometheusMetrics as prometheusMetrics
+import api.neo4j.connectionManager as connectionManager
+import api.neo4j.neo4jApi as neo4jApi
+import api.trace.traceApi as traceApi
+import api.trace.traceJobs as traceJobs
+import api.user.newsletterModule as newsletterModule
+import api.user.userManager as userManager
+import api.logging.logger as logger
+
+from api.twitter.twitterApi import TracemapTwitterApi
+twitterApi = TracemapTwitterApi()
+
+"""
+ASGI serving mode with the routes of server.py. Requests are coroutines,
+so one process keeps hundreds of them in flight. The blocking neo4j and
+mail calls run on a bounded thread pool, waiting for twitter retries
+happens on the event loop. Run it with
+uvicorn asyncServer:app --host 0.0.0.0 --port 5200
+"""
+
+"""Threads for blocking calls, more than the neo4j pool would only queue"""
+BLOCKING_THREADS = int(os.environ.get('ASYNC_BLOCKING_THREADS',
+                                      connectionManager.MAX_POOL_SIZE))
+
+
+async def __lifespan(app):
+    loop = asyncio.get_event_loop()
+    executor = ThreadPoolExecutor(max_workers=BLOCKING_THREADS)
+    # twitterApi runs its requests on the default executor as well
+    loop.set_default_executor(executor)
+    yield
+    executor.shutdown(wait=False)
+
+
+async def __run_blocking(function, *arguments):
+    """Run a blocking function on the executor and await its result"""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(function, *arguments))
+
+
+async def __iterate_blocking(generator):
+    """Turn a blocking generator into an async one, chunk by chunk"""
+    done = object()
+    while True:
+        chunk = await __run_blocking(next, generator, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+async def __get_json(request):
+    """Return the json body like flask's get_json or None without one"""
+    if 'json' not in request.headers.get('content-type', ''):
+        return None
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def __best_mimetype(request) -> str:
+    """Return the accepted mimetype with the highest quality"""
+    best, best_quality = None, 0.0
+    for accepted in request.headers.get('accept', '').split(','):
+        mimetype, *parameters = [part.strip() for part in accepted.split(';')]
+        quality = 1.0
+        for parameter in parameters:
+            if parameter.startswith('q='):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    quality = 0.0
+        if mimetype and quality > best_quality:
+            best, best_quality = mimetype, quality
+    return best
+
+
+class RequestDurationMiddleware(BaseHTTPMiddleware):
+    """Records the duration of every request like server.py does"""
+
+    async def dispatch(self, request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        endpoint = request.scope.get('endpoint')
+        prometheusMetrics.REQUEST_DURATION.labels(
+            endpoint.__name__ if endpoint else 'unmatched', request.method,
+            response.status_code
+        ).observe(time.perf_counter() - start)
+        return response
+
+
+async def __is_session_valid(email: str, session_token: str) -> bool:
+    return await __run_blocking(userManager.check_session, email, session_token)
+
+
+def __is_not_modified(request, etag: str) -> bool:
+    """Tell if the client sent the ETag of the response in If-None-Match"""
+    if not etag:
+        return False
+    for candidate in request.headers.get('if-none-match', '').split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.replace('W/', '', 1).strip('"') == etag:
+            return True
+    return False
+
+
+def __is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def __is_string_list(value) -> bool:
+    """Strings are iterable too, a single one is no list of uids"""
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def __forbidden():
+    return PlainTextResponse("Forbidden", status_code=403)
+
+
+def __bad_request():
+    return PlainTextResponse("Bad Request", status_code=400)
+
+
+async def metrics(request):
+    """Returns the metrics of all workers in the prometheus text format"""
+    payload, content_type = prometheusMetrics.generate()
+    return Response(payload, headers={'Content-Type': content_type})
+
+
+async def health_check(request):
+    """Request health status of the api"""
+    return PlainTextResponse("OK", status_code=200)
+
+
+async def twitter_get_tweet_info(request):
+    """
+    Returns shortform of twitter_get_tweet_data
+    to get e.g. the number of retweets for a tweet
+    """
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email", "tweet_id")):
+        session_token = body['session_token']
+        email = body['email']
+        tweet_id = body['tweet_id']
+        if await __is_session_valid(email, session_token):
+            return JSONResponse(await twitterApi.get_tweet_info_async(tweet_id))
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def twitter_get_tweets_info(request):
+    """
+    Takes a list of tweet_ids and returns the shortform
+    of twitter_get_tweet_data for every found tweet
+    """
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email", "tweet_ids")):
+        session_token = body['session_token']
+        email = body['email']
+        tweet_ids = body['tweet_ids']
+        if await __is_session_valid(email, session_token):
+            return JSONResponse(await twitterApi.get_tweets_info_async(tweet_ids))
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def twitter_get_tweet_data(request):
+    """
+    Returns data of a tweet to get the detailed
+    tweet data (retweeter_ids etc.)
+    Clients accepting application/x-msgpack get the compact columnar encoding,
+    clients accepting application/x-ndjson get the retweeters streamed
+    page by page as lines of TracemapTwitterApi.iter_tweet_data
+    """
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email", "tweet_id")):
+        session_token = body['session_token']
+        email = body['email']
+        tweet_id = body['tweet_id']
+        if await __is_session_valid(email, session_token):
+            if __best_mimetype(request) == 'application/x-ndjson':
+                return StreamingResponse(twitterApi.stream_tweet_data_async(tweet_id),
+                                         media_type='application/x-ndjson')
+            tweet_data = await twitterApi.get_tweet_data_async(tweet_id)
+            if __best_mimetype(request) == compactEncoding.MIMETYPE:
+                return Response(compactEncoding.encode_tweet_data(tweet_data),
+                                media_type=compactEncoding.MIMETYPE)
+            return JSONResponse(tweet_data)
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def twitter_get_user_timeline(request):
+    """
+    Takes a user_id and returns the last 200
+    tweets/retweets of this user
+    """
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email", "user_id")):
+        session_token = body['session_token']
+        email = body['email']
+        user_id = body['user_id']
+        if await __is_session_valid(email, session_token):
+            return JSONResponse(await twitterApi.get_user_timeline_async(user_id))
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def twitter_get_user_info(request):
+    """
+    Takes a comma seperated list of user_ids
+    returns a user_info json object, suspended or
+    deleted users are listed under missing
+    """
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email", "user_ids")):
+        session_token = body['session_token']
+        email = body['email']
+        user_ids = body['user_ids']
+        if await __is_session_valid(email, session_token):
+            return JSONResponse(await twitterApi.get_user_info_async(user_ids))
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def trace(request):
+    """
+    Takes a tweet_id and returns the tweet data, the labelled users,
+    the follower subnetwork and the user info of its retweeters in one
+    response together with the duration of every stage in ms
+    """
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email", "tweet_id")):
+        session_token = body['session_token']
+        email = body['email']
+        tweet_id = body['tweet_id']
+        if await __is_session_valid(email, session_token):
+            return JSONResponse(await traceApi.get_trace_async(twitterApi, tweet_id))
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def trace_submit_job(request):
+    """
+    Takes a tweet_id and starts tracing it in the background.
+    Returns the job_id to poll and fetch the trace with
+    """
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email", "tweet_id")):
+        session_token = body['session_token']
+        email = body['email']
+        tweet_id = body['tweet_id']
+        if await __is_session_valid(email, session_token):
+            return JSONResponse(await __run_blocking(
+                traceJobs.submit_job, twitterApi, email, tweet_id))
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def trace_get_job_status(request):
+    """
+    Takes a job_id and returns the status, the version and
+    the users waiting for the crawler of a trace job
+    """
+    return await __get_trace_job(request, include_result=False)
+
+
+async def trace_get_job_result(request):
+    """
+    Takes a job_id and returns the job with the stages of
+    the trace that are finished so far
+    """
+    return await __get_trace_job(request, include_result=True)
+
+
+async def __get_trace_job(request, include_result: bool):
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email", "job_id")):
+        session_token = body['session_token']
+        email = body['email']
+        job_id = body['job_id']
+        if await __is_session_valid(email, session_token):
+            job = await __run_blocking(traceJobs.get_job, job_id, email, include_result)
+            if job is None:
+                return PlainTextResponse("Not Found", status_code=404)
+            return JSONResponse(job)
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def twitter_pool_status(request):
+    """
+    Returns the tokens, requests in flight and waiting and
+    the wait times of the token pools of the answering worker
+    """
+    return JSONResponse(twitterApi.get_pool_stats())
+
+
+async def twitter_cache_status(request):
+    """
+    Returns hits, misses and the size of the twitter response
+    cache of the answering worker
+    """
+    return JSONResponse(twitterApi.get_cache_stats())
+
+
+async def neo4j_get_followers(request):
+    """
+    Takes a comma seperated list of user_ids and returns the subnetwork of followship
+    relations between those users.
+    Clients accepting application/x-ndjson get the relations streamed as
+    [follower, user] lines or, with group_by_user, as {user: [followers]} lines,
+    clients accepting application/x-msgpack get the compact columnar encoding.
+    The X-Followers-Version header can be sent back as since_version to only
+    get the users written since, an unchanged subgraph is answered with 304
+    Not Modified for the ETag in If-None-Match
+    """
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email", "user_ids")):
+        session_token = body['session_token']
+        email = body['email']
+        user_ids = body['user_ids']
+        if await __is_session_valid(email, session_token):
+            if __best_mimetype(request) == 'application/x-ndjson':
+                group_by_user = bool(body.get('group_by_user'))
+                stream = neo4jApi.stream_followers(user_ids, group_by_user)
+                return StreamingResponse(__iterate_blocking(stream),
+                                         media_type='application/x-ndjson')
+            since_version = body.get('since_version')
+            if since_version is not None and not __is_number(since_version):
+                return __bad_request()
+            version = await __run_blocking(
+                neo4jApi.get_followers_version, user_ids, since_version)
+            if __is_not_modified(request, version['etag']):
+                response = Response(status_code=304)
+            else:
+                if since_version is None:
+                    followers = await __run_blocking(neo4jApi.get_followers, user_ids)
+                else:
+                    followers = await __run_blocking(
+                        neo4jApi.get_followers_since, user_ids, since_version,
+                        version['timestamps'])
+                if __best_mimetype(request) == compactEncoding.MIMETYPE:
+                    response = Response(await __run_blocking(
+                        compactEncoding.encode_followers, followers),
+                        media_type=compactEncoding.MIMETYPE)
+                else:
+                    response = JSONResponse(followers)
+            response.headers['X-Followers-Version'] = str(version['version'])
+            if version['etag']:
+                response.headers['ETag'] = 'W/"%s"' % version['etag']
+            return response
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def neo4j_get_user_info(request):
+    """
+    Takes a list of user_ids and returns the saved user info of every
+    user found in the database. An optional list of properties limits
+    the returned properties
+    """
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email", "user_ids")):
+        session_token = body['session_token']
+        email = body['email']
+        user_ids = body['user_ids']
+        properties = body.get('properties')
+        if await __is_session_valid(email, session_token):
+            if not __is_string_list(user_ids) or \
+                    (properties is not None and not __is_string_list(properties)):
+                return __bad_request()
+            return JSONResponse(await __run_blocking(
+                neo4jApi.get_users_info, user_ids, properties))
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def neo4j_cache_status(request):
+    """
+    Returns hit ratio and memory use of the follower cache
+    and the state of the follower snapshot
+    """
+    return JSONResponse({
+        'follower_cache': neo4jApi.follower_cache.get_stats(),
+        'follower_snapshot': neo4jApi.follower_snapshot.get_stats()
+    })
+
+
+async def neo4j_pool_status(request):
+    """
+    Returns the pool size, the sessions in use and the
+    session wait times of the answering worker
+    """
+    return JSONResponse(connectionManager.get_pool_metrics())
+
+
+async def neo4j_label_unknown_users(request):
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email", "user_ids")):
+        session_token = body['session_token']
+        email = body['email']
+        user_ids = body['user_ids']
+        if await __is_session_valid(email, session_token):
+            response = JSONResponse(await __run_blocking(
+                neo4jApi.label_unknown_users, user_ids))
+            etag = hashlib.sha1(response.body).hexdigest()
+            if __is_not_modified(request, etag):
+                response = Response(status_code=304)
+            response.headers['ETag'] = 'W/"%s"' % etag
+            return response
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def newsletter_start_subscription(request):
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("email", "newsletter_subscribed", "beta_subscribed")):
+        email = body['email']
+        newsletter_subscribed = body['newsletter_subscribed']
+        beta_subscribed = body['beta_subscribed']
+        return JSONResponse(await __run_blocking(
+            newsletterModule.start_save_subscriber,
+            email, newsletter_subscribed, beta_subscribed))
+    else:
+        return __bad_request()
+
+
+async def newsletter_confirm_subscription(request):
+    email = request.path_params['email']
+    confirmation_token = request.path_params['confirmation_token']
+    return HTMLResponse(await __run_blocking(
+        newsletterModule.save_subscriber, email, confirmation_token))
+
+
+async def auth_check_password(request):
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("password","email")):
+        email = body['email']
+        password = body['password']
+        return JSONResponse(await __run_blocking(
+            userManager.check_password, email, password))
+    else:
+        return __bad_request()
+
+
+async def auth_register_user(request):
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("username","email")):
+        email = body['email']
+        username = body['username']
+        return JSONResponse(await __run_blocking(
+            userManager.register_user, username, email))
+    else:
+        return __bad_request()
+
+
+async def auth_delete_user(request):
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("password","email")):
+        email = body['email']
+        password = body['password']
+        return JSONResponse(await __run_blocking(
+            userManager.delete_user, email, password))
+    else:
+        return __bad_request()
+
+
+async def auth_change_password(request):
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("email", "old_password", "new_password")):
+        email = body['email']
+        old_password = body['old_password']
+        new_password = body['new_password']
+        return JSONResponse(await __run_blocking(
+            userManager.change_password, email, old_password, new_password))
+    else:
+        return __bad_request()
+
+
+async def auth_get_user_username(request):
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("email", "session_token")):
+        email = body['email']
+        session_token = body['session_token']
+        if await __is_session_valid(email, session_token):
+            return JSONResponse(await __run_blocking(userManager.get_username, email))
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def auth_check_session(request):
+    body = await __get_json(request)
+    if body and all (keys in body for keys in
+    ("session_token","email")):
+        email = body['email']
+        session_token = body['session_token']
+        if await __is_session_valid(email, session_token):
+            return JSONResponse(True)
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def auth_request_reset_password(request):
+    body = await __get_json(request)
+    if body and 'email' in body:
+        email = body['email']
+        return JSONResponse(await __run_blocking(userManager.request_reset_user, email))
+    else:
+        return __bad_request()
+
+
+async def auth_reset_password(request):
+    email = request.path_params['email']
+    reset_token = request.path_params['reset_token']
+    return HTMLResponse(await __run_blocking(
+        userManager.reset_password, email, reset_token))
+
+
+async def logging_write_log(request):
+    """
+    Takes a log_object or a list of log_objects and queues them to be
+    appended to the log file file_name. Returns how many were accepted
+    and how many were dropped because the buffer was full
+    """
+    required_parameters = (
+        "email",
+        "session_token",
+        "file_name")
+    body = await __get_json(request)
+    if body and all (key in body for key in required_parameters) and \
+            ("log_object" in body or "log_objects" in body):
+        email = body["email"]
+        session_token = body["session_token"]
+        if await __is_session_valid(email, session_token):
+            log_objects = body.get("log_objects", [body.get("log_object")])
+            file_name = body["file_name"]
+            if not logger.is_valid_file_name(file_name) or \
+                    not isinstance(log_objects, list) or \
+                    not all(isinstance(log_object, dict) for log_object in log_objects):
+                return __bad_request()
+            for log_object in log_objects:
+                log_object['email'] = email
+            # only queues the lines, the writer thread does the file io
+            return JSONResponse(logger.save_logs(log_objects, file_name))
+        else:
+            return __forbidden()
+    else:
+        return __bad_request()
+
+
+async def logging_status(request):
+    """Returns the counters of the log buffer of the answering worker"""
+    return JSONResponse(logger.log_writer.get_stats())
+
+
+routes = [
+    Route('/metrics', metrics),
+    Route('/status', health_check),
+    Route('/twitter/get_tweet_info', twitter_get_tweet_info, methods=['POST']),
+    Route('/twitter/get_tweets_info', twitter_get_tweets_info, methods=['POST']),
+    Route('/twitter/get_tweet_data', twitter_get_tweet_data, methods=['POST']),
+    Route('/twitter/get_user_timeline', twitter_get_user_timeline, methods=['POST']),
+    Route('/twitter/get_user_info', twitter_get_user_info, methods=['POST']),
+    Route('/twitter/pool_status', twitter_pool_status),
+    Route('/twitter/cache_status', twitter_cache_status),
+    Route('/trace', trace, methods=['POST']),
+    Route('/trace/submit_job', trace_submit_job, methods=['POST']),
+    Route('/trace/get_job_status', trace_get_job_status, methods=['POST']),
+    Route('/trace/get_job_result', trace_get_job_result, methods=['POST']),
+    Route('/neo4j/get_followers', neo4j_get_followers, methods=['POST']),
+    Route('/neo4j/get_user_info', neo4j_get_user_info, methods=['POST']),
+    Route('/neo4j/cache_status', neo4j_cache_status),
+    Route('/neo4j/pool_status', neo4j_pool_status),
+    Route('/neo4j/label_unknown_users', neo4j_label_unknown_users, methods=['POST']),
+    Route('/newsletter/start_subscription', newsletter_start_subscription, methods=['POST']),
+    Route('/newsletter/confirm_subscription/{email}/{confirmation_token}',
+          newsletter_confirm_subscription),
+    Route('/auth/check_password', auth_check_password, methods=['POST']),
+    Route('/auth/add_user', auth_register_user, methods=['POST']),
+    Route('/auth/delete_user', auth_delete_user, methods=['POST']),
+    Route('/auth/change_password', auth_change_password, methods=['POST']),
+    Route('/auth/get_username', auth_get_user_username, methods=['POST']),
+    Route('/auth/check_session', auth_check_session, methods=['POST']),
+    Route('/auth/request_reset_password', auth_request_reset_password, methods=['POST']),
+    Route('/auth/reset_password/{email}/{reset_token}', auth_reset_password),
+    Route('/logging/write_log', logging_write_log, methods=['POST']),
+    Route('/logging/status', logging_status)
+]
+
+app = Starlette(routes=routes, lifespan=__lifespan, middleware=[
+    Middleware(RequestDurationMiddleware),
+    Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'],
+               allow_headers=['*'], expose_headers=['ETag', 'X-Followers-Version'])
+])
@@ -0,0 +1,211 @@
+"""
+Load test comparing the uwsgi like serving mode of server.py with the
+ASGI mode of asyncServer.py. Without urls both apps are started locally
+on the fake neo4j driver and the fake twitter api: server.py in WORKERS
+single threaded prefork processes like wsgi-conf.ini, asyncServer.py in
+one uvicorn process. Sessions are accepted without a database in that
+mode. Every route in ROUTES is loaded, the twitter routes with another
+tweet per request, so neither the cache nor coalescing answers them.
+Run it from the project root:
+python bin/benchmarks/asyncLoadTest.py [--latency ms] [--twitter-latency ms]
+    [--failure-rate share] [--retry-interval s] [--requests n] [--concurrency n]
+    [--routes /trace ...]
+python bin/benchmarks/asyncLoadTest.py --sync-url http://host:5000 --async-url http://host:5200 \
+    --email user@example.com --session-token token
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from urllib.parse import urlparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+os.environ['FOLLOWER_SNAPSHOT_DIR'] = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), 'no-snapshot')
+
+import api.twitter.twitterApi as twitterApi
+from fakeNeo4jDriver import FakeDriver, FakeGraph
+from fakeTwitterApi import FakeTwitter
+import fakeTwitterApi
+
+"""Processes of the sync server, like processes in wsgi-conf.ini"""
+WORKERS = 5
+"""Neo4j only, twitter only and both, the trace awaits them concurrently"""
+ROUTES = ['/neo4j/get_user_info', '/twitter/get_tweet_data', '/trace']
+USERS_PER_REQUEST = 100
+
+
+def __prepare_process(settings: dict):
+    """Install the fakes and accept every session in this process"""
+    import api.neo4j.connectionManager as connectionManager
+    import api.user.userManager as userManager
+    graph = FakeGraph.generate(USERS_PER_REQUEST, 10)
+    connectionManager.set_driver(FakeDriver(graph, settings['latency']))
+    fakeTwitterApi.install(FakeTwitter(
+        sorted(graph.users), settings['twitter_latency'], settings['failure_rate']),
+        settings['retry_interval'])
+    userManager.check_session = lambda email, session_token: True
+
+
+def __serve_sync(listener: socket.socket, settings: dict):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    __prepare_process(settings)
+    from server import app
+    make_server('127.0.0.1', 0, app, fd=listener.fileno()).serve_forever()
+
+
+def __serve_async(port: int, settings: dict):
+    import uvicorn
+    __prepare_process(settings)
+    from asyncServer import app
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning')
+
+
+def start_local_servers(settings: dict) -> tuple:
+    """
+    Start both serving modes, return their urls and processes.
+    :param settings: dict of the fake neo4j latency, the fake twitter
+    latency in seconds, its failure_rate and the retry_interval
+    """
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(128)
+    processes = [multiprocessing.Process(target=__serve_sync, args=(listener, settings))
+                 for _ in range(WORKERS)]
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        async_port = probe.getsockname()[1]
+    processes.append(multiprocessing.Process(target=__serve_async,
+                                             args=(async_port, settings)))
+    for process in processes:
+        process.daemon = True
+        process.start()
+    urls = ('http://127.0.0.1:%s' % listener.getsockname()[1],
+            'http://127.0.0.1:%s' % async_port)
+    for url in urls:
+        wait_until_up(url)
+    return urls, processes
+
+
+def wait_until_up(url: str, timeout: float = 30):
+    parsed = urlparse(url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((parsed.hostname, parsed.port), 1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("%s did not start" % url)
+
+
+async def post(url: str, body: dict) -> int:
+    """POST json on a fresh connection, return the status code"""
+    parsed = urlparse(url)
+    reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port)
+    payload = json.dumps(body).encode()
+    writer.write((
+        "POST %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\n"
+        "Content-Length: %s\r\nConnection: close\r\n\r\n" % (
+            parsed.path, parsed.netloc, len(payload))).encode() + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def run_load(url: str, make_body, requests: int, concurrency: int) -> dict:
+    """
+    :param make_body: called with the number of a request, returns its body
+    """
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def single_request(number):
+        nonlocal errors
+        async with slots:
+            start = time.perf_counter()
+            try:
+                status = await post(url, make_body(number))
+            except OSError:
+                status = None
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[single_request(number) for number in range(requests)])
+    duration = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'throughput': requests / duration,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'errors': errors
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=100.0,
+                        help='milliseconds per fake neo4j statement')
+    parser.add_argument('--twitter-latency', type=float, default=300.0,
+                        help='milliseconds per fake twitter request')
+    parser.add_argument('--failure-rate', type=float, default=0.02,
+                        help='share of fake twitter requests failing to connect')
+    parser.add_argument('--retry-interval', type=float,
+                        default=twitterApi.RETRY_INTERVAL,
+                        help='seconds twitterApi waits before retrying')
+    parser.add_argument('--routes', nargs='+', default=ROUTES)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--sync-url')
+    parser.add_argument('--async-url')
+    parser.add_argument('--email', default='loadtest@tracemap.info')
+    parser.add_argument('--session-token', default='loadtest')
+    arguments = parser.parse_args()
+
+    processes = []
+    if arguments.sync_url and arguments.async_url:
+        urls = (arguments.sync_url, arguments.async_url)
+        user_ids = [str(10 ** 9 + index) for index in range(USERS_PER_REQUEST)]
+    else:
+        user_ids = sorted(FakeGraph.generate(USERS_PER_REQUEST, 10).users)
+        urls, processes = start_local_servers({
+            'latency': arguments.latency / 1000,
+            'twitter_latency': arguments.twitter_latency / 1000,
+            'failure_rate': arguments.failure_rate,
+            'retry_interval': arguments.retry_interval
+        })
+
+    def make_body(number):
+        body = {'email': arguments.email, 'session_token': arguments.session_token}
+        if route.startswith('/neo4j/'):
+            body['user_ids'] = user_ids
+        else:
+            # another tweet per request, the cache and coalescing do not help
+            body['tweet_id'] = str(10 ** 17 + number)
+        return body
+
+    try:
+        print("%-24s | %-6s | %8s | %8s | %8s | %8s | %6s" % (
+            "route", "mode", "req/s", "p50 ms", "p95 ms", "max ms", "errors"))
+        for route in arguments.routes:
+            for mode, url in zip(('sync', 'async'), urls):
+                result = asyncio.get_event_loop().run_until_complete(run_load(
+                    url + route, make_body, arguments.requests, arguments.concurrency))
+                print("%-24s | %-6s | %8.1f | %8.1f | %8.1f | %8.1f | %6s" % (
+                    route, mode, result['throughput'], result['p50_ms'],
+                    result['p95_ms'], result['max_ms'], result['errors']))
+    finally:
+        for process in processes:
+            process.terminate()
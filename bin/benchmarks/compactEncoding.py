@@ -0,0 +1,101 @@
+"""
+Benchmarks the compact MessagePack encoding of get_followers and
+get_tweet_data against the JSON jsonify sends: encode time, decode time
+and payload size, raw and gzipped. Run it from the project root:
+python bin/benchmarks/compactEncoding.py
+"""
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import api.encoding.compactEncoding as compactEncoding
+
+#: (users, average followers among them)
+FOLLOWER_SIZES = [(1000, 20), (5000, 50), (10000, 100)]
+RETWEET_SIZES = [100]
+REPETITIONS = 3
+
+
+def generate_followers(num_users: int, average_followers: int, seed: int = 42) -> dict:
+    generator = random.Random(seed)
+    uids = [str(generator.randrange(10 ** 17, 10 ** 18)) for _ in range(num_users)]
+    return {uid: generator.sample(uids, generator.randint(0, 2 * average_followers))
+            for uid in uids}
+
+
+def generate_tweet_data(num_retweets: int, seed: int = 42) -> dict:
+    generator = random.Random(seed)
+
+    def user(uid):
+        return {
+            'id_str': uid, 'created_at': 'Mon Jun 04 08:11:05 +0000 2018',
+            'name': 'name %s' % uid, 'screen_name': 'screen_name_%s' % uid,
+            'description': 'a description ' * 5, 'favourites_count': 1234,
+            'followers_count': 5678, 'friends_count': 910,
+            'profile_image_url_https': 'https://pbs.twimg.com/profile_images/%s.jpg' % uid,
+            'statuses_count': 1112, 'verified': False, 'location': 'Berlin',
+            'lang': 'de'
+        }
+
+    def tweet(tweet_id, uid):
+        return {
+            'id_str': tweet_id, 'created_at': 'Mon Jun 04 08:11:05 +0000 2018',
+            'lang': 'de', 'favorite_count': 0, 'retweet_count': num_retweets,
+            'entities': {'hashtags': [], 'user_mentions': []},
+            'source': '<a href="http://twitter.com">Twitter Web Client</a>',
+            'text': 'RT a retweeted text ' * 6, 'is_quote_status': False,
+            'in_reply_to_status_id_str': None, 'in_reply_to_user_id_str': None,
+            'user': user(uid)
+        }
+
+    uids = [str(generator.randrange(10 ** 17, 10 ** 18)) for _ in range(num_retweets)]
+    return {'response': {
+        'tweet_info': tweet('1', '2'),
+        'retweeter_ids': uids,
+        'retweet_info': {uid: tweet(str(index + 10), uid) for index, uid in enumerate(uids)}
+    }}
+
+
+def jsonify_dumps(data) -> bytes:
+    """What flask's jsonify sends outside of debug mode"""
+    return (json.dumps(data, separators=(',', ':')) + '\n').encode()
+
+
+def best_time(function, argument):
+    best = None
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        result = function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+def report(name: str, data: dict, encode, decode):
+    for encoding, encode_function, decode_function in [
+            ('json', jsonify_dumps, json.loads), ('msgpack', encode, decode)]:
+        encode_ms, payload = best_time(encode_function, data)
+        decode_ms, decoded = best_time(decode_function, payload)
+        if decoded != data:
+            print("WARNING: %s does not round trip %s!" % (encoding, name))
+        print("%-26s | %-7s | %9.1f | %9.1f | %10s | %10s" % (
+            name, encoding, encode_ms, decode_ms, len(payload),
+            len(gzip.compress(payload))))
+
+
+if __name__ == '__main__':
+    print("%-26s | %-7s | %9s | %9s | %10s | %10s" % (
+        "response", "format", "encode ms", "decode ms", "bytes", "gzip bytes"))
+    for num_users, average_followers in FOLLOWER_SIZES:
+        followers = generate_followers(num_users, average_followers)
+        report("followers %s x %s" % (num_users, average_followers), followers,
+               compactEncoding.encode_followers, compactEncoding.decode_followers)
+    for num_retweets in RETWEET_SIZES:
+        tweet_data = generate_tweet_data(num_retweets)
+        report("tweet data %s retweets" % num_retweets, tweet_data,
+               compactEncoding.encode_tweet_data, compactEncoding.decode_tweet_data)
@@ -0,0 +1,188 @@
+"""
+Local stand in for the neo4j driver used by the offline benchmarks.
+It answers the constant parameterized queries of neo4jApi from an in
+memory graph, sleeps a configurable latency per statement and counts
+statements and transferred bytes.
+"""
+import json
+import random
+import time
+
+import api.neo4j.neo4jApi as neo4jApi
+
+
+class FakeGraph:
+
+    def __init__(self, users: dict, followers: dict):
+        """
+        :param users: dict of {uid: properties} with 'labels' in properties
+        :param followers: dict of {uid: set of follower uids}
+        """
+        self.users = users
+        self.followers = followers
+        self.following = {}
+        for uid, user_followers in followers.items():
+            for follower in user_followers:
+                self.following.setdefault(follower, set()).add(uid)
+
+    @classmethod
+    def generate(cls, num_users: int, followers_per_user: int, seed: int = 42):
+        """Generate a random graph with crawled users and profiles"""
+        generator = random.Random(seed)
+        uids = [str(10 ** 9 + index) for index in range(num_users)]
+        users = {}
+        followers = {}
+        for uid in uids:
+            users[uid] = {
+                'uid': uid,
+                'labels': [generator.choice(['PRIORITY2', 'PRIORITY3', 'QUEUED'])],
+                'timestamp': generator.randint(0, int(time.time())),
+                'name': 'user %s' % uid,
+                'screen_name': 'user_%s' % uid,
+                'followers_count': followers_per_user
+            }
+            followers[uid] = set(generator.sample(uids, followers_per_user))
+        return cls(users, followers)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Load a recorded graph from a json file of the form
+        {"users": {uid: properties}, "followers": {uid: [follower uids]}}
+        """
+        with open(path) as graph_file:
+            data = json.load(graph_file)
+        return cls(data['users'], {uid: set(user_followers) for uid, user_followers
+                                   in data['followers'].items()})
+
+    def run(self, query: str, parameters: dict) -> list:
+        """Answer one of the neo4jApi queries"""
+        if query == neo4jApi.FOLLOWERS_QUERY:
+            end_uids = set(parameters['end_uids'])
+            return [{'start_uid': start, 'end_uid': end}
+                    for start in parameters['start_uids']
+                    for end in self.following.get(start, ()) if end in end_uids]
+        if query == neo4jApi.FOLLOWERS_ADJACENCY_QUERY:
+            start_uids = set(parameters['start_uids'])
+            rows = []
+            for end in parameters['end_uids']:
+                user_followers = self.followers.get(end, set()) & start_uids
+                if user_followers:
+                    rows.append({'end_uid': end, 'start_uids': list(user_followers)})
+            return rows
+        if query == neo4jApi.USERS_INFO_QUERY:
+            return [{'uid': uid, 'properties': self.__properties(uid)}
+                    for uid in parameters['uids'] if uid in self.users]
+        if query == neo4jApi.USERS_INFO_PROJECTION_QUERY:
+            return [{'uid': uid, 'values': [self.users[uid].get(key)
+                                            for key in parameters['properties']]}
+                    for uid in parameters['uids'] if uid in self.users]
+        if query == neo4jApi.USER_TIMESTAMPS_QUERY:
+            return [{'uid': uid, 'timestamp': self.users[uid].get('timestamp')}
+                    for uid in parameters['uids'] if uid in self.users]
+        if query == neo4jApi.ADD_USER_INFO_QUERY:
+            rows = []
+            for row in parameters['rows']:
+                if row['uid'] in self.users:
+                    self.users[row['uid']].update(row['properties'])
+                    rows.append({'uid': row['uid']})
+            return rows
+        if query == neo4jApi.LABEL_UNKNOWN_USERS_QUERY:
+            return self.__label_unknown_users(parameters)
+        raise ValueError("The fake driver does not know the query: %s" % query)
+
+    def __properties(self, uid: str) -> dict:
+        properties = dict(self.users[uid])
+        del properties['labels']
+        return properties
+
+    def __label_unknown_users(self, parameters: dict) -> list:
+        uncrawled = []
+        unwritten = []
+        for uid in parameters['uids']:
+            user = self.users.setdefault(uid, {'uid': uid, 'labels': []})
+            labels = user['labels']
+            timestamp = user.get('timestamp')
+            # like cypher, comparing a string with a number is never true
+            outdated = isinstance(timestamp, (int, float)) and \
+                timestamp < parameters['outdated']
+            if 'PRIORITY2' in labels or not labels or \
+                    ('PRIORITY3' in labels and outdated):
+                user['labels'] = [label for label in labels
+                                  if label not in ('PRIORITY2', 'PRIORITY3')]
+                user['labels'].append('PRIORITY1')
+            if 'PRIORITY1' in user['labels']:
+                uncrawled.append(uid)
+            if 'QUEUED' in user['labels']:
+                unwritten.append(uid)
+        return [{'uncrawled': uncrawled, 'unwritten': unwritten}]
+
+
+class FakeResult:
+
+    def __init__(self, rows: list):
+        self.rows = rows
+
+    def data(self) -> list:
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeSession:
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.success = None
+
+    def run(self, query: str, parameters: dict = None) -> FakeResult:
+        return self.driver.run(query, parameters or {})
+
+    def begin_transaction(self):
+        return self
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FakeDriver:
+
+    def __init__(self, graph: FakeGraph, latency: float = 0.0):
+        """
+        :param graph: the graph the queries are answered from
+        :param latency: seconds every statement waits, like a network round trip
+        """
+        self.graph = graph
+        self.latency = latency
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.statements = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        #: cpu time spent answering queries, not part of the measured code
+        self.driver_cpu_time = 0.0
+
+    def session(self) -> FakeSession:
+        return FakeSession(self)
+
+    def run(self, query: str, parameters: dict) -> FakeResult:
+        cpu_start = time.process_time()
+        self.statements += 1
+        self.bytes_sent += len(query.encode()) + len(json.dumps(parameters))
+        rows = self.graph.run(query, parameters)
+        self.bytes_received += len(json.dumps(rows, default=str))
+        self.driver_cpu_time += time.process_time() - cpu_start
+        if self.latency:
+            time.sleep(self.latency)
+        return FakeResult(rows)
+
+    def close(self):
+        pass
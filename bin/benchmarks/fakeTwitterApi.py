@@ -0,0 +1,120 @@
+"""
+Local stand in for the twitter api used by the offline benchmarks.
+It answers the routes twitterApi requests for a fixed set of retweeters,
+sleeps a configurable latency per request and fails a configurable share
+of requests with a connection error, which twitterApi answers by waiting
+RETRY_INTERVAL seconds before it retries.
+"""
+import random
+import threading
+import time
+
+import api.twitter.lookupCache as lookupCache
+import api.twitter.twitterApi as twitterApi
+from api.twitter.tokenProvider import RateLimit
+
+CREATED_AT = 'Mon Jun 04 08:11:05 +0000 2018'
+
+
+def fake_user(uid: str) -> dict:
+    return {
+        'id_str': uid, 'name': 'user %s' % uid, 'screen_name': 'user_%s' % uid,
+        'location': '', 'lang': 'en', 'followers_count': 10, 'friends_count': 10,
+        'statuses_count': 10, 'created_at': CREATED_AT,
+        'profile_image_url': 'http://pbs.twimg.com/profile_images/1/a.jpg'
+    }
+
+
+def fake_tweet(tweet_id: str, uid: str) -> dict:
+    return {
+        'id_str': tweet_id, 'in_reply_to_status_id_str': None, 'lang': 'en',
+        'user': fake_user(uid), 'favorite_count': 0, 'retweet_count': 0,
+        'created_at': CREATED_AT, 'text': 'tweet %s' % tweet_id,
+        'entities': {'hashtags': [], 'user_mentions': []}
+    }
+
+
+class FakeTwitterResponse:
+
+    def __init__(self, data):
+        self.data = data
+        self.headers = {}
+
+    def json(self):
+        return self.data
+
+
+class FakeTwitter:
+
+    def __init__(self, retweeter_ids: list, latency: float = 0.0,
+                 failure_rate: float = 0.0, seed: int = 42):
+        """
+        :param retweeter_ids: the users that retweeted every tweet
+        :param latency: seconds every request waits, like a network round trip
+        :param failure_rate: share of requests failing with a connection error
+        """
+        self.retweeter_ids = retweeter_ids
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+
+    def request(self, route: str, params: dict) -> FakeTwitterResponse:
+        """Answer one request like TwitterAPI.request"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.__lock:
+            self.requests += 1
+            failed = self.__random.random() < self.failure_rate
+            self.failures += failed
+        if failed:
+            raise ConnectionError('fake connection error')
+        if route.startswith('statuses/retweets/:'):
+            tweet_id = route.split(':')[-1]
+            retweets = []
+            for uid in self.retweeter_ids[:100]:
+                retweet = fake_tweet('%s%s' % (tweet_id, uid), uid)
+                retweet['retweeted_status'] = fake_tweet(tweet_id, self.retweeter_ids[0])
+                retweets.append(retweet)
+            return FakeTwitterResponse(retweets)
+        if route == 'statuses/retweeters/ids':
+            start = max(int(params['cursor']), 0)
+            end = start + int(params['count'])
+            return FakeTwitterResponse({
+                'ids': self.retweeter_ids[start:end],
+                'next_cursor': end if end < len(self.retweeter_ids) else 0})
+        if route == 'users/lookup':
+            return FakeTwitterResponse([fake_user(uid)
+                                        for uid in params['user_id'].split(',')])
+        if route == 'statuses/lookup':
+            return FakeTwitterResponse([fake_tweet(tweet_id, self.retweeter_ids[0])
+                                        for tweet_id in params['id'].split(',')])
+        return FakeTwitterResponse({'errors': [{'code': 34}]})
+
+
+class FakeToken:
+    """Token of a route, all tokens share the FakeTwitter of the process"""
+
+    twitter = None
+
+    def __init__(self, twitter_route: str, cleanup_last_session: bool = True):
+        self.twitter_route = twitter_route
+        self.lock = threading.RLock()
+        self.rate_limit = RateLimit()
+        self.api = FakeToken.twitter
+
+    def get_user_auth(self):
+        self.rate_limit = RateLimit()
+
+
+def install(twitter: FakeTwitter, retry_interval: float):
+    """
+    Make twitterApi request the fake twitter in this process. Responses
+    are not cached, so every request reaches it.
+    """
+    FakeToken.twitter = twitter
+    twitterApi.Token = FakeToken
+    twitterApi.RETRY_INTERVAL = retry_interval
+    lookupCache.ROUTE_TTLS.clear()
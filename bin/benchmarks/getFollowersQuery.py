@@ -0,0 +1,90 @@
+"""
+Compares the old string concatenated get_followers query with the
+parameterized UNWIND query at different numbers of uids.
+Needs a running neo4j filled by the crawler, run it from the project root:
+python bin/benchmarks/getFollowersQuery.py
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import api.neo4j.connectionManager as connectionManager
+from api.neo4j.neo4jApi import FOLLOWERS_QUERY
+
+SIZES = [100, 1000, 5000]
+REPETITIONS = 5
+
+
+def build_legacy_query(user_ids):
+    """Build the query the way get_followers did before the UNWIND rewrite"""
+    database_query = ''
+    first_iteration = True
+    for uid in user_ids:
+        if first_iteration:
+            database_query += 'MATCH (u:USER) WHERE u.uid = "' + uid + '" '
+            first_iteration = False
+            continue
+        database_query += 'OR u.uid = "' + uid + '" '
+    database_query += 'WITH COLLECT(u) AS us UNWIND us AS u1 UNWIND us AS u2 '
+    database_query += 'MATCH (u1)-[r]->(u2) RETURN COLLECT(r), us;'
+    return database_query
+
+
+def legacy_edges(database_response):
+    """Turn the legacy response into a set of (start_uid, end_uid) tuples"""
+    if database_response == []:
+        return set()
+    lookup = {}
+    for node in database_response[0]['us']:
+        lookup[node.id] = node.properties['uid']
+    return set((lookup[relation.start], lookup[relation.end])
+               for relation in database_response[0]['COLLECT(r)'])
+
+
+def sample_user_ids(size):
+    """Take followers of crawled users, so the sample contains relations"""
+    query = "MATCH (f:USER)-[:FOLLOWS]->(:USER:PRIORITY3) "
+    query += "RETURN DISTINCT f.uid AS uid LIMIT $size"
+    with connectionManager.session() as session:
+        return [row['uid'] for row in session.run(query, {'size': size}).data()]
+
+
+def run_timed(query, parameters):
+    """Run the query REPETITIONS times and return the best time and response"""
+    best_time = None
+    response = None
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        with connectionManager.session() as session:
+            with session.begin_transaction() as transaction:
+                response = transaction.run(query, parameters).data()
+        elapsed = time.perf_counter() - start
+        if best_time is None or elapsed < best_time:
+            best_time = elapsed
+    return best_time, response
+
+
+if __name__ == '__main__':
+    print("%6s | %-9s | %12s | %10s | %8s" %
+          ("uids", "query", "query bytes", "best (ms)", "edges"))
+    for size in SIZES:
+        user_ids = sample_user_ids(size)
+        legacy_query = build_legacy_query(user_ids)
+        legacy_time, legacy_response = run_timed(legacy_query, {})
+        old_edges = legacy_edges(legacy_response)
+        uids = sorted(set(user_ids))
+        parameters = {'start_uids': uids, 'end_uids': uids}
+        unwind_time, unwind_response = run_timed(FOLLOWERS_QUERY, parameters)
+        new_edges = set((row['start_uid'], row['end_uid'])
+                        for row in unwind_response)
+        print("%6s | %-9s | %12s | %10.1f | %8s" %
+              (len(user_ids), "legacy", len(legacy_query.encode()),
+               legacy_time * 1000, len(old_edges)))
+        print("%6s | %-9s | %12s | %10.1f | %8s" %
+              (len(user_ids), "unwind",
+               len(FOLLOWERS_QUERY.encode()) + len(str(user_ids).encode()),
+               unwind_time * 1000, len(new_edges)))
+        if old_edges != new_edges:
+            print("WARNING: both queries returned different relations!")
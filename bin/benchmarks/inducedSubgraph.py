@@ -0,0 +1,168 @@
+"""
+Benchmarks the numpy induced subgraph engine on synthetic follower graphs
+against a plain python loop over the same arrays and, with --neo4j, against
+the cypher query of get_followers. The sparse graph has few relations among
+the sampled users, in the dense one they follow a large share of each
+other. Users and relations given on the command line replace both graphs.
+The --neo4j mode writes each synthetic graph into the configured database
+and deletes it afterwards, only use it with a development database. Run it
+from the project root:
+python bin/benchmarks/inducedSubgraph.py [users] [relations] [--neo4j]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from api.neo4j.subgraphEngine import induced_subgraph
+
+SIZES = [100, 1000, 5000]
+#: name, users and relations of the default graphs
+GRAPHS = [('sparse', 1000000, 5000000), ('dense', 20000, 5000000)]
+REPETITIONS = 3
+#: synthetic uids are far above real twitter ids
+UID_BASE = 9 * 10 ** 18
+UID_PREFIX = str(UID_BASE)[:8]
+BATCH_SIZE = 10000
+
+
+def build_graph(num_users: int, num_relations: int, seed: int = 42):
+    """
+    Build a random graph with a heavy tailed follower distribution
+    in compressed sparse row form.
+    """
+    random = np.random.RandomState(seed)
+    uids = UID_BASE + np.arange(num_users, dtype=np.int64)
+    weights = random.pareto(1.2, num_users) + 1
+    counts = (weights / weights.sum() * num_relations).astype(np.int64)
+    ends = np.repeat(np.arange(num_users, dtype=np.int64), counts)
+    starts = random.randint(0, num_users, len(ends)).astype(np.int64)
+    # sorting the combined key orders by user and follower and drops duplicates
+    keys = np.unique(ends * num_users + starts)
+    ends = keys // num_users
+    followers = (keys % num_users).astype(np.int32)
+    offsets = np.zeros(num_users + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ends, minlength=num_users), out=offsets[1:])
+    return uids, offsets, followers
+
+
+def sample_retweeters(uids, offsets, size, seed=7):
+    """Take users among the most followed ones, so they share relations"""
+    random = np.random.RandomState(seed)
+    counts = np.diff(offsets)
+    popular = np.argsort(counts)[-size:]
+    return [str(uid) for uid in uids[random.choice(popular, size, replace=False)]]
+
+
+def python_subgraph(uid_strings, index_lookup, offsets, followers, user_ids):
+    """Per relation python loop, like get_followers builds its response"""
+    wanted = set(index_lookup[uid] for uid in user_ids)
+    result = {}
+    for index in wanted:
+        for follower in followers[offsets[index]:offsets[index + 1]].tolist():
+            if follower in wanted:
+                result.setdefault(uid_strings[index], []).append(
+                    uid_strings[follower])
+    return result
+
+
+def neo4j_subgraph(user_ids):
+    from api.neo4j.neo4jApi import FOLLOWERS_QUERY
+    import api.neo4j.connectionManager as connectionManager
+    result = {}
+    with connectionManager.session() as session:
+        for row in session.run(FOLLOWERS_QUERY, {'start_uids': user_ids,
+                                                 'end_uids': user_ids}):
+            result.setdefault(row['end_uid'], []).append(row['start_uid'])
+    return result
+
+
+def load_into_neo4j(uids, offsets, followers):
+    import api.neo4j.connectionManager as connectionManager
+    uid_strings = [str(uid) for uid in uids.tolist()]
+    with connectionManager.session() as session:
+        for start in range(0, len(uid_strings), BATCH_SIZE):
+            session.run('UNWIND $uids AS uid CREATE (:USER {uid: uid})',
+                        {'uids': uid_strings[start:start + BATCH_SIZE]})
+        pairs = []
+        for index in range(len(uids)):
+            for follower in followers[offsets[index]:offsets[index + 1]].tolist():
+                pairs.append([uid_strings[follower], uid_strings[index]])
+                if len(pairs) == BATCH_SIZE:
+                    session.run('UNWIND $pairs AS pair '
+                                'MATCH (f:USER {uid: pair[0]}), (u:USER {uid: pair[1]}) '
+                                'CREATE (f)-[:FOLLOWS]->(u)', {'pairs': pairs})
+                    pairs = []
+        if pairs:
+            session.run('UNWIND $pairs AS pair '
+                        'MATCH (f:USER {uid: pair[0]}), (u:USER {uid: pair[1]}) '
+                        'CREATE (f)-[:FOLLOWS]->(u)', {'pairs': pairs})
+
+
+def delete_from_neo4j():
+    import api.neo4j.connectionManager as connectionManager
+    query = 'MATCH (u:USER) WHERE u.uid STARTS WITH $prefix '
+    query += 'WITH u LIMIT %s DETACH DELETE u RETURN COUNT(*) AS deleted' % BATCH_SIZE
+    with connectionManager.session() as session:
+        while session.run(query, {'prefix': UID_PREFIX}).data()[0]['deleted']:
+            continue
+
+
+def best_time(function, *arguments):
+    best = None
+    result = None
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        result = function(*arguments)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_graph(name: str, num_users: int, num_relations: int, use_neo4j: bool):
+    uids, offsets, followers = build_graph(num_users, num_relations)
+    print("%s graph: %s users, %s relations" % (name, len(uids), len(followers)))
+    uid_strings = [str(uid) for uid in uids.tolist()]
+    index_lookup = {uid: index for index, uid in enumerate(uid_strings)}
+    if use_neo4j:
+        load_into_neo4j(uids, offsets, followers)
+    try:
+        print("%-6s | %6s | %-6s | %10s | %9s" %
+              ("graph", "uids", "engine", "best (ms)", "relations"))
+        for size in SIZES:
+            user_ids = sample_retweeters(uids, offsets, size)
+            engines = [
+                ('numpy', lambda: induced_subgraph(uids, offsets, followers,
+                                                   user_ids, user_ids)),
+                ('python', lambda: python_subgraph(uid_strings, index_lookup,
+                                                   offsets, followers, user_ids))
+            ]
+            if use_neo4j:
+                engines.append(('neo4j', lambda: neo4j_subgraph(user_ids)))
+            expected = None
+            for engine_name, engine in engines:
+                elapsed, result = best_time(engine)
+                relations = sum(len(value) for value in result.values())
+                print("%-6s | %6s | %-6s | %10.1f | %9s" %
+                      (name, size, engine_name, elapsed * 1000, relations))
+                normalized = {key: sorted(value) for key, value in result.items()}
+                if expected is None:
+                    expected = normalized
+                elif normalized != expected:
+                    print("WARNING: %s returned a different subgraph!" % engine_name)
+    finally:
+        if use_neo4j:
+            delete_from_neo4j()
+
+
+if __name__ == '__main__':
+    arguments = [argument for argument in sys.argv[1:] if argument != '--neo4j']
+    graphs = GRAPHS
+    if arguments:
+        graphs = [('custom', int(arguments[0]),
+                   int(arguments[1]) if len(arguments) > 1 else 5000000)]
+    for graph in graphs:
+        run_graph(*graph, use_neo4j='--neo4j' in sys.argv)
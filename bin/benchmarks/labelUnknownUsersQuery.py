@@ -0,0 +1,99 @@
+"""
+Compares the old three query label_unknown_users with the single
+parameterized query for 5k uids. Every run happens in a transaction that
+is rolled back, so no user gets queued for crawling.
+Needs a running neo4j filled by the crawler, run it from the project root:
+python bin/benchmarks/labelUnknownUsersQuery.py
+"""
+import math
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import api.neo4j.connectionManager as connectionManager
+from api.neo4j.neo4jApi import LABEL_UNKNOWN_USERS_QUERY
+
+SIZE = 5000
+REPETITIONS = 5
+
+
+def build_legacy_queries(user_ids, outdated):
+    """Build the three queries label_unknown_users ran before"""
+    query = "WITH %s AS USERS " % user_ids
+    query += "FOREACH (U IN USERS | MERGE (X:USER{uid:U}) "
+    query += "FOREACH (ignoreMe in CASE WHEN (X:PRIORITY2 OR "
+    query += "(X:PRIORITY3 AND X.timestamp < %s) OR " % outdated
+    query += "LABELS(X)=['USER']) "
+    query += "THEN [1] ELSE [] END | "
+    query += "SET X:PRIORITY1 REMOVE X:PRIORITY2, X:PRIORITY3))"
+
+    query2 = "WITH %s AS USERS " % user_ids
+    query2 += "MATCH (u:PRIORITY1) "
+    query2 += "WHERE u.uid IN USERS "
+    query2 += "RETURN COLLECT(u.uid) as uncrawled"
+
+    query3 = "WITH %s AS USERS " % user_ids
+    query3 += "MATCH (u:QUEUED) "
+    query3 += "WHERE u.uid IN USERS "
+    query3 += "RETURN COLLECT(u.uid) as unwritten"
+    return [query, query2, query3]
+
+
+def sample_user_ids(size):
+    """Take existing users and add some unknown ones"""
+    query = "MATCH (u:USER) RETURN u.uid AS uid LIMIT $size"
+    with connectionManager.session() as session:
+        user_ids = [row['uid'] for row in
+                    session.run(query, {'size': size - size // 10}).data()]
+    return user_ids + ["benchmark%s" % index for index in range(size // 10)]
+
+
+def run_rolled_back(statements):
+    """
+    Run the (query, parameters) statements in one transaction and roll
+    it back afterwards.
+    :returns: the best time over REPETITIONS runs and the last responses
+    """
+    best_time = None
+    responses = []
+    for _ in range(REPETITIONS):
+        responses = []
+        start = time.perf_counter()
+        with connectionManager.session() as session:
+            transaction = session.begin_transaction()
+            for query, parameters in statements:
+                responses.append(transaction.run(query, parameters).data())
+            elapsed = time.perf_counter() - start
+            transaction.success = False
+            transaction.close()
+        if best_time is None or elapsed < best_time:
+            best_time = elapsed
+    return best_time, responses
+
+
+if __name__ == '__main__':
+    user_ids = sample_user_ids(SIZE)
+    outdated = math.floor(time.time()) - 60 * 60 * 24 * 90
+    legacy_queries = build_legacy_queries(user_ids, outdated)
+    legacy_time, legacy_responses = run_rolled_back(
+        [(query, {}) for query in legacy_queries])
+    parameters = {'uids': sorted(set(user_ids)), 'outdated': outdated}
+    single_time, single_responses = run_rolled_back(
+        [(LABEL_UNKNOWN_USERS_QUERY, parameters)])
+
+    print("%6s | %-7s | %7s | %12s | %10s" %
+          ("uids", "query", "queries", "query bytes", "best (ms)"))
+    print("%6s | %-7s | %7s | %12s | %10.1f" %
+          (len(user_ids), "legacy", len(legacy_queries),
+           sum(len(query.encode()) for query in legacy_queries),
+           legacy_time * 1000))
+    print("%6s | %-7s | %7s | %12s | %10.1f" %
+          (len(user_ids), "single", 1,
+           len(LABEL_UNKNOWN_USERS_QUERY.encode()) +
+           len(str(user_ids).encode()), single_time * 1000))
+    legacy_uncrawled = set(legacy_responses[1][0]['uncrawled'])
+    single_uncrawled = set(single_responses[0][0]['uncrawled'])
+    if legacy_uncrawled != single_uncrawled:
+        print("WARNING: both versions labeled different users!")
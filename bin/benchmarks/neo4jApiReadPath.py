@@ -0,0 +1,105 @@
+"""
+Offline benchmark of neo4jApi with a local stand in for the neo4j driver.
+Measures statements, bytes sent and received, python cpu time and peak
+memory of get_followers, get_user_info, add_user_info and
+label_unknown_users at several input sizes, next to the bulk functions
+get_users_info and add_user_info_bulk the wrappers build on. get_user_info
+takes one user, it is called once per user of the size. Run it from the
+project root:
+python bin/benchmarks/neo4jApiReadPath.py [--latency ms] [--graph recorded.json]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+# the benchmark measures the queries, not a snapshot lying around
+os.environ['FOLLOWER_SNAPSHOT_DIR'] = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), 'no-snapshot')
+
+import api.neo4j.connectionManager as connectionManager
+import api.neo4j.neo4jApi as neo4jApi
+from fakeNeo4jDriver import FakeDriver, FakeGraph
+
+SIZES = [100, 1000, 5000]
+
+
+def measure(driver: FakeDriver, function, *arguments) -> dict:
+    """Run function once and return its counters"""
+    neo4jApi.follower_cache.clear()
+    driver.reset_counters()
+    tracemalloc.start()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    function(*arguments)
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start - driver.driver_cpu_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'statements': driver.statements,
+        'bytes_sent': driver.bytes_sent,
+        'bytes_received': driver.bytes_received,
+        'cpu_ms': cpu_time * 1000,
+        'wall_ms': wall_time * 1000,
+        'peak_kib': peak_memory / 1024
+    }
+
+
+def get_user_info_each(user_ids: list):
+    """One get_user_info call per user, like callers holding single users"""
+    for user_id in user_ids:
+        neo4jApi.get_user_info(user_id)
+
+
+def user_info_response(user_ids: list) -> dict:
+    """A TwitterApi.get_user_info like response for the given users"""
+    return {'response': {uid: {
+        'timestamp': str(time.time()),
+        'name': 'name %s' % uid,
+        'screen_name': 'screen_name_%s' % uid,
+        'followers_count': 1
+    } for uid in user_ids}}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=1.0,
+                        help='milliseconds per statement')
+    parser.add_argument('--graph', help='json file with a recorded graph')
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--followers', type=int, default=200,
+                        help='followers per generated user')
+    arguments = parser.parse_args()
+
+    if arguments.graph:
+        graph = FakeGraph.load(arguments.graph)
+    else:
+        graph = FakeGraph.generate(arguments.users, arguments.followers)
+    driver = FakeDriver(graph, arguments.latency / 1000)
+    connectionManager.set_driver(driver)
+    uids = sorted(graph.users)
+
+    print("%-20s | %5s | %5s | %10s | %10s | %8s | %8s | %9s" % (
+        "function", "size", "stmts", "sent", "received",
+        "cpu ms", "wall ms", "peak KiB"))
+    for size in SIZES:
+        user_ids = uids[:size]
+        benchmarks = [
+            ('get_followers', neo4jApi.get_followers, user_ids),
+            ('get_user_info', get_user_info_each, user_ids),
+            ('get_users_info', neo4jApi.get_users_info, user_ids),
+            ('add_user_info', neo4jApi.add_user_info,
+             user_info_response(user_ids)),
+            ('add_user_info_bulk', neo4jApi.add_user_info_bulk,
+             user_info_response(user_ids)),
+            ('label_unknown_users', neo4jApi.label_unknown_users, user_ids)
+        ]
+        for name, function, argument in benchmarks:
+            result = measure(driver, function, argument)
+            print("%-20s | %5s | %5s | %10s | %10s | %8.1f | %8.1f | %9.1f" % (
+                name, size, result['statements'], result['bytes_sent'],
+                result['bytes_received'], result['cpu_ms'], result['wall_ms'],
+                result['peak_kib']))
@@ -0,0 +1,15 @@
+"""
+Exports all FOLLOWS relations into a new memory mapped snapshot which
+the api uses for get_followers. Run it from the project root, e.g. daily:
+python bin/exportFollowerSnapshot.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import api.neo4j.followerSnapshot as followerSnapshot
+
+if __name__ == '__main__':
+    followerSnapshot.export_snapshot(
+        os.environ.get('FOLLOWER_SNAPSHOT_DIR', './snapshot'))
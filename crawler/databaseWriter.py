@@ -1,4 +1,5 @@
-from neo4j.v1 import GraphDatabase
+import api.neo4j.connectionManager as connectionManager
+import api.neo4j.followerCache as followerCache
 import os
 import time
 import math
@@ -10,30 +11,12 @@ class Writer:
         self.name = name
         self.__log_to_file(self.name + " is initialized.")
 
-        self.driver = self.__connect_to_db()
-
         self.write_q = write_q
 
         self.lock = lock
 
         self.run()
 
-    def __connect_to_db(self):
-        while True:
-            try:
-                driver = GraphDatabase.driver(
-                    os.environ.get('NEO4J_URI'), auth=(
-                        os.environ.get('NEO4J_USER'),
-                        os.environ.get('NEO4J_PASSWORD')
-                    )
-                )
-                self.__log_to_file(self.name + " connected to the database.\n\n\n")
-                return driver
-            except Exception as exc:
-                self.__log_to_file("0 - ERROR -> %s. Crawler could not connect to the database. Retrying in 5s..." % exc)
-                time.sleep(5)
-                continue
-
     def run(self):
         empty_state = True if self.write_q.empty() else False
         self.prio = False
@@ -109,13 +92,20 @@ class Writer:
         query += "SET a.timestamp=%s, a:PRIORITY3 " % timestamp
         query += "REMOVE a:QUEUED"
         self.__run_query(query)
+        followerCache.publish_followers_changed(user_id)
         self.__log_to_file("Updated user %s, label QUEUED erased -> num_followers: %s\n\n\n" % (user_id, num_followers))
 
     def __delete_user(self, user_id):
-        # delete invalid user and connections
+        # delete invalid user and connections, the users it followed
+        # lose a follower
         query = "MATCH (u:USER:QUEUED{uid:'%s'}) " % user_id
-        query += "DETACH DELETE u"
-        self.__run_query(query)
+        query += "OPTIONAL MATCH (u)-[:FOLLOWS]->(f:USER) "
+        query += "WITH u, COLLECT(f.uid) AS followed "
+        query += "DETACH DELETE u "
+        query += "RETURN followed"
+        data = self.__run_get_query(query).data()
+        followed = data[0]['followed'] if data else []
+        followerCache.publish_user_deleted(user_id, followed)
         self.__log_to_file("Deleted user %s\n\n\n" % user_id)
 
     def __delete_old_relations(self, user_id):
@@ -134,9 +124,9 @@ class Writer:
                 continue
 
     def __run_query(self, query):
-        with self.driver.session() as db:
-            while True:
-                try:
+        while True:
+            try:
+                with connectionManager.session(self.__log_to_file) as db:
                     if self.prio == False:
                         # if non prio user, check and wait until prio lock
                         # is not set and set lock for this batch
@@ -149,26 +139,27 @@ class Writer:
                         self.lock.release()
                     else:
                         db.run(query)
-                    break
-                except Exception as exc:
-                    e_name = type(exc).__name__
-                    if e_name == "TransientError":
-                        self.__log_to_file("8 - ERROR -> %s. DB data is locked. Retrying..." % e_name)
-                        self.__log_to_file(str(exc))
-                        time.sleep(2)
-                        continue
-                    elif e_name == "AddressError":
-                        self.driver = self.__connect_to_db()
-                    else:
-                        self.__log_to_file("9 - UNKNOWN ERROR -> %s." % e_name)
-                        self.__log_to_file(str(exc))
-                        time.sleep(2)
-                        continue
+                break
+            except Exception as exc:
+                e_name = type(exc).__name__
+                if e_name == "TransientError":
+                    self.__log_to_file("8 - ERROR -> %s. DB data is locked. Retrying..." % e_name)
+                    self.__log_to_file(str(exc))
+                    time.sleep(2)
+                    continue
+                elif e_name == "AddressError":
+                    connectionManager.reset_driver()
+                    continue
+                else:
+                    self.__log_to_file("9 - UNKNOWN ERROR -> %s." % e_name)
+                    self.__log_to_file(str(exc))
+                    time.sleep(2)
+                    continue
 
     def __run_get_query(self, query):
-        with self.driver.session() as db:
-            while True:
-                try:
+        while True:
+            try:
+                with connectionManager.session(self.__log_to_file) as db:
                     if self.prio == False:
                         # if non prio user, check and wait until prio lock
                         # is not set and set lock for this batch
@@ -181,27 +172,28 @@ class Writer:
                         self.lock.release()
                     else:
                         result = db.run(query)
-                    break
-                except Exception as exc:
-                    e_name = type(exc).__name__
-                    if e_name == "TransientError":
-                        self.__log_to_file("10 - ERROR -> %s. DB data is locked. Retrying..." % e_name)
-                        self.__log_to_file(str(exc))
-                        time.sleep(2)
-                        continue
-                    elif e_name == "AddressError":
-                        self.driver = self.__connect_to_db()
-                    else:
-                        self.__log_to_file("11 - UNKNOWN ERROR -> %s." % e_name)
-                        self.__log_to_file(str(exc))
-                        time.sleep(2)
-                        continue
-            try:
-                return result
+                break
             except Exception as exc:
                 e_name = type(exc).__name__
-                self.__log_to_file("11B - UNKNOWN ERROR -> %s. The value of result.data() is %s." % (e_name, result.data()))
-                self.__log_to_file(str(exc))
+                if e_name == "TransientError":
+                    self.__log_to_file("10 - ERROR -> %s. DB data is locked. Retrying..." % e_name)
+                    self.__log_to_file(str(exc))
+                    time.sleep(2)
+                    continue
+                elif e_name == "AddressError":
+                    connectionManager.reset_driver()
+                    continue
+                else:
+                    self.__log_to_file("11 - UNKNOWN ERROR -> %s." % e_name)
+                    self.__log_to_file(str(exc))
+                    time.sleep(2)
+                    continue
+        try:
+            return result
+        except Exception as exc:
+            e_name = type(exc).__name__
+            self.__log_to_file("11B - UNKNOWN ERROR -> %s. The value of result.data() is %s." % (e_name, result.data()))
+            self.__log_to_file(str(exc))
 
     def __log_to_file(self, message):
         now = time.strftime("[%a, %d %b %Y %H:%M:%S] ", time.localtime())
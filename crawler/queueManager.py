@@ -1,8 +1,12 @@
 import multiprocessing
-from neo4j.v1 import GraphDatabase
 import time
+import sys
 import os
 
+# the crawler shares the neo4j connection manager with the api package
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import api.neo4j.connectionManager as connectionManager
 from twitterCrawlers import Crawler
 from databaseWriter import Writer
 
@@ -19,7 +23,7 @@ def get_unfinished_users():
     token_query += "SET h:TOKEN REMOVE h:BUSYTOKEN"
 
     while True:
-        with driver.session() as db:
+        with connectionManager.session(__log_to_file) as db:
             try:
                 __log_to_file("Resetting old BUSYTOKEN")
                 db.run(token_query)
@@ -35,7 +39,7 @@ def get_unfinished_users():
     query += "RETURN COLLECT(a.uid) as user_ids"
 
     while True:
-        with driver.session() as db:
+        with connectionManager.session(__log_to_file) as db:
             try:
                 __log_to_file("Getting unfinished users")
                 results = db.run(query).data()[0]['user_ids']
@@ -68,7 +72,7 @@ def get_next_crawler_users(user_list, priority=1):
     query += "RETURN COLLECT(uids) as users "
 
     while True:
-        with driver.session() as db:
+        with connectionManager.session(__log_to_file) as db:
             try:
                 results = db.run(query).data()[0]['users']
                 break
@@ -136,23 +140,6 @@ def __log_to_file(message):
     print(now + message + '\n')
 
 
-def __connect_to_db():
-    while True:
-        try:
-            driver = GraphDatabase.driver(
-                os.environ.get('NEO4J_URI'), auth=(
-                    os.environ.get('NEO4J_USER'),
-                    os.environ.get('NEO4J_PASSWORD')
-                )
-            )
-            __log_to_file("Connected to the database.")
-            return driver
-        except Exception as exc:
-            __log_to_file("Exception: %s -> Database not up or wrong credentials! retrying in 5s..." % exc)
-            time.sleep(5)
-            continue
-
-
 if __name__ == '__main__':
 
     for log_file in os.listdir("log"):
@@ -170,7 +157,7 @@ if __name__ == '__main__':
     last_write_q = []
     last_prio_write_q = []
 
-    driver = __connect_to_db()
+    connectionManager.get_driver(__log_to_file)
 
     lock = multiprocessing.Lock()
     q = multiprocessing.Queue(queue_size)
@@ -1,5 +1,5 @@
-from neo4j.v1 import GraphDatabase
 from TwitterAPI import TwitterAPI
+import api.neo4j.connectionManager as connectionManager
 import json
 import os
 import time
@@ -17,31 +17,12 @@ class Crawler:
         self.languages = ["de", "en"]
         self.__log_to_file(self.name + " is initialized.")
 
-        self.driver = self.__connect_to_db()
-
         self.app_token = os.environ.get('APP_TOKEN')
         self.app_secret = os.environ.get('APP_SECRET')
 
         self.__get_user_auth()
         self.run()
 
-    def __connect_to_db(self):
-        while True:
-            try:
-                driver = GraphDatabase.driver(
-                    os.environ.get('NEO4J_URI'), auth=(
-                        os.environ.get('NEO4J_USER'),
-                        os.environ.get('NEO4J_PASSWORD')
-                    )
-                )
-                self.__log_to_file(self.name + " connected to the database.")
-                return driver
-            except Exception as exc:
-                self.__log_to_file(
-                    "0 - ERROR -> %s. Crawler could not connect to the database. Retrying in 5s..." % exc)
-                time.sleep(5)
-                continue
-
     def run(self):
         while True:
             user_id = self.q.get()
@@ -191,25 +172,26 @@ class Crawler:
                 return error_response
 
     def __run_query(self, query):
-        with self.driver.session() as db:
-            while True:
-                try:
+        while True:
+            try:
+                with connectionManager.session(self.__log_to_file) as db:
                     db.run(query)
-                    break
-                except Exception as exc:
-                    e_name = type(exc).__name__
-                    if e_name == "TransientError":
-                        self.__log_to_file(
-                            "8 - ERROR -> %s. DB data is locked. Retrying..." % e_name)
-                        self.__log_to_file(str(exc))
-                        time.sleep(2)
-                        continue
-                    elif e_name == "AddressError":
-                        self.driver = self.__connect_to_db()
-                    else:
-                        self.__log_to_file("9 - UNKNOWN ERROR -> %s." % e_name)
-                        time.sleep(2)
-                        continue
+                break
+            except Exception as exc:
+                e_name = type(exc).__name__
+                if e_name == "TransientError":
+                    self.__log_to_file(
+                        "8 - ERROR -> %s. DB data is locked. Retrying..." % e_name)
+                    self.__log_to_file(str(exc))
+                    time.sleep(2)
+                    continue
+                elif e_name == "AddressError":
+                    connectionManager.reset_driver()
+                    continue
+                else:
+                    self.__log_to_file("9 - UNKNOWN ERROR -> %s." % e_name)
+                    time.sleep(2)
+                    continue
 
     @staticmethod
     def __check_twitter_error_code(code):
@@ -242,7 +224,7 @@ class Crawler:
             query += "RETURN h.token as token, "
             query += "h.secret as secret, "
             query += "h.user as user"
-            with self.driver.session() as db:
+            with connectionManager.session(self.__log_to_file) as db:
                 results = db.run(query)
                 for user in results:
                     user_token = user["token"]
@@ -1,10 +1,17 @@
-from flask import Flask, jsonify, request, Response
+from flask import Flask, g, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 from deprecated import deprecated
+import hashlib
+import time
 
 from elasticapm.contrib.flask import ElasticAPM
 
+import api.encoding.compactEncoding as compactEncoding
+import api.metrics.prometheusMetrics as prometheusMetrics
+import api.neo4j.connectionManager as connectionManager
 import api.neo4j.neo4jApi as neo4jApi
+import api.trace.traceApi as traceApi
+import api.trace.traceJobs as traceJobs
 import api.user.newsletterModule as newsletterModule
 import api.user.userManager as userManager
 import api.logging.logger as logger
@@ -14,11 +21,40 @@ twitterApi = TracemapTwitterApi()
 
 app = Flask(__name__)
 # apm = ElasticAPM(app, logging=True)
-cors = CORS(app, resources={r"/*": {"origins": "*"}})
+cors = CORS(app, resources={r"/*": {"origins": "*"}},
+            expose_headers=["ETag", "X-Followers-Version"])
 
 def __is_session_valid(email: str, session_token: str) -> bool:
     return userManager.check_session(email, session_token)
 
+def __is_not_modified(etag: str) -> bool:
+    """Tell if the client sent the ETag of the response in If-None-Match"""
+    return bool(etag) and request.if_none_match.contains_weak(etag)
+
+def __is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def __is_string_list(value) -> bool:
+    """Strings are iterable too, a single one is no list of uids"""
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    prometheusMetrics.REQUEST_DURATION.labels(
+        request.endpoint or 'unmatched', request.method, response.status_code
+    ).observe(time.perf_counter() - g.request_start)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Returns the metrics of all workers in the prometheus text format"""
+    payload, content_type = prometheusMetrics.generate()
+    return Response(payload, content_type=content_type)
+
 @app.route('/status')
 def health_check():
     """Request health status of the api"""
@@ -43,11 +79,33 @@ def twitter_get_tweet_info():
     else:
         return Response("Bad Request", status=400)
 
+@app.route('/twitter/get_tweets_info', methods = ['POST'])
+def twitter_get_tweets_info():
+    """
+    Takes a list of tweet_ids and returns the shortform
+    of twitter_get_tweet_data for every found tweet
+    """
+    body = request.get_json()
+    if body and all (keys in body for keys in 
+    ("session_token","email", "tweet_ids")):
+        session_token = body['session_token']
+        email = body['email']
+        tweet_ids = body['tweet_ids']
+        if __is_session_valid(email, session_token):
+            return jsonify(twitterApi.get_tweets_info(tweet_ids))
+        else:
+            return Response("Forbidden", status=403)
+    else:
+        return Response("Bad Request", status=400)
+
 @app.route('/twitter/get_tweet_data', methods = ['POST'])
 def twitter_get_tweet_data():
     """
     Returns data of a tweet to get the detailed
     tweet data (retweeter_ids etc.)
+    Clients accepting application/x-msgpack get the compact columnar encoding,
+    clients accepting application/x-ndjson get the retweeters streamed
+    page by page as lines of TracemapTwitterApi.iter_tweet_data
     """
     body = request.get_json()
     if body and all (keys in body for keys in 
@@ -56,7 +114,15 @@ def twitter_get_tweet_data():
         email = body['email']
         tweet_id = body['tweet_id']
         if __is_session_valid(email, session_token):
-            return jsonify(twitterApi.get_tweet_data(tweet_id))
+            if request.accept_mimetypes.best == 'application/x-ndjson':
+                return Response(
+                    stream_with_context(twitterApi.stream_tweet_data(tweet_id)),
+                    mimetype='application/x-ndjson')
+            tweet_data = twitterApi.get_tweet_data(tweet_id)
+            if request.accept_mimetypes.best == compactEncoding.MIMETYPE:
+                return Response(compactEncoding.encode_tweet_data(tweet_data),
+                                mimetype=compactEncoding.MIMETYPE)
+            return jsonify(tweet_data)
         else:
             return Response("Forbidden", status=403)
     else:
@@ -86,7 +152,8 @@ def twitter_get_user_timeline():
 def twitter_get_user_info():
     """
     Takes a comma seperated list of user_ids
-    returns a user_info json object
+    returns a user_info json object, suspended or
+    deleted users are listed under missing
     """
     body = request.get_json()
     if body and all (keys in body for keys in 
@@ -101,11 +168,150 @@ def twitter_get_user_info():
     else:
         return Response("Bad Request", status=400)
 
+@app.route('/trace', methods = ['POST'])
+def trace():
+    """
+    Takes a tweet_id and returns the tweet data, the labelled users,
+    the follower subnetwork and the user info of its retweeters in one
+    response together with the duration of every stage in ms
+    """
+    body = request.get_json()
+    if body and all (keys in body for keys in 
+    ("session_token","email", "tweet_id")):
+        session_token = body['session_token']
+        email = body['email']
+        tweet_id = body['tweet_id']
+        if __is_session_valid(email, session_token):
+            return jsonify(traceApi.get_trace(twitterApi, tweet_id))
+        else:
+            return Response("Forbidden", status=403)
+    else:
+        return Response("Bad Request", status=400)
+
+@app.route('/trace/submit_job', methods = ['POST'])
+def trace_submit_job():
+    """
+    Takes a tweet_id and starts tracing it in the background.
+    Returns the job_id to poll and fetch the trace with
+    """
+    body = request.get_json()
+    if body and all (keys in body for keys in 
+    ("session_token","email", "tweet_id")):
+        session_token = body['session_token']
+        email = body['email']
+        tweet_id = body['tweet_id']
+        if __is_session_valid(email, session_token):
+            return jsonify(traceJobs.submit_job(twitterApi, email, tweet_id))
+        else:
+            return Response("Forbidden", status=403)
+    else:
+        return Response("Bad Request", status=400)
+
+@app.route('/trace/get_job_status', methods = ['POST'])
+def trace_get_job_status():
+    """
+    Takes a job_id and returns the status, the version and
+    the users waiting for the crawler of a trace job
+    """
+    return __get_trace_job(include_result=False)
+
+@app.route('/trace/get_job_result', methods = ['POST'])
+def trace_get_job_result():
+    """
+    Takes a job_id and returns the job with the stages of
+    the trace that are finished so far
+    """
+    return __get_trace_job(include_result=True)
+
+def __get_trace_job(include_result: bool):
+    body = request.get_json()
+    if body and all (keys in body for keys in 
+    ("session_token","email", "job_id")):
+        session_token = body['session_token']
+        email = body['email']
+        job_id = body['job_id']
+        if __is_session_valid(email, session_token):
+            job = traceJobs.get_job(job_id, email, include_result)
+            if job is None:
+                return Response("Not Found", status=404)
+            return jsonify(job)
+        else:
+            return Response("Forbidden", status=403)
+    else:
+        return Response("Bad Request", status=400)
+
+@app.route('/twitter/pool_status')
+def twitter_pool_status():
+    """
+    Returns the tokens, requests in flight and waiting and
+    the wait times of the token pools of the answering worker
+    """
+    return jsonify(twitterApi.get_pool_stats())
+
+@app.route('/twitter/cache_status')
+def twitter_cache_status():
+    """
+    Returns hits, misses and the size of the twitter response
+    cache of the answering worker
+    """
+    return jsonify(twitterApi.get_cache_stats())
+
 @app.route('/neo4j/get_followers', methods = ['POST'])
 def neo4j_get_followers():
     """
     Takes a comma seperated list of user_ids and returns the subnetwork of followship
-    relations between those users
+    relations between those users.
+    Clients accepting application/x-ndjson get the relations streamed as
+    [follower, user] lines or, with group_by_user, as {user: [followers]} lines,
+    clients accepting application/x-msgpack get the compact columnar encoding.
+    The X-Followers-Version header can be sent back as since_version to only
+    get the users written since, an unchanged subgraph is answered with 304
+    Not Modified for the ETag in If-None-Match
+    """
+    body = request.get_json()
+    if body and all (keys in body for keys in 
+    ("session_token","email", "user_ids")):
+        session_token = body['session_token']
+        email = body['email']
+        user_ids = body['user_ids']
+        if __is_session_valid(email, session_token):
+            if request.accept_mimetypes.best == 'application/x-ndjson':
+                group_by_user = bool(body.get('group_by_user'))
+                stream = neo4jApi.stream_followers(user_ids, group_by_user)
+                return Response(stream_with_context(stream),
+                                mimetype='application/x-ndjson')
+            since_version = body.get('since_version')
+            if since_version is not None and not __is_number(since_version):
+                return Response("Bad Request", status=400)
+            version = neo4jApi.get_followers_version(user_ids, since_version)
+            if __is_not_modified(version['etag']):
+                response = Response(status=304)
+            else:
+                if since_version is None:
+                    followers = neo4jApi.get_followers(user_ids)
+                else:
+                    followers = neo4jApi.get_followers_since(
+                        user_ids, since_version, version['timestamps'])
+                if request.accept_mimetypes.best == compactEncoding.MIMETYPE:
+                    response = Response(compactEncoding.encode_followers(followers),
+                                        mimetype=compactEncoding.MIMETYPE)
+                else:
+                    response = jsonify(followers)
+            response.headers['X-Followers-Version'] = str(version['version'])
+            if version['etag']:
+                response.set_etag(version['etag'], weak=True)
+            return response
+        else:
+            return Response("Forbidden", status=403)
+    else:
+        return Response("Bad Request", status=400)
+
+@app.route('/neo4j/get_user_info', methods = ['POST'])
+def neo4j_get_user_info():
+    """
+    Takes a list of user_ids and returns the saved user info of every
+    user found in the database. An optional list of properties limits
+    the returned properties
     """
     body = request.get_json()
     if body and all (keys in body for keys in 
@@ -113,13 +319,36 @@ def neo4j_get_followers():
         session_token = body['session_token']
         email = body['email']
         user_ids = body['user_ids']
+        properties = body.get('properties')
         if __is_session_valid(email, session_token):
-            return jsonify(neo4jApi.get_followers(user_ids))
+            if not __is_string_list(user_ids) or \
+                    (properties is not None and not __is_string_list(properties)):
+                return Response("Bad Request", status=400)
+            return jsonify(neo4jApi.get_users_info(user_ids, properties))
         else:
             return Response("Forbidden", status=403)
     else:
         return Response("Bad Request", status=400)
 
+@app.route('/neo4j/cache_status')
+def neo4j_cache_status():
+    """
+    Returns hit ratio and memory use of the follower cache
+    and the state of the follower snapshot
+    """
+    return jsonify({
+        'follower_cache': neo4jApi.follower_cache.get_stats(),
+        'follower_snapshot': neo4jApi.follower_snapshot.get_stats()
+    })
+
+@app.route('/neo4j/pool_status')
+def neo4j_pool_status():
+    """
+    Returns the pool size, the sessions in use and the
+    session wait times of the answering worker
+    """
+    return jsonify(connectionManager.get_pool_metrics())
+
 @app.route('/neo4j/label_unknown_users', methods = ['POST'])
 def neo4j_label_unknown_users():
     body = request.get_json()
@@ -129,7 +358,12 @@ def neo4j_label_unknown_users():
         email = body['email']
         user_ids = body['user_ids']
         if __is_session_valid(email, session_token):
-            return jsonify(neo4jApi.label_unknown_users(user_ids))
+            response = jsonify(neo4jApi.label_unknown_users(user_ids))
+            etag = hashlib.sha1(response.get_data()).hexdigest()
+            if __is_not_modified(etag):
+                response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
         else:
             return Response("Forbidden", status=403)
     else:
@@ -217,7 +451,7 @@ def auth_check_session():
     ("session_token","email")):
         email = body['email']
         session_token = body['session_token']
-        if jsonify(__is_session_valid(email, session_token)):
+        if __is_session_valid(email, session_token):
             return jsonify(True)
         else:
             return Response("Forbidden", status=403)
@@ -239,25 +473,40 @@ def auth_reset_password(email: str, reset_token: str):
     
 @app.route('/logging/write_log', methods = ['POST'])
 def logging_write_log():
+    """
+    Takes a log_object or a list of log_objects and queues them to be
+    appended to the log file file_name. Returns how many were accepted
+    and how many were dropped because the buffer was full
+    """
     required_parameters = (
         "email",
         "session_token",
-        "file_name",
-        "log_object")
+        "file_name")
     body = request.get_json()
-    if body and all (key in body for key in required_parameters):
+    if body and all (key in body for key in required_parameters) and \
+            ("log_object" in body or "log_objects" in body):
         email = body["email"]
         session_token = body["session_token"]
         if __is_session_valid(email, session_token):
-            log_object = body["log_object"]
+            log_objects = body.get("log_objects", [body.get("log_object")])
             file_name = body["file_name"]
-            log_object['email'] = email
-            return jsonify(logger.save_log(log_object, file_name))
+            if not logger.is_valid_file_name(file_name) or \
+                    not isinstance(log_objects, list) or \
+                    not all(isinstance(log_object, dict) for log_object in log_objects):
+                return Response("Bad Request", status=400)
+            for log_object in log_objects:
+                log_object['email'] = email
+            return jsonify(logger.save_logs(log_objects, file_name))
         else:
             return Response("Forbidden", status=403)
     else:
         return Response("Bad Request", status=400)
 
+@app.route('/logging/status')
+def logging_status():
+    """Returns the counters of the log buffer of the answering worker"""
+    return jsonify(logger.log_writer.get_stats())
+
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", debug=True)